@@ -1,12 +1,20 @@
 """Main agent that orchestrates all memory systems."""
 
+import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 import config
 from memory.working import WorkingMemory
-from memory.semantic import SemanticMemory
+from memory.semantic import RETRIEVAL_HEADER, SemanticMemory
 from memory.episodic import EpisodicMemory
 from memory.procedural import ProceduralMemory
+from memory.budget import allocate, estimate_tokens
 from memory.consolidation import Consolidation
+from memory.scheduler import ConsolidationScheduler
+from memory.answer_cache import answer_key
+from memory.llm import as_gateway, task_params
+from memory.tracing import tracer
 
 # Patterns for query classification (compiled once)
 _PERSONAL_PATTERNS = re.compile(
@@ -23,6 +31,56 @@ _BEHAVIORAL_PATTERNS = re.compile(
     re.IGNORECASE,
 )
 
+# Memory systems activated per retrieval route
+ROUTES = {
+    "personal": {"semantic": False, "episodic": True, "procedural": False},
+    "factual": {"semantic": True, "episodic": False, "procedural": False},
+    "behavioral": {"semantic": True, "episodic": True, "procedural": True},
+    "default": {"semantic": True, "episodic": True, "procedural": True},
+}
+
+# Headers of the system prompt sections (see CognitiveAgent._prompt_sections)
+EPISODIC_HEADER = (
+    "[EPISODIC MEMORY - YOUR PAST EXPERIENCES]\n"
+    "These are YOUR real memories from previous conversations with this user. "
+    "Reference them naturally as your own experience. When the user asks about "
+    "past interactions, use these memories to answer accurately.\n\n"
+)
+PROCEDURAL_HEADER = (
+    "[PROCEDURAL MEMORY - LEARNED RULES]\n"
+    "These rules were learned from your accumulated experience. Follow them.\n\n"
+)
+CONFLICT_HEADER = (
+    "[CONFLICT NOTICE]\n"
+    "The following contradiction was detected between your document "
+    "knowledge and your past conversation memories. Address it "
+    "transparently in your response.\n\n"
+)
+
+# Parts of an answer call, as reported by the context budget
+CONTEXT_SECTIONS = ("system", "episodic", "procedural", "conflict", "semantic", "history", "query")
+
+
+def classify_route(user_input: str) -> str:
+    """Name of the retrieval route for a query (a key of ROUTES)."""
+    if _PERSONAL_PATTERNS.search(user_input):
+        return "personal"
+    if _FACTUAL_PATTERNS.search(user_input):
+        return "factual"
+    if _BEHAVIORAL_PATTERNS.search(user_input):
+        return "behavioral"
+    return "default"
+
+
+def _same_function(a, b) -> bool:
+    """Whether two embedding functions produce the same vectors (they define no __eq__)."""
+    if a is b:
+        return True
+    try:
+        return type(a) is type(b) and a.get_config() == b.get_config()
+    except Exception:
+        return False
+
 
 class CognitiveAgent:
     """Agent with cognitive memory capabilities.
@@ -30,41 +88,62 @@ class CognitiveAgent:
     Args:
         mode: "full" uses all 5 memory systems.
               "semantic_only" uses only working + semantic memory (vanilla RAG baseline).
+        user_id: Optional namespace for episodic and procedural memory. Used by
+            SessionManager to serve many users from one process.
+        semantic: Shared SemanticMemory. When given, document ingestion is skipped
+            (the owner of the shared store is responsible for it).
+        db: Shared ChromaDB client.
+        llm: Shared LLM gateway (or raw Anthropic client). The process default if None.
+        embedding_function: ChromaDB embedding function for all collections.
     """
 
-    def __init__(self, mode: str = "full"):
+    def __init__(
+        self,
+        mode: str = "full",
+        user_id: str = None,
+        semantic: SemanticMemory = None,
+        db=None,
+        llm=None,
+        embedding_function=None,
+    ):
         self.mode = mode
-        self.working = WorkingMemory()
-        self.semantic = SemanticMemory()
+        self.user_id = user_id
+        llm = as_gateway(llm)
+        self.working = WorkingMemory(client=llm)
+        self.semantic = semantic or SemanticMemory(
+            client=db, embedding_function=embedding_function
+        )
 
         if mode == "full":
-            self.episodic = EpisodicMemory()
-            self.procedural = ProceduralMemory()
-            self.consolidation = Consolidation(self.episodic, self.procedural)
+            procedural_path = None
+            if user_id:
+                procedural_path = os.path.join(config.PROCEDURAL_DIR, f"{user_id}.txt")
+            self.episodic = EpisodicMemory(
+                client=db, llm=llm, namespace=user_id, embedding_function=embedding_function
+            )
+            self.procedural = ProceduralMemory(llm=llm, path=procedural_path)
+            self.consolidation = Consolidation(self.episodic, self.procedural, llm=llm)
+            self.scheduler = ConsolidationScheduler(self.consolidation)
         else:
             self.episodic = None
             self.procedural = None
             self.consolidation = None
+            self.scheduler = None
 
         self.conversation_count = 0
+        self.last_context = None  # context budget report of the last turn
 
         # Ingest any documents in data/
-        print(f"Loading semantic memory (mode={mode})...")
-        self.semantic.ingest_all()
+        if semantic is None:
+            print(f"Loading semantic memory (mode={mode})...")
+            self.semantic.ingest_all()
 
     def _classify_query(self, user_input: str) -> dict:
         """Classify a query to determine which memory systems to activate.
 
         Returns dict with keys: semantic, episodic, procedural (all bool).
         """
-        if _PERSONAL_PATTERNS.search(user_input):
-            return {"semantic": False, "episodic": True, "procedural": False}
-        if _FACTUAL_PATTERNS.search(user_input):
-            return {"semantic": True, "episodic": False, "procedural": False}
-        if _BEHAVIORAL_PATTERNS.search(user_input):
-            return {"semantic": True, "episodic": True, "procedural": True}
-        # Default: activate everything
-        return {"semantic": True, "episodic": True, "procedural": True}
+        return dict(ROUTES[classify_route(user_input)])
 
     def _detect_conflicts(
         self, semantic_text: str, episodic_text: str, query: str
@@ -73,10 +152,9 @@ class CognitiveAgent:
 
         Makes a short LLM call. Returns a conflict description or None.
         """
-        response = self.working.client.messages.create(
-            model=config.MODEL_NAME,
-            max_tokens=150,
-            temperature=0.0,
+        response = self.working.client.create(
+            "conflict",
+            **task_params("conflict"),
             system="You detect contradictions between information sources.",
             messages=[
                 {
@@ -100,110 +178,447 @@ class CognitiveAgent:
     def _build_system_prompt(
         self, user_input: str, routing: dict = None
     ) -> str:
-        """Construct system prompt with episodic + procedural context.
+        """Construct system prompt with episodic + procedural context (no context budget).
 
         Args:
             user_input: The user's query.
             routing: Output of _classify_query. If None, all systems are active.
         """
-        base = self.working._default_prompt()
-        parts = [base]
-
         if self.mode != "full":
-            return "\n\n".join(parts)
+            return self._assemble_system_prompt()
 
         if routing is None:
             routing = {"semantic": True, "episodic": True, "procedural": True}
 
-        # Episodic context
-        if routing["episodic"]:
-            episodic_context = self.episodic.recall_as_context(user_input)
-            if episodic_context:
-                parts.append(
-                    "[EPISODIC MEMORY - YOUR PAST EXPERIENCES]\n"
-                    "These are YOUR real memories from previous conversations with this user. "
-                    "Reference them naturally as your own experience. When the user asks about "
-                    "past interactions, use these memories to answer accurately.\n\n"
-                    f"{episodic_context}"
-                )
+        episodes, rules = self._recall(user_input, routing)
+        return self._assemble_system_prompt(
+            EpisodicMemory.format_episodes(episodes), ProceduralMemory.format_rules(rules)
+        )
 
-        # Procedural rules
+    def _recall(
+        self, user_input: str, routing: dict | None, track: bool = True
+    ) -> tuple[list[dict] | None, list[str]]:
+        """Recalled episodes and procedural rules for a turn, as far as routing allows."""
+        episodes, rules = None, []
+        if self.mode != "full" or routing is None:
+            return episodes, rules
+        if routing["episodic"]:
+            with tracer.span("chat.episodic"):
+                episodes = self.episodic.recall(user_input, track=track)
         if routing["procedural"]:
-            rules = self.procedural.get_rules_text()
-            if rules:
-                parts.append(
-                    "[PROCEDURAL MEMORY - LEARNED RULES]\n"
-                    "These rules were learned from your accumulated experience. Follow them.\n\n"
-                    f"{rules}"
-                )
+            with tracer.span("chat.procedural"):
+                rules = self.procedural.get_rules()
+        return episodes, rules
+
+    def _prompt_sections(
+        self, episodic_context: str = None, rules: str = None, conflict: str = None
+    ) -> dict[str, str]:
+        """The system prompt's sections in order: base prompt, episodes, rules, conflict notice."""
+        sections = {"system": self.working._default_prompt()}
+        if episodic_context:
+            sections["episodic"] = EPISODIC_HEADER + episodic_context
+        if rules:
+            sections["procedural"] = PROCEDURAL_HEADER + rules
+        if conflict:
+            sections["conflict"] = CONFLICT_HEADER + conflict
+        return sections
+
+    def _assemble_system_prompt(
+        self, episodic_context: str = None, rules: str = None, conflict: str = None
+    ) -> str:
+        """The system prompt around already retrieved context."""
+        return "\n\n".join(self._prompt_sections(episodic_context, rules, conflict).values())
 
-        return "\n\n".join(parts)
+    def _checks_conflicts(self, routing: dict | None, chunks: list[str]) -> bool:
+        """Whether a turn's chunks and episodes should be checked for contradictions."""
+        return bool(
+            config.CONFLICT_DETECTION_ENABLED
+            and self.mode == "full"
+            and routing
+            and routing["semantic"]
+            and routing["episodic"]
+            and chunks
+        )
 
-    def chat(self, user_input: str) -> str:
-        """Process a user message and return a response."""
-        # Classify the query to decide which memory systems to activate
-        routing = self._classify_query(user_input) if self.mode == "full" else None
+    def _find_conflict(self, chunks: list[str], episodes: list[dict] | None, user_input: str) -> str | None:
+        """A contradiction between retrieved chunks and recalled episodes, if any."""
+        if not episodes:
+            return None
+        with tracer.span("chat.conflict"):
+            return self._detect_conflicts(
+                self.semantic.context_message(chunks)["content"],
+                EpisodicMemory.format_episodes(episodes),
+                user_input,
+            )
+
+    def _fit_context(
+        self, user_input: str, episodes: list[dict] | None, rules: list[str], conflict: str | None,
+        chunk_ids: list[str], chunks: list[str], history: list[dict],
+    ) -> dict:
+        """Trim a turn's context to CONTEXT_BUDGET_TOKENS and assemble it (see memory/budget.py).
+
+        Returns the system prompt, the extra context messages, the index of
+        the first history message to send, the chunks kept, and a report:
+        route, budget, estimated tokens per section and in total, and the
+        dropped items (section, rank within it, episode/chunk id, rule text
+        or message index, and tokens).
+        """
+        route = classify_route(user_input)
+        episodes = episodes or []
+        turns = [i for i, message in enumerate(history) if message["role"] == "user"][::-1]
+        items = {
+            "episodic": [estimate_tokens(EpisodicMemory.format_episodes([ep])) for ep in episodes],
+            "procedural": [estimate_tokens(f"{i+1}. {rule}") for i, rule in enumerate(rules)],
+            "semantic": [estimate_tokens(f"[Chunk {i+1}]\n{chunk}") for i, chunk in enumerate(chunks)],
+            "history": [
+                sum(estimate_tokens(message["content"]) for message in history[first:last])
+                for first, last in zip(turns, [len(history)] + turns)
+            ],
+        }
+        labels = {
+            "episodic": [ep["id"] for ep in episodes],
+            "procedural": rules,
+            "semantic": chunk_ids,
+            "history": turns,
+        }
+
+        budget = config.CONTEXT_BUDGET_TOKENS
+        if budget:
+            headers = {"episodic": EPISODIC_HEADER, "procedural": PROCEDURAL_HEADER,
+                       "semantic": RETRIEVAL_HEADER}
+            reserved = estimate_tokens(self.working._default_prompt()) + estimate_tokens(user_input)
+            reserved += sum(estimate_tokens(headers[name]) for name in headers if items[name])
+            if conflict:
+                reserved += estimate_tokens(CONFLICT_HEADER + conflict)
+            with tracer.span("chat.budget"):
+                kept = allocate(budget, config.CONTEXT_BUDGET_WEIGHTS.get(route, {}), items, reserved)
+        else:
+            kept = {name: len(costs) for name, costs in items.items()}
+
+        dropped = [
+            {"section": name, "rank": rank, "item": labels[name][rank], "tokens": costs[rank]}
+            for name, costs in items.items()
+            for rank in range(kept[name], len(costs))
+        ]
+        chunk_ids, chunks = chunk_ids[:kept["semantic"]], chunks[:kept["semantic"]]
+        start = turns[kept["history"] - 1] if kept["history"] else len(history)
+
+        sections = self._prompt_sections(
+            EpisodicMemory.format_episodes(episodes[:kept["episodic"]]),
+            ProceduralMemory.format_rules(rules[:kept["procedural"]]),
+            conflict,
+        )
+        context_msg = self.semantic.context_message(chunks)
+        tokens = dict.fromkeys(CONTEXT_SECTIONS, 0)
+        tokens.update({name: estimate_tokens(text) for name, text in sections.items()})
+        tokens["semantic"] = estimate_tokens(context_msg["content"]) if context_msg else 0
+        tokens["history"] = sum(estimate_tokens(message["content"]) for message in history[start:])
+        tokens["query"] = estimate_tokens(user_input)
+        return {
+            "system": "\n\n".join(sections.values()),
+            "extra": [context_msg] if context_msg else None,
+            "start": start,
+            "chunk_ids": chunk_ids,
+            "chunks": chunks,
+            "report": {
+                "route": route,
+                "budget": budget,
+                "tokens": tokens,
+                "total": sum(tokens.values()),
+                "dropped": dropped,
+            },
+        }
+
+    def _answer_key(
+        self, user_input: str, chunk_ids: list[str], chunks: list[str], system_prompt: str,
+        messages: list[dict],
+    ) -> str | None:
+        """Answer-cache key for a turn, or None if its reply is not cacheable."""
+        # Factual and semantic_only replies depend only on the query and retrieved chunks
+        if self.mode != "full" or classify_route(user_input) == "factual":
+            return answer_key(user_input, chunk_ids, chunks, system_prompt, messages)
+        return None
+
+    def _prepare_turn(self, user_input: str, dry_run: bool = False) -> tuple[dict, str | None]:
+        """Route, retrieve and assemble context for a turn within the context budget.
+
+        Updates working memory with the system prompt and user message and
+        returns the fitted context (see _fit_context), plus the answer-cache
+        key if the reply is cacheable (factual route or semantic_only mode),
+        else None. A dry run changes no state and skips the conflict check,
+        the only LLM call made here.
+        """
+        if self.scheduler and not dry_run:
+            self.scheduler.touch()
 
-        # Build system prompt with gated memory context
-        system_prompt = self._build_system_prompt(user_input, routing=routing)
+        # Classify the query to decide which memory systems to activate
+        with tracer.span("chat.route"):
+            routing = self._classify_query(user_input) if self.mode == "full" else None
 
-        # Retrieve semantic context (if gating allows it)
-        extra = []
-        semantic_text = None
+        # Retrieve from each memory system the routing allows
+        episodes, rules = self._recall(user_input, routing, track=not dry_run)
+        chunk_ids, chunks = [], []
         if routing is None or routing["semantic"]:
-            context_msg = self.semantic.recall_as_message(user_input)
-            if context_msg:
-                extra.append(context_msg)
-                semantic_text = context_msg.get("content", "")
+            with tracer.span("chat.semantic"):
+                chunk_ids, chunks = self.semantic.search(user_input)
 
         # Conflict detection between semantic and episodic sources
-        if (
-            config.CONFLICT_DETECTION_ENABLED
-            and self.mode == "full"
-            and routing
-            and routing["semantic"]
-            and routing["episodic"]
-            and semantic_text
-        ):
-            episodic_text = self.episodic.recall_as_context(user_input)
-            if episodic_text:
-                conflict = self._detect_conflicts(
-                    semantic_text, episodic_text, user_input
-                )
-                if conflict:
-                    system_prompt += (
-                        "\n\n[CONFLICT NOTICE]\n"
-                        "The following contradiction was detected between your document "
-                        "knowledge and your past conversation memories. Address it "
-                        f"transparently in your response.\n\n{conflict}"
-                    )
+        conflict = None
+        if self._checks_conflicts(routing, chunks) and not dry_run:
+            conflict = self._find_conflict(chunks, episodes, user_input)
 
-        self.working.update_system_prompt(system_prompt)
+        context = self._fit_context(
+            user_input, episodes, rules, conflict, chunk_ids, chunks, self.working.messages
+        )
+        if dry_run:
+            return context, None
+        self.last_context = context["report"]
+
+        cache_key = self._answer_key(
+            user_input, context["chunk_ids"], context["chunks"], context["system"],
+            self.working.messages[context["start"]:],
+        )
+
+        self.working.update_system_prompt(context["system"])
         self.working.add_user_message(user_input)
+        return context, cache_key
 
-        response = self.working.get_response(extra_messages=extra if extra else None)
-        return response
+    def _cached_answer(self, cache_key: str | None) -> str | None:
+        """A cached reply for this turn, recorded in working memory like a live one."""
+        if cache_key is None:
+            return None
+        reply = self.semantic.answers.get(cache_key)
+        if reply is not None:
+            with tracer.span("chat.answer_cache.hit"):
+                self.working.add_assistant_message(reply)
+        return reply
+
+    def chat(self, user_input: str, dry_run: bool = False) -> str | dict:
+        """Process a user message and return a response.
+
+        With dry_run=True nothing is sent or recorded. Instead, returns the
+        system prompt and messages the answer call would get, with the
+        context budget report (see _fit_context).
+        """
+        if dry_run:
+            with tracer.span("chat.dry_run"):
+                context, _ = self._prepare_turn(user_input, dry_run=True)
+            messages = self.working.messages[context["start"]:] + (context["extra"] or [])
+            return {
+                "system": context["system"],
+                "messages": messages + [{"role": "user", "content": user_input}],
+                **context["report"],
+            }
+        with tracer.span("chat"):
+            context, cache_key = self._prepare_turn(user_input)
+            reply = self._cached_answer(cache_key)
+            if reply is None:
+                with tracer.span("chat.generate"):
+                    reply = self.working.get_response(
+                        extra_messages=context["extra"], start=context["start"]
+                    )
+                if cache_key is not None:
+                    self.semantic.answers.put(cache_key, reply)
+        self._reflect_after_turn()
+        return reply
+
+    def chat_stream(self, user_input: str):
+        """Process a user message and yield the response as text deltas."""
+        with tracer.span("chat_stream"):
+            context, cache_key = self._prepare_turn(user_input)
+            reply = self._cached_answer(cache_key)
+            if reply is not None:
+                yield reply
+            else:
+                with tracer.span("chat_stream.generate"):
+                    yield from self.working.stream_response(
+                        extra_messages=context["extra"], start=context["start"]
+                    )
+                if cache_key is not None:
+                    self.semantic.answers.put(cache_key, self.working.messages[-1]["content"])
+        self._reflect_after_turn()
+
+    def chat_many(self, queries: list[str], independent: bool = True, max_workers: int = None) -> list[str]:
+        """Answer several queries and return the replies in order (evaluation, bulk jobs).
+
+        With independent=True each query is answered as the next turn of its
+        own fork of the current conversation, which itself is left unchanged.
+        All queries are embedded in one batch, each memory store is searched
+        with one multi-query call, and conflict checks and generations run on
+        up to max_workers threads (CHAT_MANY_CONCURRENCY if None), still
+        within the LLM gateway's rate limits. independent=False answers them
+        one after another as turns of the current conversation, like chat().
+        """
+        if not independent:
+            return [self.chat(query) for query in queries]
+        with tracer.span("chat_many"):
+            if self.scheduler:
+                self.scheduler.touch()
+            turns = self._prepare_many(queries)
+            workers = max(1, min(max_workers or config.CHAT_MANY_CONCURRENCY, len(turns)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat-many") as pool:
+                return list(pool.map(self._answer_fork, turns))
+
+    def _prepare_many(self, queries: list[str]) -> list[dict]:
+        """Route and retrieve for a batch of queries with one index call per store."""
+        with tracer.span("chat_many.route"):
+            routes = [self._classify_query(q) if self.mode == "full" else None for q in queries]
+        semantic_rows = [i for i, routing in enumerate(routes) if routing is None or routing["semantic"]]
+        episodic_rows = [i for i, routing in enumerate(routes) if routing and routing["episodic"]]
+
+        with tracer.span("chat_many.embed"):
+            vectors = self.semantic.embedding_function(queries) if queries else []
+        found = [([], [])] * len(queries)
+        if semantic_rows:
+            with tracer.span("chat_many.semantic"):
+                results = self.semantic.search_many(
+                    [queries[i] for i in semantic_rows], [vectors[i] for i in semantic_rows]
+                )
+            for i, result in zip(semantic_rows, results):
+                found[i] = result
+        episodes = [None] * len(queries)
+        if episodic_rows:
+            # Reuse the query vectors only if both stores embed the same way
+            shared = _same_function(self.episodic.embedding_function, self.semantic.embedding_function)
+            with tracer.span("chat_many.episodic"):
+                results = self.episodic.recall_many(
+                    [queries[i] for i in episodic_rows],
+                    embeddings=[vectors[i] for i in episodic_rows] if shared else None,
+                )
+            for i, result in zip(episodic_rows, results):
+                episodes[i] = result
+        rules = []
+        if any(routing and routing["procedural"] for routing in routes):
+            with tracer.span("chat_many.procedural"):
+                rules = self.procedural.get_rules()
+
+        return [
+            {
+                "query": query,
+                "routing": routing,
+                "episodes": recalled,
+                "rules": rules if routing and routing["procedural"] else [],
+                "chunk_ids": chunk_ids,
+                "chunks": chunks,
+            }
+            for query, routing, (chunk_ids, chunks), recalled in zip(queries, routes, found, episodes)
+        ]
+
+    def _answer_fork(self, turn: dict) -> str:
+        """Answer one prepared query in a fork of the current conversation."""
+        fork = self.working.fork()
+        query = turn["query"]
+        conflict = None
+        if self._checks_conflicts(turn["routing"], turn["chunks"]):
+            conflict = self._find_conflict(turn["chunks"], turn["episodes"], query)
+        context = self._fit_context(
+            query, turn["episodes"], turn["rules"], conflict, turn["chunk_ids"], turn["chunks"],
+            fork.messages,
+        )
+        cache_key = self._answer_key(
+            query, context["chunk_ids"], context["chunks"], context["system"],
+            fork.messages[context["start"]:],
+        )
+        reply = self.semantic.answers.get(cache_key) if cache_key is not None else None
+        if reply is not None:
+            with tracer.span("chat_many.answer_cache.hit"):
+                return reply
+        fork.update_system_prompt(context["system"])
+        fork.add_user_message(query)
+        with tracer.span("chat_many.generate"):
+            reply = fork.get_response(extra_messages=context["extra"], start=context["start"])
+        if cache_key is not None:
+            self.semantic.answers.put(cache_key, reply)
+        return reply
 
     def new_conversation(self):
         """Start a fresh conversation (preserves long-term memory)."""
+        with tracer.span("new_conversation"):
+            self._close_conversation()
+
+    def consolidation_due(self, idle_seconds: float = None) -> str | None:
+        """Why maybe_consolidate would run a pass now (see ConsolidationScheduler.due), or None.
+
+        Batch mode leaves consolidation to the nightly job.
+        """
+        if self.scheduler is None or config.CONSOLIDATION_MODE != "inline":
+            return None
+        return self.scheduler.due(idle_seconds)
+
+    def maybe_consolidate(self, idle_seconds: float = None) -> bool:
+        """Run a budgeted consolidation pass if one is due. Returns True if it ran."""
+        if self.scheduler is None or config.CONSOLIDATION_MODE != "inline":
+            return False
+        return self.scheduler.maybe_run(idle_seconds)
+
+    def reflection_due(self, idle_seconds: float = None) -> bool:
+        """Whether maybe_reflect would fold turns now.
+
+        Due once ROLLING_REFLECTION_TURNS turns are pending or, when
+        idle_seconds is given, once any are and the session has been idle
+        that long.
+        """
+        if self.mode != "full" or not config.ROLLING_REFLECTION_TURNS:
+            return False
+        pending = self.working.unreflected_turns()
+        idle = idle_seconds is not None and time.time() - self.scheduler.last_activity >= idle_seconds
+        return pending >= config.ROLLING_REFLECTION_TURNS or (pending > 0 and idle)
+
+    def maybe_reflect(self, idle_seconds: float = None) -> bool:
+        """Fold unreflected turns into the rolling reflection if due. Returns True if it ran."""
+        if self.reflection_due(idle_seconds):
+            return self._update_reflection()
+        return False
+
+    def _reflect_after_turn(self):
+        """maybe_reflect at the end of a turn. The reply is already recorded, so a
+        failure is only logged; the turns stay pending for a later attempt.
+        """
+        try:
+            self.maybe_reflect()
+        except Exception as e:
+            print(f"  Rolling reflection failed: {type(e).__name__}: {e}")
+
+    def _update_reflection(self) -> bool:
+        """One reflection call over the turns since the last update."""
+        upto = len(self.working.messages)
+        with tracer.span("reflect.rolling"):
+            reflection = self.episodic.reflect_incremental(
+                self.working.reflection, self.working.get_conversation_text(self.working.reflected)
+            )
+        if reflection is None:
+            return False  # keep the previous reflection; the turns stay pending
+        self.working.reflection = reflection
+        self.working.reflected = upto
+        return True
+
+    def _close_conversation(self):
         if self.mode == "full" and self.working.get_turn_count() > 0:
             conversation_text = self.working.get_conversation_text()
 
+            # Finish the rolling reflection (a stale one beats re-reading the whole transcript)
+            if config.ROLLING_REFLECTION_TURNS and self.working.unreflected_turns():
+                with tracer.span("new_conversation.reflect"):
+                    self._update_reflection()
+
             # Store episodic memory
             print("  Saving episodic memory...")
-            self.episodic.store(conversation_text)
+            with tracer.span("new_conversation.store"):
+                stored = self.episodic.store(conversation_text, reflection=self.working.reflection)
+            if stored:
+                self.scheduler.note_stored()
 
             # Update procedural rules with new learnings
-            episodic_context = self.episodic.recall_as_context("recent learnings")
+            with tracer.span("new_conversation.recall"):
+                episodic_context = self.episodic.recall_as_context("recent learnings", track=False)
             if episodic_context:
                 print("  Updating procedural memory...")
-                self.procedural.update(episodic_context)
+                with tracer.span("new_conversation.procedural"):
+                    self.procedural.update(episodic_context)
 
         self.conversation_count += 1
 
-        # Trigger consolidation every N conversations
-        if self.mode == "full" and self.conversation_count % config.CONSOLIDATION_EVERY_N == 0:
-            print("  Running memory consolidation (sleep phase)...")
-            self.consolidation.run()
+        # Consolidate if the scheduler says so (idle time counts from the last turn)
+        self.maybe_consolidate()
 
         self.working.reset()
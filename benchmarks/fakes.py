@@ -0,0 +1,224 @@
+"""Offline stand-ins for the Anthropic client and embedding model.
+
+Used by server.py --stub and the benchmark suite so everything runs without
+an API key or network access, with deterministic outputs.
+"""
+
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+
+from memory.llm import LLMGateway
+
+
+# Default canned replies per purpose. Override any of them via StubAnthropic(replies=...).
+CANNED_REPLIES = {
+    "reflect": json.dumps({
+        "context_tags": ["Zeltron", "QA-7"],
+        "summary": "The user asked about Zeltron products and got an answer.",
+        "what_worked": "Citing the manual directly",
+        "what_to_avoid": "N/A",
+    }),
+    "merge": json.dumps({
+        "summary": "Merged discussion of Zeltron products.",
+        "what_worked": "Citing the manual directly",
+        "what_to_avoid": "N/A",
+        "context_tags": ["Zeltron"],
+    }),
+    "promote": json.dumps(["Cite the manual when answering product questions."]),
+    "rules": json.dumps(["Cite the manual when answering product questions."]),
+    "conflict": "NONE",
+}
+
+
+# Purposes whose replies are parsed as JSON (see StubAnthropic malformed)
+JSON_PURPOSES = {"reflect", "reflect_batch", "merge", "promote", "rules"}
+
+
+def classify_purpose(system: str, prompt: str) -> str:
+    """Infer which call site issued a request from its prompt template."""
+    if "memory encoder" in prompt:
+        return "reflect_batch" if "<conversations>" in prompt else "reflect"
+    if "memory consolidation system" in prompt:
+        return "merge"
+    if "pattern extraction system" in prompt:
+        return "promote"
+    if "rule maintenance system" in prompt:
+        return "rules"
+    if system and "contradictions" in system:
+        return "conflict"
+    return "answer"
+
+
+class _StubMessages:
+    def __init__(self, owner: "StubAnthropic"):
+        self._owner = owner
+
+    def _reply(self, kwargs: dict) -> str:
+        messages = kwargs.get("messages", [])
+        prompt = messages[-1]["content"] if messages else ""
+        purpose = classify_purpose(kwargs.get("system", ""), prompt)
+        self._owner.calls_by_purpose[purpose] = self._owner.calls_by_purpose.get(purpose, 0) + 1
+        if purpose in JSON_PURPOSES and self._owner.malformed_reply(kwargs.get("model")):
+            return "Sure! Here is the JSON you asked for, more or less."
+        if purpose in self._owner.replies:
+            return self._owner.replies[purpose]
+        if purpose == "reflect_batch":
+            # One canned reflection per packed conversation
+            reflection = json.loads(self._owner.replies["reflect"])
+            count = prompt.count("<conversation index=")
+            return json.dumps([{**reflection, "index": i} for i in range(count)])
+        return "Stub answer: " + prompt[-200:].strip()
+
+    def _usage(self, kwargs: dict, text: str) -> SimpleNamespace:
+        chars = len(kwargs.get("system", "")) + sum(
+            len(m["content"]) for m in kwargs.get("messages", [])
+        )
+        usage = SimpleNamespace(input_tokens=chars // 4, output_tokens=len(text) // 4)
+        totals = self._owner.usage_by_model.setdefault(kwargs.get("model"), [0, 0, 0])
+        totals[0] += 1
+        totals[1] += usage.input_tokens
+        totals[2] += usage.output_tokens
+        return usage
+
+    def create(self, **kwargs):
+        self._owner.sleep(kwargs.get("model"))
+        text = self._reply(kwargs)
+        self._owner.calls += 1
+        return SimpleNamespace(
+            content=[SimpleNamespace(type="text", text=text)],
+            usage=self._usage(kwargs, text),
+            model=kwargs.get("model"),
+        )
+
+    @contextmanager
+    def stream(self, **kwargs):
+        text = self._reply(kwargs)
+        words = text.split(" ")
+        per_word = self._owner.sample_latency(kwargs.get("model")) / max(len(words), 1)
+        self._owner.calls += 1
+
+        def text_stream():
+            for i, word in enumerate(words):
+                time.sleep(per_word)
+                yield word if i == 0 else " " + word
+
+        usage = self._usage(kwargs, text)
+        yield SimpleNamespace(
+            text_stream=text_stream(),
+            get_final_message=lambda: SimpleNamespace(usage=usage),
+        )
+
+
+class StubAnthropic:
+    """Drop-in for anthropic.Anthropic that never touches the network.
+
+    Args:
+        latency: Mean seconds per call.
+        jitter: Spread of the latency. For "normal" it is the standard deviation;
+            for "lognormal" it is the sigma of the underlying normal.
+        distribution: "fixed", "normal" (clipped at 0) or "lognormal" (heavy tail).
+        replies: Per-purpose reply overrides merged over CANNED_REPLIES.
+        seed: Seed for the latency and malformed-reply samplers.
+        model_latency: Mean latency per model name, overriding `latency`.
+        malformed: Per model name, the probability that a JSON reply
+            (reflection, merge, promotion, rules) comes back as prose.
+
+    usage_by_model maps each model to [calls, input tokens, output tokens].
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        distribution: str = "normal",
+        replies: dict = None,
+        seed: int = 0,
+        model_latency: dict = None,
+        malformed: dict = None,
+    ):
+        self.latency = latency
+        self.model_latency = model_latency or {}
+        self.malformed = malformed or {}
+        self.usage_by_model: dict[str, list[int]] = {}
+        self.jitter = jitter
+        self.distribution = distribution
+        self.replies = {**CANNED_REPLIES, **(replies or {})}
+        self.calls = 0
+        self.calls_by_purpose: dict[str, int] = {}
+        self._rng = random.Random(seed)
+        self.messages = _StubMessages(self)
+
+    def sample_latency(self, model: str = None) -> float:
+        latency = self.model_latency.get(model, self.latency)
+        if not self.jitter or self.distribution == "fixed" or not latency:
+            return latency
+        if self.distribution == "lognormal":
+            # Keep the mean at `latency`: E[exp(N(mu, s))] = exp(mu + s^2 / 2)
+            mu = math.log(latency) - self.jitter ** 2 / 2
+            return self._rng.lognormvariate(mu, self.jitter)
+        return max(0.0, self._rng.gauss(latency, self.jitter))
+
+    def malformed_reply(self, model: str = None) -> bool:
+        rate = self.malformed.get(model, 0.0)
+        return bool(rate) and self._rng.random() < rate
+
+    def sleep(self, model: str = None):
+        delay = self.sample_latency(model)
+        if delay:
+            time.sleep(delay)
+
+
+def stub_gateway(max_in_flight: int = None, **stub_kwargs) -> LLMGateway:
+    """A gateway around StubAnthropic with rate limits out of the way.
+
+    Concurrency is still bounded (LLM_MAX_IN_FLIGHT unless overridden).
+    """
+    return LLMGateway(
+        client=StubAnthropic(**stub_kwargs),
+        requests_per_minute=1e9,
+        tokens_per_minute=1e12,
+        max_in_flight=max_in_flight,
+    )
+
+
+class HashEmbeddingFunction(EmbeddingFunction):
+    """Deterministic bag-of-words embedding (signed feature hashing, L2-normalized).
+
+    Texts sharing words get similar vectors, which is enough to exercise
+    retrieval, clustering and consolidation without downloading a model.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def __call__(self, input):
+        vectors = np.zeros((len(input), self.dim), dtype=np.float32)
+        for row, text in enumerate(input):
+            for token in re.findall(r"[a-z0-9-]+", text.lower()):
+                digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+            norm = np.linalg.norm(vectors[row])
+            if norm > 0:
+                vectors[row] /= norm
+        return list(vectors)
+
+    @staticmethod
+    def name() -> str:
+        return "cognitive-memory-hash"
+
+    def get_config(self) -> dict:
+        return {"dim": self.dim}
+
+    @staticmethod
+    def build_from_config(config: dict) -> "HashEmbeddingFunction":
+        return HashEmbeddingFunction(dim=config.get("dim", 256))
@@ -0,0 +1,149 @@
+"""Flat vs Chroma backend - where the in-process NumPy index stops paying off.
+
+For each size, fills one FlatCollection and one Chroma collection (default
+HNSW profile) with the same episode-document vectors (hash embeddings),
+then measures on each:
+- query p50/p95: top-k search for one embedded query, as recall runs it,
+- add p50: inserting one record into the filled store, as store() runs it
+  (the flat store rewrites its vector file on every write),
+- open: loading the store from disk in a fresh process state.
+
+A flat query is a matrix product over every vector, so its cost grows with
+the store; Chroma's HNSW search stays nearly flat but carries a fixed
+per-call overhead. The report ends with the largest measured size at which
+the flat store is at least as fast on both query and add - the value to put
+in FLAT_INDEX_MAX_ITEMS.
+
+Run:
+    python -m benchmarks.flat_index
+    python -m benchmarks.flat_index --sizes 100 500 2000 --queries 300 --output flat.json
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+
+import chromadb
+import numpy as np
+
+import config
+from benchmarks.fakes import HashEmbeddingFunction
+from benchmarks.index_tuning import episodic_texts, query_texts
+from benchmarks.run import percentile
+from benchmarks.workload import sandbox
+from memory.storage import index_metadata
+from memory.vectorstore import FlatCollection
+
+
+def _fill(collection, ids: list[str], vectors: np.ndarray, documents: list[str]):
+    for offset in range(0, len(ids), 1000):
+        collection.add(ids=ids[offset:offset + 1000], embeddings=vectors[offset:offset + 1000],
+                       documents=documents[offset:offset + 1000])
+
+
+def _timed(fn, repeats: int) -> list[float]:
+    timings = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def measure(backend: str, ids: list[str], vectors: np.ndarray, documents: list[str],
+            queries: np.ndarray, extra: np.ndarray, k: int) -> dict:
+    """Fill one store on a backend and time queries, single adds and a reopen."""
+    embed = HashEmbeddingFunction()
+    if backend == "flat":
+        directory = os.path.abspath("flat")
+        collection = FlatCollection("bench", embedding_function=embed, directory=directory)
+        reopen = lambda: FlatCollection("bench", embedding_function=embed, directory=directory).count()
+    else:
+        path = os.path.abspath("chroma")
+        db = chromadb.PersistentClient(path=path)
+        collection = db.create_collection("bench", metadata=index_metadata("default"),
+                                          embedding_function=embed)
+        reopen = lambda: chromadb.PersistentClient(path=path).get_collection(
+            "bench", embedding_function=embed).query(query_embeddings=queries[:1], n_results=1)
+    _fill(collection, ids, vectors, documents)
+
+    collection.query(query_embeddings=queries[:1], n_results=k)  # load the index
+    query = _timed(lambda i: collection.query(
+        query_embeddings=[queries[i]], n_results=k,
+        include=["documents", "metadatas", "distances"],
+    ), len(queries))
+    add = _timed(lambda i: collection.add(
+        ids=[f"extra_{i}"], embeddings=[extra[i]], documents=["extra"],
+    ), len(extra))
+    start = time.perf_counter()
+    reopen()
+    return {
+        "query_p50_ms": round(percentile(query, 50), 3),
+        "query_p95_ms": round(percentile(query, 95), 3),
+        "add_p50_ms": round(percentile(add, 50), 3),
+        "open_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+def compare(n: int, n_queries: int, n_adds: int, k: int, seed: int = 0) -> dict:
+    """Results per backend for one store size."""
+    rng = random.Random(seed)
+    documents = episodic_texts(n, rng)
+    embed = HashEmbeddingFunction()
+    vectors = np.asarray(embed(documents), dtype=np.float32)
+    queries = np.asarray(embed(query_texts(n_queries, rng)), dtype=np.float32)
+    extra = np.asarray(embed(episodic_texts(n_adds, rng)), dtype=np.float32)
+    ids = [f"episode_{i}" for i in range(n)]
+    results = {}
+    for backend in ("flat", "chroma"):
+        with sandbox():
+            results[backend] = measure(backend, ids, vectors, documents, queries, extra, k)
+    return results
+
+
+def crossover(report: dict) -> int | None:
+    """Largest size (before the first loss) where flat is at least as fast on query and add."""
+    best = None
+    for n, results in sorted(report.items()):
+        flat, chroma = results["flat"], results["chroma"]
+        if flat["query_p50_ms"] > chroma["query_p50_ms"] or flat["add_p50_ms"] > chroma["add_p50_ms"]:
+            break
+        best = n
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the flat and Chroma vector backends")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[50, 200, 500, 1000, 2000, 5000, 10000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--adds", type=int, default=30)
+    parser.add_argument("--k", type=int, default=config.EPISODIC_TOP_K)
+    parser.add_argument("--output", help="also write results to this JSON file")
+    args = parser.parse_args()
+
+    report = {}
+    for n in args.sizes:
+        print(f"n={n}...")
+        report[n] = compare(n, args.queries, args.adds, args.k)
+
+    print(f"\n  {'size':>6} {'backend':8s} {'query p50':>10} {'query p95':>10} "
+          f"{'add p50':>8} {'open ms':>8}")
+    for n, results in report.items():
+        for backend, r in results.items():
+            print(f"  {n:>6} {backend:8s} {r['query_p50_ms']:>10} {r['query_p95_ms']:>10} "
+                  f"{r['add_p50_ms']:>8} {r['open_ms']:>8}")
+    recommended = crossover(report)
+    print(f"\n  flat is at least as fast up to: {recommended} "
+          f"(FLAT_INDEX_MAX_ITEMS = {config.FLAT_INDEX_MAX_ITEMS})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"sizes": {str(n): r for n, r in report.items()},
+                       "recommended_max_items": recommended}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
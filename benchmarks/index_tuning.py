@@ -0,0 +1,173 @@
+"""HNSW profile tuning - recall@k against brute force, query latency and index size.
+
+For the semantic and episodic stores, builds one collection per profile in
+config.HNSW_PROFILES from the same synthetic vectors (Zeltron corpus text,
+hash embeddings), then measures:
+- recall@k: share of returned neighbours that are within the true k-th
+  nearest distance (exact cosine over the full matrix; ties count as hits),
+- query latency p50/p95 for single-vector queries,
+- build time and on-disk index size.
+
+It ends with the fastest profile that reaches --target-recall per store and
+size, i.e. the value to put in SEMANTIC_INDEX_PROFILE / EPISODIC_INDEX_PROFILE
+(and scripts/migrate_index.py for existing data).
+
+Run:
+    python -m benchmarks.index_tuning                       # 1k and 10k vectors
+    python -m benchmarks.index_tuning --sizes 50000 --queries 500 --k 10
+    python -m benchmarks.index_tuning --profiles small recall --output tuning.json
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import time
+
+import chromadb
+import numpy as np
+
+import config
+from benchmarks.fakes import HashEmbeddingFunction
+from benchmarks.run import percentile
+from benchmarks.workload import (
+    corpus_conversation, corpus_terms, sandbox, synthetic_episode, zeltron_corpus,
+)
+from memory.storage import index_metadata
+
+
+def semantic_texts(n: int, rng: random.Random) -> list[str]:
+    """Chunk-sized runs of consecutive corpus sentences."""
+    sentences = [s for p in zeltron_corpus() for s in re.split(r"(?<=[.!?])\s+", p) if s]
+    texts = []
+    for _ in range(n):
+        start = rng.randrange(len(sentences))
+        texts.append(" ".join(sentences[start:start + rng.randint(3, 6)]))
+    return texts
+
+
+def episodic_texts(n: int, rng: random.Random) -> list[str]:
+    """Episode documents as EpisodicMemory stores them."""
+    texts = []
+    for _ in range(n):
+        ep = synthetic_episode(rng)
+        texts.append(
+            f"Summary: {ep['summary']}\n"
+            f"What worked: {ep['what_worked']}\n"
+            f"What to avoid: {ep['what_to_avoid']}"
+        )
+    return texts
+
+
+def query_texts(n: int, rng: random.Random) -> list[str]:
+    terms = corpus_terms()
+    return [corpus_conversation(rng, terms, turns=1)[0] for _ in range(n)]
+
+
+def exact_neighbours(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Cosine distance to the true k-th nearest vector, per query."""
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(1e-12)
+    unit_q = queries / np.linalg.norm(queries, axis=1, keepdims=True).clip(1e-12)
+    distances = 1 - unit_q @ unit.T
+    return np.partition(distances, k - 1, axis=1)[:, k - 1]
+
+
+def directory_mb(path: str) -> float:
+    """Size of the vector index files (everything but Chroma's SQLite catalog)."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            if not name.startswith("chroma.sqlite3"):
+                total += os.path.getsize(os.path.join(root, name))
+    return total / 1e6
+
+
+def measure(profile: str, ids: list[str], vectors: np.ndarray, queries: np.ndarray,
+            kth: np.ndarray, k: int) -> dict:
+    """Build one collection under a profile and measure it."""
+    path = os.path.abspath(f"index_{profile}")
+    db = chromadb.PersistentClient(path=path)
+    collection = db.create_collection(
+        "tuning", metadata=index_metadata(profile), embedding_function=HashEmbeddingFunction()
+    )
+    start = time.perf_counter()
+    for offset in range(0, len(ids), 1000):
+        collection.add(ids=ids[offset:offset + 1000], embeddings=vectors[offset:offset + 1000])
+    build_s = time.perf_counter() - start
+
+    collection.query(query_embeddings=queries[:1], n_results=k)  # load the index
+    timings, hits = [], 0
+    for query, limit in zip(queries, kth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query], n_results=k, include=["distances"])
+        timings.append((time.perf_counter() - start) * 1000)
+        hits += sum(1 for d in result["distances"][0] if d <= limit + 1e-5)
+    return {
+        "recall": round(hits / (len(queries) * k), 4),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "build_s": round(build_s, 2),
+        "index_mb": round(directory_mb(path), 2),
+    }
+
+
+def tune(store: str, n: int, profiles: list[str], n_queries: int, k: int, seed: int = 0) -> dict:
+    """Results per profile for one store at one size."""
+    rng = random.Random(seed)
+    texts = semantic_texts(n, rng) if store == "semantic" else episodic_texts(n, rng)
+    embed = HashEmbeddingFunction()
+    vectors = np.asarray(embed(texts), dtype=np.float32)
+    queries = np.asarray(embed(query_texts(n_queries, rng)), dtype=np.float32)
+    kth = exact_neighbours(vectors, queries, k)
+    ids = [f"{store}_{i}" for i in range(n)]
+    with sandbox():
+        return {profile: measure(profile, ids, vectors, queries, kth, k) for profile in profiles}
+
+
+def recommend(results: dict, target: float) -> str | None:
+    """Fastest profile (by p95) meeting the recall target, else the highest-recall one."""
+    meeting = [p for p, r in results.items() if r["recall"] >= target]
+    if meeting:
+        return min(meeting, key=lambda p: results[p]["p95_ms"])
+    return max(results, key=lambda p: results[p]["recall"]) if results else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune HNSW index profiles")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--stores", nargs="+", default=["semantic", "episodic"],
+                        choices=["semantic", "episodic"])
+    parser.add_argument("--profiles", nargs="+", default=list(config.HNSW_PROFILES),
+                        choices=list(config.HNSW_PROFILES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=config.SEMANTIC_TOP_K)
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--output", help="also write results to this JSON file")
+    args = parser.parse_args()
+
+    report = {}
+    for store in args.stores:
+        for n in args.sizes:
+            print(f"{store} n={n}...")
+            results = tune(store, n, args.profiles, args.queries, args.k)
+            report[f"{store}.n{n}"] = {
+                "profiles": results, "recommended": recommend(results, args.target_recall),
+            }
+
+    print(f"\n  {'store':16s} {'profile':9s} {f'recall@{args.k}':>10} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'build s':>8} {'index MB':>9}")
+    for name, entry in report.items():
+        for profile, r in entry["profiles"].items():
+            mark = " *" if profile == entry["recommended"] else ""
+            print(f"  {name:16s} {profile:9s} {r['recall']:>10} {r['p50_ms']:>8} "
+                  f"{r['p95_ms']:>8} {r['build_s']:>8} {r['index_mb']:>9}{mark}")
+    print(f"\n  * fastest profile with recall >= {args.target_recall}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""Conversation replay load generator - find the agent's scaling limits offline.
+
+Replays multi-turn conversations against many concurrent CognitiveAgent
+sessions (one SessionManager, as in server.py) with the stub LLM, and reports:
+- throughput (turns and conversations per second),
+- chat latency percentiles per retrieval route, and new_conversation latency,
+- a timeline of throughput and episodic store size,
+- consolidation pauses (when a scheduled sleep phase ran, and for how long).
+
+Traffic is either synthetic (conversations about topics drawn from the
+Zeltron corpus) or recorded transcripts in JSON lines:
+
+    {"user_id": "alice", "turns": ["first message", "second message"]}
+    {"user_id": "bob", "conversation": "User: ...\\n\\nAssistant: ..."}
+
+("conversation" is the import_transcripts.py format; its "User:" blocks are
+replayed. Lines without a user_id are spread over --sessions sessions.)
+
+Run:
+    python -m benchmarks.replay --sessions 50 --conversations 4 --latency 0.2
+    python -m benchmarks.replay --latency 0.5 --jitter 0.8 --distribution lognormal
+    python -m benchmarks.replay --transcripts transcripts.jsonl --concurrency 32 --output replay.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import chromadb
+
+import config
+from agent import classify_route
+from benchmarks.fakes import HashEmbeddingFunction, stub_gateway
+from benchmarks.run import percentile
+from benchmarks.workload import corpus_conversation, corpus_terms, sandbox, synthetic_document
+from memory.vectorstore import StoreMoved, collection_names, existing_collection
+from sessions import SessionManager
+
+
+def synthetic_scripts(sessions: int, conversations: int, turns: int, seed: int = 0) -> dict:
+    """{session: [conversation, ...]} where each conversation is a list of user messages."""
+    rng = random.Random(seed)
+    terms = corpus_terms()
+    return {
+        f"user_{i}": [corpus_conversation(rng, terms, turns) for _ in range(conversations)]
+        for i in range(sessions)
+    }
+
+
+def load_transcripts(paths: list[str], sessions: int) -> dict:
+    """{session: [conversation, ...]} from JSON-lines transcript files."""
+    scripts = defaultdict(list)
+    unassigned = 0
+    for path in paths:
+        with open(path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                turns = record.get("turns")
+                if turns is None:
+                    turns = [
+                        block[len("User:"):].strip()
+                        for block in record["conversation"].split("\n\n")
+                        if block.startswith("User:")
+                    ]
+                if not turns:
+                    continue
+                user_id = record.get("user_id")
+                if user_id is None:
+                    user_id = f"user_{unassigned % sessions}"
+                    unassigned += 1
+                scripts[str(user_id)].append(turns)
+    return dict(scripts)
+
+
+class Recorder:
+    """Thread-safe collection of per-operation timings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.turns: dict[str, list[float]] = defaultdict(list)  # route -> latencies (s)
+        self.closes: list[float] = []
+        self.pauses: list[dict] = []
+        self.completed = 0
+        self.errors: list[str] = []
+
+    def turn(self, route: str, elapsed: float):
+        with self._lock:
+            self.turns[route].append(elapsed)
+            self.completed += 1
+
+    def close(self, session: str, elapsed: float, pause: float | None):
+        with self._lock:
+            self.closes.append(elapsed)
+            if pause is not None:
+                self.pauses.append({
+                    "t": round(time.perf_counter() - self.start, 3),
+                    "session": session,
+                    "seconds": round(pause, 3),
+                })
+
+    def error(self, session: str, e: Exception):
+        with self._lock:
+            self.errors.append(f"{session}: {type(e).__name__}: {e}")
+
+    def progress(self) -> tuple[int, int]:
+        """(turns completed, consolidation pauses) so far."""
+        with self._lock:
+            return self.completed, len(self.pauses)
+
+
+def run_session(sessions: SessionManager, session: str, conversations: list[list[str]],
+                recorder: Recorder, think: float):
+    """Play one user's conversations in order, like a client of server.py would."""
+    for turns in conversations:
+        try:
+            for message in turns:
+                agent = sessions.get(session)
+                start = time.perf_counter()
+                agent.chat(message)
+                recorder.turn(classify_route(message), time.perf_counter() - start)
+                if think:
+                    time.sleep(think)
+            agent = sessions.get(session)
+            last_run = agent.scheduler.state["last_run_at"] if agent.scheduler else None
+            start = time.perf_counter()
+            agent.new_conversation()
+            elapsed = time.perf_counter() - start
+            ran = agent.scheduler and agent.scheduler.state["last_run_at"] != last_run
+            recorder.close(session, elapsed, agent.scheduler.state["last_run_seconds"] if ran else None)
+        except Exception as e:
+            recorder.error(session, e)
+
+
+def count_episodes(db) -> int:
+    """Episodes in every episodic collection, including those of parked sessions."""
+    total = 0
+    for name in collection_names(db):
+        if not name.startswith("episodic_memory") or name.endswith("__rebuild"):
+            continue
+        try:
+            total += existing_collection(db, name).count()
+        except StoreMoved:  # promoted to Chroma while we looked
+            total += existing_collection(db, name).count()
+    return total
+
+
+def monitor(sessions: SessionManager, recorder: Recorder, interval: float, stop: threading.Event) -> list:
+    """Sample throughput and episodic store size every `interval` seconds until stopped."""
+    timeline = []
+    done_before = 0
+    while not stop.wait(interval):
+        done, pauses = recorder.progress()
+        episodes = count_episodes(sessions.db)
+        timeline.append({
+            "t": round(time.perf_counter() - recorder.start, 1),
+            "turns_per_s": round((done - done_before) / interval, 2),
+            "episodes": episodes,
+            "active_sessions": sessions.active_count(),
+            "consolidations": pauses,
+        })
+        done_before = done
+    return timeline
+
+
+def replay(scripts: dict, concurrency: int, llm, think: float = 0.0,
+           sample_interval: float = 1.0, max_active: int = config.MAX_ACTIVE_SESSIONS) -> dict:
+    """Replay scripts against a SessionManager in the current directory and return the report."""
+    embedding_function = HashEmbeddingFunction()
+    db = chromadb.PersistentClient(path=os.path.abspath("chroma_db"))
+    sessions = SessionManager(
+        llm=llm, db=db, embedding_function=embedding_function, max_active=max_active
+    )
+    if sessions.semantic.collection.count() == 0:
+        sessions.semantic.ingest_text(synthetic_document(200), source="zeltron_manual.pdf")
+
+    recorder = Recorder()
+    stop = threading.Event()
+    timeline: list = []
+    sampler = threading.Thread(
+        target=lambda: timeline.extend(monitor(sessions, recorder, sample_interval, stop)),
+        daemon=True,
+    )
+    sampler.start()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for session, conversations in scripts.items():
+            pool.submit(run_session, sessions, session, conversations, recorder, think)
+    elapsed = time.perf_counter() - recorder.start
+    stop.set()
+    sampler.join()
+    sessions.close()
+    episodes = count_episodes(db)
+    return report(recorder, elapsed, timeline, episodes)
+
+
+def report(recorder: Recorder, elapsed: float, timeline: list, episodes: int) -> dict:
+    def summary(latencies: list[float]) -> dict:
+        ms = [value * 1000 for value in latencies]
+        if not ms:
+            return {"count": 0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        return {
+            "count": len(ms),
+            **{f"p{q}_ms": round(percentile(ms, q), 2) for q in (50, 95, 99)},
+            "max_ms": round(max(ms), 2),
+        }
+
+    n_turns = sum(len(v) for v in recorder.turns.values())
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "turns": n_turns,
+        "conversations": len(recorder.closes),
+        "errors": recorder.errors,
+        "turns_per_s": round(n_turns / elapsed, 2) if elapsed else 0.0,
+        "conversations_per_s": round(len(recorder.closes) / elapsed, 2) if elapsed else 0.0,
+        "routes": {route: summary(v) for route, v in sorted(recorder.turns.items())},
+        "new_conversation": summary(recorder.closes),
+        "episodes": episodes,
+        "consolidation_pauses": recorder.pauses,
+        "timeline": timeline,
+    }
+
+
+def print_report(result: dict):
+    print(f"\n{result['turns']} turns, {result['conversations']} conversations in "
+          f"{result['elapsed_s']} s ({len(result['errors'])} errors)")
+    for error in result["errors"][:5]:
+        print(f"  error: {error}")
+    print(f"  throughput: {result['turns_per_s']} turns/s, {result['conversations_per_s']} conversations/s")
+    print(f"\n  {'latency':18s} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = [*((f"chat.{r}", s) for r, s in result["routes"].items()), ("new_conversation", result["new_conversation"])]
+    for name, s in rows:
+        print(f"  {name:18s} {s['count']:>6} {s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9} {s['max_ms']:>9}")
+    print(f"\n  {'t (s)':>7} {'turns/s':>8} {'episodes':>9} {'sessions':>9} {'sleeps':>7}")
+    for row in result["timeline"]:
+        print(f"  {row['t']:>7} {row['turns_per_s']:>8} {row['episodes']:>9} "
+              f"{row['active_sessions']:>9} {row['consolidations']:>7}")
+    pauses = result["consolidation_pauses"]
+    print(f"\n  episodes at end: {result['episodes']}")
+    if pauses:
+        longest = max(p["seconds"] for p in pauses)
+        print(f"  consolidation pauses: {len(pauses)}, longest {longest} s")
+        for p in pauses:
+            print(f"    t={p['t']:>8} s  {p['session']:>12}  {p['seconds']} s")
+    else:
+        print("  consolidation pauses: none")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay multi-turn conversations against concurrent sessions")
+    parser.add_argument("--transcripts", nargs="+", help="JSON-lines transcript files (synthetic if omitted)")
+    parser.add_argument("--sessions", type=int, default=20, help="synthetic sessions (or buckets for unowned transcripts)")
+    parser.add_argument("--conversations", type=int, default=5, help="synthetic conversations per session")
+    parser.add_argument("--turns", type=int, default=3, help="synthetic user turns per conversation")
+    parser.add_argument("--concurrency", type=int, default=16, help="sessions replayed at once")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds between a session's turns")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub LLM mean latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency spread (see StubAnthropic)")
+    parser.add_argument("--distribution", default="normal", choices=["fixed", "normal", "lognormal"])
+    parser.add_argument("--llm-concurrency", type=int, default=config.LLM_MAX_IN_FLIGHT,
+                        help="gateway in-flight limit")
+    parser.add_argument("--max-active", type=int, default=config.MAX_ACTIVE_SESSIONS,
+                        help="sessions held in RAM before LRU parking")
+    parser.add_argument("--consolidation-idle", type=float, default=0.0,
+                        help="SCHEDULER_IDLE_SECONDS for the run (replayed sessions are never idle, "
+                             "so the default 0 lets the scheduler fire on growth and duplicates)")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="timeline resolution (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the report to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="show the agents' progress messages")
+    args = parser.parse_args()
+
+    if args.transcripts:
+        scripts = load_transcripts(args.transcripts, args.sessions)
+    else:
+        scripts = synthetic_scripts(args.sessions, args.conversations, args.turns, seed=args.seed)
+    llm = stub_gateway(
+        max_in_flight=args.llm_concurrency, latency=args.latency, jitter=args.jitter,
+        distribution=args.distribution, seed=args.seed,
+    )
+    config.SCHEDULER_IDLE_SECONDS = args.consolidation_idle
+    print(f"Replaying {sum(len(c) for c in scripts.values())} conversations over "
+          f"{len(scripts)} sessions, {args.concurrency} at a time...")
+
+    with sandbox(), contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+        result = replay(scripts, args.concurrency, llm, think=args.think,
+                        sample_interval=args.sample_interval, max_active=args.max_active)
+
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
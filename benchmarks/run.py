@@ -0,0 +1,424 @@
+"""Offline benchmark suite - no API key, no network, deterministic inputs.
+
+Measures chat latency per route, prompt size on a long conversation with and
+without the context budget, question sets through chat_many vs a chat loop,
+new_conversation cost (and with long conversations, rolling vs close-time
+reflection), episode import throughput (store vs store_many), ingest
+throughput, Consolidation.run scaling and LLM latency/cost per model tier,
+then compares against benchmarks/baselines.json.
+
+Run:
+    python -m benchmarks.run                    # quick suite, compare to baselines
+    python -m benchmarks.run --full             # include the 10k-episode consolidation
+    python -m benchmarks.run --update-baseline  # record current numbers as the baseline
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import chromadb
+
+import config
+from benchmarks.fakes import HashEmbeddingFunction, stub_gateway
+from benchmarks.workload import (
+    ROUTE_QUERIES, build_agent, sandbox, seed_episodes, synthetic_conversation,
+    synthetic_document, synthetic_pages,
+)
+from memory.consolidation import Consolidation
+from memory.scheduler import ConsolidationScheduler
+from memory.episodic import EpisodicMemory
+from memory.procedural import ProceduralMemory
+from memory.semantic import SemanticMemory
+from memory.tracing import tracer
+
+BASELINES = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+# USD per million input/output tokens, for the model tier comparison
+MODEL_PRICES = {
+    "claude-sonnet-4-20250514": (3.0, 15.0),
+    "claude-haiku-4-5-20251001": (1.0, 5.0),
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0-100)."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def metric(value: float, unit: str, better: str = "lower", noise: float = 0.0) -> dict:
+    """A result entry. Differences smaller than `noise` never count as regressions."""
+    return {"value": round(value, 3), "unit": unit, "better": better, "noise": noise}
+
+
+def bench_chat(llm_latency: float, rounds: int) -> dict:
+    """chat() latency percentiles per retrieval route."""
+    results = {}
+    with sandbox():
+        agent = build_agent(llm=stub_gateway(latency=llm_latency))
+        # A few past conversations so episodic routes have something to recall
+        for query in ROUTE_QUERIES["factual"]:
+            agent.chat(query)
+            agent.new_conversation()
+
+        for route, queries in ROUTE_QUERIES.items():
+            timings = []
+            for i in range(rounds):
+                start = time.perf_counter()
+                agent.chat(queries[i % len(queries)])
+                timings.append((time.perf_counter() - start) * 1000)
+                if agent.working.get_turn_count() >= 4:
+                    agent.working.reset()
+            for q in (50, 95, 99):
+                results[f"chat.{route}.p{q}_ms"] = metric(percentile(timings, q), "ms", noise=5.0)
+    return results
+
+
+def bench_answer_cache(llm_latency: float, rounds: int) -> dict:
+    """Factual chat() latency on a cold answer cache vs a warm one."""
+    results = {}
+    with sandbox():
+        agent = build_agent(llm=stub_gateway(latency=llm_latency))
+        for label in ("miss", "hit"):
+            timings = []
+            for i in range(rounds):
+                query = f"{ROUTE_QUERIES['factual'][i % len(ROUTE_QUERIES['factual'])]} ({i})"
+                start = time.perf_counter()
+                agent.chat(query)
+                timings.append((time.perf_counter() - start) * 1000)
+                agent.working.reset()
+            results[f"answer_cache.{label}.p50_ms"] = metric(percentile(timings, 50), "ms", noise=5.0)
+    return results
+
+
+def bench_new_conversation(llm_latency: float, rounds: int) -> dict:
+    """Cost of closing a conversation (reflection, storage, rule update)."""
+    timings = []
+    mode = config.CONSOLIDATION_MODE
+    config.CONSOLIDATION_MODE = "batch"  # keep consolidation out of this measurement
+    try:
+        with sandbox():
+            agent = build_agent(llm=stub_gateway(latency=llm_latency))
+            rng = random.Random(0)
+            for _ in range(rounds):
+                agent.chat(rng.choice(ROUTE_QUERIES["factual"]))
+                start = time.perf_counter()
+                agent.new_conversation()
+                timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        config.CONSOLIDATION_MODE = mode
+    return {
+        "new_conversation.p50_ms": metric(percentile(timings, 50), "ms", noise=5.0),
+        "new_conversation.p95_ms": metric(percentile(timings, 95), "ms", noise=5.0),
+    }
+
+
+def bench_rolling_reflection(turns: int = 26, rounds: int = 5, llm_latency: float = 0.02) -> dict:
+    """Closing long conversations: one reflection over the whole transcript at close
+    vs the rolling reflection (ROLLING_REFLECTION_TURNS), which leaves at most a
+    few turns to fold in. Reports close latency and reflect input tokens per close.
+    """
+    results = {}
+    every, mode = config.ROLLING_REFLECTION_TURNS, config.CONSOLIDATION_MODE
+    config.CONSOLIDATION_MODE = "batch"
+    try:
+        for name, setting in (("once", 0), ("rolling", every or 4)):
+            config.ROLLING_REFLECTION_TURNS = setting
+            timings, tokens = [], []
+            rng = random.Random(0)
+            with sandbox():
+                agent = build_agent(llm=stub_gateway(latency=llm_latency))
+                for _ in range(rounds):
+                    for query in synthetic_conversation(rng, turns=turns):
+                        agent.chat(query)
+                    tracer.reset()
+                    start = time.perf_counter()
+                    agent.new_conversation()
+                    timings.append((time.perf_counter() - start) * 1000)
+                    tokens.append(tracer.snapshot()["tokens"].get("reflect", {}).get("input_tokens", 0))
+            results[f"reflection.{name}.close_p50_ms"] = metric(percentile(timings, 50), "ms", noise=10.0)
+            results[f"reflection.{name}.close_reflect_tokens"] = metric(max(tokens), "tokens", noise=20.0)
+    finally:
+        config.ROLLING_REFLECTION_TURNS, config.CONSOLIDATION_MODE = every, mode
+    return results
+
+
+def bench_context_budget(turns: int = 80, paragraphs: int = 3) -> dict:
+    """One long conversation (each message pastes a few corpus paragraphs) with
+    and without CONTEXT_BUDGET_TOKENS: largest answer-call input and chat p50.
+    """
+    results = {}
+    budget = config.CONTEXT_BUDGET_TOKENS
+    try:
+        for name, setting in (("unbounded", 0), ("budgeted", budget or 16000)):
+            config.CONTEXT_BUDGET_TOKENS = setting
+            rng = random.Random(0)
+            timings, tokens = [], []
+            with sandbox():
+                agent = build_agent(llm=stub_gateway(latency=0.0))
+                for query in synthetic_conversation(rng, turns=turns):
+                    pasted = synthetic_document(paragraphs, seed=rng.randrange(1 << 30))
+                    tracer.reset()
+                    start = time.perf_counter()
+                    agent.chat(f"{pasted}\n\n{query}")
+                    timings.append((time.perf_counter() - start) * 1000)
+                    tokens.append(tracer.snapshot()["tokens"]["answer"]["input_tokens"])
+            results[f"context_budget.{name}.max_answer_input_tokens"] = metric(max(tokens), "tokens", noise=50.0)
+            results[f"context_budget.{name}.chat_p50_ms"] = metric(percentile(timings, 50), "ms", noise=5.0)
+    finally:
+        config.CONTEXT_BUDGET_TOKENS = budget
+    return results
+
+
+def bench_chat_many(llm_latency: float = 0.1) -> dict:
+    """An evaluation set answered the notebook way (reset + chat per question)
+    vs in one chat_many call: 12 questions to a semantic_only agent and 10
+    mixed-route questions to a full agent with a few past conversations.
+    """
+    factual = ROUTE_QUERIES["factual"]
+    question_sets = {
+        "semantic_12": ("semantic_only", [f"{factual[i % len(factual)]} ({i})" for i in range(12)]),
+        "full_10": ("full", [query for route in ROUTE_QUERIES.values() for query in route][:10]),
+    }
+    results = {}
+    for label, (mode, queries) in question_sets.items():
+        with sandbox():
+            agent = build_agent(llm=stub_gateway(latency=llm_latency), mode=mode)
+            if mode == "full":
+                for query in ROUTE_QUERIES["factual"]:
+                    agent.chat(query)
+                    agent.new_conversation()
+            start = time.perf_counter()
+            for query in queries:
+                agent.working.reset()
+                agent.chat(query)
+            loop = time.perf_counter() - start
+            agent.working.reset()
+            agent.semantic.answers.clear()
+            start = time.perf_counter()
+            agent.chat_many(queries)
+            batch = time.perf_counter() - start
+        results[f"chat_many.{label}.loop_s"] = metric(loop, "s", noise=0.2)
+        results[f"chat_many.{label}.batch_s"] = metric(batch, "s", noise=0.2)
+    return results
+
+
+def bench_model_tiers(conversations: int = 10, main_latency: float = 0.02,
+                      auxiliary_latency: float = 0.008, malformed: float = 0.05) -> dict:
+    """LLM time and cost per conversation with every call on MODEL_NAME vs LLM_TASKS tiers.
+
+    Each conversation is three chats and a close (conflict checks, reflection,
+    rule update); a consolidation pass follows. The stub answers slower and
+    costlier on the main model, and `malformed` of the small model's JSON
+    replies do not parse, so the tiered run includes its fallbacks.
+    """
+    results = {}
+    tasks, mode = config.LLM_TASKS, config.CONSOLIDATION_MODE
+    tiers = {
+        "single": {p: {**t, "model": config.MODEL_NAME} for p, t in tasks.items()},
+        "tiered": tasks,
+    }
+    config.CONSOLIDATION_MODE = "batch"  # consolidation runs once, explicitly
+    try:
+        for tier, tier_tasks in tiers.items():
+            config.LLM_TASKS = tier_tasks
+            llm = stub_gateway(
+                latency=main_latency,
+                model_latency={config.AUXILIARY_MODEL_NAME: auxiliary_latency},
+                malformed={config.AUXILIARY_MODEL_NAME: malformed},
+            )
+            rng = random.Random(0)
+            with sandbox():
+                agent = build_agent(llm=llm)
+                start = time.perf_counter()
+                for _ in range(conversations):
+                    for query in synthetic_conversation(rng):
+                        agent.chat(query)
+                    agent.new_conversation()
+                agent.consolidation.run()
+                elapsed = time.perf_counter() - start
+            cost = sum(
+                (tokens_in * MODEL_PRICES.get(model, max(MODEL_PRICES.values()))[0]
+                 + tokens_out * MODEL_PRICES.get(model, max(MODEL_PRICES.values()))[1]) / 1e6
+                for model, (_, tokens_in, tokens_out) in llm.client.usage_by_model.items()
+            )
+            results[f"tiers.{tier}.ms_per_conversation"] = metric(
+                elapsed * 1000 / conversations, "ms", noise=10.0
+            )
+            results[f"tiers.{tier}.usd_per_1k_conversations"] = metric(
+                cost * 1000 / conversations, "USD", noise=0.05
+            )
+            if tier == "tiered":
+                auxiliary_calls = llm.client.usage_by_model.get(config.AUXILIARY_MODEL_NAME, [0])[0]
+                results["tiers.tiered.fallback_rate"] = metric(
+                    llm.fallbacks / max(auxiliary_calls, 1), "ratio", noise=0.05
+                )
+    finally:
+        config.LLM_TASKS, config.CONSOLIDATION_MODE = tasks, mode
+    return results
+
+
+def bench_store_many(llm_latency: float, n: int) -> dict:
+    """Bulk episode import: store() per conversation vs one store_many()."""
+    rng = random.Random(0)
+    conversations = [
+        "\n\n".join(f"User: {q}\n\nAssistant: Stub answer." for q in synthetic_conversation(rng))
+        for _ in range(n)
+    ]
+    results = {}
+    for name in ("store", "store_many"):
+        with sandbox():
+            db = chromadb.PersistentClient(path=os.path.abspath("chroma_db"))
+            episodic = EpisodicMemory(
+                client=db, llm=stub_gateway(latency=llm_latency),
+                embedding_function=HashEmbeddingFunction(),
+            )
+            start = time.perf_counter()
+            if name == "store":
+                for conversation in conversations:
+                    episodic.store(conversation)
+            else:
+                episodic.store_many(conversations)
+            elapsed = time.perf_counter() - start
+        results[f"import.{name}.conversations_per_s"] = metric(n / elapsed, "conv/s", better="higher")
+    return results
+
+
+def bench_ingest(paragraphs: int) -> dict:
+    """Chunking + embedding + insertion throughput for semantic memory."""
+    text = synthetic_document(paragraphs)
+    with sandbox():
+        db = chromadb.PersistentClient(path=os.path.abspath("chroma_db"))
+        semantic = SemanticMemory(client=db, embedding_function=HashEmbeddingFunction())
+        start = time.perf_counter()
+        n_chunks = semantic.ingest_text(text, source="bench.pdf")
+        elapsed = time.perf_counter() - start
+
+        # Peak memory of chunking a 2,000-page document streamed page by page
+        tracemalloc.start()
+        for _ in semantic.iter_chunks(synthetic_pages(2000)):
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        "ingest.chunks_per_s": metric(n_chunks / elapsed, "chunks/s", better="higher"),
+        "ingest.mb_per_s": metric(len(text) / 1e6 / elapsed, "MB/s", better="higher"),
+        "ingest.stream_2000_pages.peak_kb": metric(peak / 1024, "KB", noise=64),
+    }
+
+
+def bench_consolidation(sizes: list[int]) -> dict:
+    """Consolidation.run wall time, and the scheduler's duplicate sampling, as the store grows."""
+    results = {}
+    for n in sizes:
+        with sandbox():
+            db = chromadb.PersistentClient(path=os.path.abspath("chroma_db"))
+            llm = stub_gateway(latency=0.0)
+            episodic = EpisodicMemory(client=db, llm=llm, embedding_function=HashEmbeddingFunction())
+            procedural = ProceduralMemory(llm=llm)
+            seed_episodes(episodic, n)
+            consolidation = Consolidation(episodic, procedural, llm=llm)
+            scheduler = ConsolidationScheduler(consolidation)
+            start = time.perf_counter()
+            scheduler.duplicate_rate()
+            sampled = time.perf_counter() - start
+            start = time.perf_counter()
+            consolidation.run()
+            elapsed = time.perf_counter() - start
+        results[f"scheduler.duplicate_rate.n{n}.ms"] = metric(sampled * 1000, "ms", noise=2.0)
+        results[f"consolidation.n{n}.s"] = metric(elapsed, "s", noise=0.2)
+    return results
+
+
+def compare(results: dict, baselines: dict, tolerance: float) -> list[str]:
+    """Return a description of every metric that regressed beyond tolerance."""
+    regressions = []
+    for name, current in results.items():
+        base = baselines.get(name)
+        if not base or not base["value"]:
+            continue
+        if abs(current["value"] - base["value"]) <= current.get("noise", 0.0):
+            continue
+        ratio = current["value"] / base["value"]
+        worse = ratio > 1 + tolerance if current["better"] == "lower" else ratio < 1 - tolerance
+        if worse:
+            regressions.append(
+                f"{name}: {current['value']} {current['unit']} vs baseline {base['value']} ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite")
+    parser.add_argument("--full", action="store_true", help="include 10k-episode consolidation")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="stub LLM latency in seconds")
+    parser.add_argument("--rounds", type=int, default=30, help="chat calls per route")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression ratio")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", help="also write results to this JSON file")
+    args = parser.parse_args()
+
+    sizes = [10, 100, 1000] + ([10000] if args.full else [])
+
+    results = {}
+    print("chat latency per route...")
+    results.update(bench_chat(args.llm_latency, args.rounds))
+    print("answer cache...")
+    results.update(bench_answer_cache(llm_latency=0.02, rounds=20))
+    print("new_conversation cost...")
+    results.update(bench_new_conversation(args.llm_latency, rounds=10))
+    print("rolling reflection...")
+    results.update(bench_rolling_reflection())
+    print("context budget...")
+    results.update(bench_context_budget())
+    print("chat_many vs a chat loop...")
+    results.update(bench_chat_many())
+    print("model tiers...")
+    results.update(bench_model_tiers())
+    print("episode import throughput...")
+    results.update(bench_store_many(args.llm_latency, n=200))
+    print("ingest throughput...")
+    results.update(bench_ingest(paragraphs=2000))
+    print(f"consolidation scaling {sizes}...")
+    results.update(bench_consolidation(sizes))
+
+    print()
+    for name, m in results.items():
+        print(f"  {name:40s} {m['value']:>12} {m['unit']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        baselines = {}
+        if os.path.exists(BASELINES):
+            with open(BASELINES) as f:
+                baselines = json.load(f)
+        baselines.update(results)
+        with open(BASELINES, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"\nBaseline updated: {BASELINES}")
+        return
+
+    if not os.path.exists(BASELINES):
+        print("\nNo baseline recorded yet (run with --update-baseline).")
+        return
+    with open(BASELINES) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Shared workload helpers for the offline benchmarks: corpus, queries, sandboxes."""
+
+import ast
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+import chromadb
+from chromadb.api.client import SharedSystemClient
+
+from agent import CognitiveAgent
+from benchmarks.fakes import HashEmbeddingFunction, stub_gateway
+from memory.semantic import SemanticMemory
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+GENERATE_PDF = os.path.join(ROOT, "scripts", "generate_pdf.py")
+
+# Queries per retrieval route (see CognitiveAgent._classify_query)
+ROUTE_QUERIES = {
+    "factual": [
+        "What is the operating temperature of the QA-7?",
+        "How many employees does Zeltron have?",
+        "What is the Zeltron stock ticker?",
+        "Tell me about the Reykjavik Incident",
+    ],
+    "personal": [
+        "Do you remember what we discussed about the QA-7?",
+        "What did I mention last time about my budget?",
+    ],
+    "behavioral": [
+        "How should I deploy the QA-7 in a data center?",
+        "What do you suggest for a fintech startup evaluating Zeltron?",
+    ],
+    "default": [
+        "Zeltron resonator pricing for a small lab",
+        "Compare WaveLogic and Zeltron for cryptanalysis workloads",
+    ],
+}
+
+# Topics used to synthesize episodic memories that cluster realistically
+EPISODE_TOPICS = [
+    "QA-7 operating temperature and thermal drift",
+    "Zeltron competitors WaveLogic AcoustiQ and NovaSonic",
+    "Zeltron employee ranks and office locations",
+    "budget planning for a QA-7 purchase",
+    "NATO compliance requirements for acoustic processors",
+    "fintech latency requirements and resonator counts",
+    "the 2024 Reykjavik Incident and its root cause",
+    "Solvik Temperature and crystalline substrates",
+    "quantum-acoustic computing fundamentals",
+    "Zeltron stock performance and the ZLTN ticker",
+]
+
+
+def zeltron_corpus() -> list[str]:
+    """Paragraphs of the Zeltron manual, read from scripts/generate_pdf.py.
+
+    The script is parsed (not imported) so fpdf is not required.
+    """
+    with open(GENERATE_PDF, "r") as f:
+        tree = ast.parse(f.read())
+    paragraphs = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            if node.value.startswith(("Generate", "Run:")):
+                continue  # module docstring
+            for paragraph in node.value.split("\n\n"):
+                if len(paragraph.strip()) > 60:
+                    paragraphs.append(paragraph.strip())
+    return paragraphs
+
+
+def synthetic_document(n_paragraphs: int, seed: int = 0) -> str:
+    """A document of arbitrary length built by resampling the Zeltron corpus."""
+    rng = random.Random(seed)
+    corpus = zeltron_corpus()
+    return "\n\n".join(rng.choice(corpus) for _ in range(n_paragraphs))
+
+
+def synthetic_pages(n_pages: int, paragraphs_per_page: int = 6, seed: int = 0):
+    """Lazily yield (text, page_number) pairs, like a streamed PDF."""
+    rng = random.Random(seed)
+    corpus = zeltron_corpus()
+    for page in range(1, n_pages + 1):
+        yield "\n\n".join(rng.choice(corpus) for _ in range(paragraphs_per_page)), page
+
+
+def synthetic_episode(rng: random.Random) -> dict:
+    """One episodic memory about a random topic, with small wording variations."""
+    topic = rng.choice(EPISODE_TOPICS)
+    angle = rng.choice(["asked about", "compared options for", "needed details on", "revisited"])
+    summary = f"The user {angle} {topic}."
+    return {
+        "summary": summary,
+        "what_worked": rng.choice(["Citing the manual", "Giving exact figures", "N/A"]),
+        "what_to_avoid": rng.choice(["Speculating beyond the manual", "N/A"]),
+        "context_tags": ",".join(topic.split()[:3]),
+    }
+
+
+def seed_episodes(episodic, n: int, seed: int = 0, batch_size: int = 1000):
+    """Insert n synthetic episodes directly (no LLM reflection)."""
+    rng = random.Random(seed)
+    now = time.time()
+    for start in range(0, n, batch_size):
+        ids, docs, metas = [], [], []
+        for i in range(start, min(start + batch_size, n)):
+            ep = synthetic_episode(rng)
+            ids.append(f"episode_seed_{i}")
+            docs.append(
+                f"Summary: {ep['summary']}\n"
+                f"What worked: {ep['what_worked']}\n"
+                f"What to avoid: {ep['what_to_avoid']}"
+            )
+            metas.append({**ep, "timestamp": now - rng.uniform(0, 30 * 24 * 3600)})
+        episodic.add(ids, docs, metas)
+
+
+def synthetic_conversation(rng: random.Random, turns: int = 3) -> list[str]:
+    """User messages for one conversation, mixing routes the way real traffic does."""
+    routes = list(ROUTE_QUERIES)
+    return [rng.choice(ROUTE_QUERIES[rng.choice(routes)]) for _ in range(turns)]
+
+
+# Question templates per route for corpus-derived traffic (see corpus_conversation)
+CORPUS_TEMPLATES = {
+    "factual": ["Tell me about {term}", "What is {term}?", "Explain {term} in detail"],
+    "personal": ["Do you remember what we discussed about {term}?", "Last time I mentioned {term}"],
+    "behavioral": ["How should I evaluate {term} for my team?", "What do you suggest regarding {term}?"],
+    "default": ["{term} versus the alternatives", "Thoughts on {term} for a small lab"],
+}
+
+
+def corpus_terms() -> list[str]:
+    """Distinct capitalized names and phrases that occur in the Zeltron corpus."""
+    terms = set()
+    for paragraph in zeltron_corpus():
+        for match in re.finditer(r"\b[A-Z][\w-]+(?: [A-Z][\w-]+)*", paragraph):
+            term = match.group()
+            # Keep names (multi-word, or with inner capitals/digits), not sentence starts
+            if " " in term or re.search(r"[A-Z0-9-]", term[1:]):
+                terms.add(term)
+    return sorted(terms)
+
+
+def corpus_conversation(rng: random.Random, terms: list[str], turns: int = 3) -> list[str]:
+    """User messages about one corpus topic, on randomly chosen routes.
+
+    Unlike synthetic_conversation the vocabulary is open-ended, so episodes
+    and retrievals spread across the whole manual.
+    """
+    term = rng.choice(terms)
+    return [
+        rng.choice(CORPUS_TEMPLATES[rng.choice(list(CORPUS_TEMPLATES))]).format(term=term)
+        for _ in range(turns)
+    ]
+
+
+@contextmanager
+def sandbox():
+    """Run inside a fresh temporary directory so all relative store paths are isolated."""
+    previous = os.getcwd()
+    path = tempfile.mkdtemp(prefix="cma-bench-")
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        # Chroma caches one system per path; drop it so the next sandbox starts clean
+        SharedSystemClient.clear_system_cache()
+        os.chdir(previous)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def build_agent(llm=None, mode: str = "full", corpus_paragraphs: int = 40, **agent_kwargs):
+    """Create an offline agent in the current directory with the Zeltron corpus ingested."""
+    db = chromadb.PersistentClient(path=os.path.abspath("chroma_db"))
+    embedding_function = HashEmbeddingFunction()
+    llm = llm or stub_gateway(latency=0.0)
+    semantic = SemanticMemory(client=db, embedding_function=embedding_function)
+    if corpus_paragraphs and semantic.collection.count() == 0:
+        semantic.ingest_text(synthetic_document(corpus_paragraphs), source="zeltron_manual.pdf")
+    return CognitiveAgent(
+        mode=mode,
+        semantic=semantic,
+        db=db,
+        llm=llm,
+        embedding_function=embedding_function,
+        **agent_kwargs,
+    )
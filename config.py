@@ -5,27 +5,131 @@ ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
 MODEL_NAME = "claude-sonnet-4-20250514"
 TEMPERATURE = 0.7
 MAX_TOKENS = 1024
+AUXILIARY_MODEL_NAME = "claude-haiku-4-5-20251001"  # small, fast model for auxiliary calls
+
+# Per-purpose call settings (memory.llm.task_params). Purposes not listed use
+# MODEL_NAME; set an entry's model to MODEL_NAME to take it off the small model.
+LLM_TASKS = {
+    "answer":   {"model": MODEL_NAME, "max_tokens": MAX_TOKENS, "temperature": TEMPERATURE},
+    "conflict": {"model": AUXILIARY_MODEL_NAME, "max_tokens": 150, "temperature": 0.0},
+    "reflect":  {"model": AUXILIARY_MODEL_NAME, "max_tokens": 512, "temperature": 0.3},
+    "rules":    {"model": AUXILIARY_MODEL_NAME, "max_tokens": 1024, "temperature": 0.3},
+    "merge":    {"model": AUXILIARY_MODEL_NAME, "max_tokens": 512, "temperature": 0.3},
+    "promote":  {"model": AUXILIARY_MODEL_NAME, "max_tokens": 512, "temperature": 0.3},
+}
+LLM_JSON_FALLBACK = True  # re-ask MODEL_NAME when another model fails or its JSON reply does not parse
+
+# LLM gateway (memory/llm.py) - set the rates to match your API tier
+LLM_REQUESTS_PER_MINUTE = 50
+LLM_TOKENS_PER_MINUTE = 80000
+LLM_MAX_IN_FLIGHT = 8             # concurrent LLM calls across the process
+LLM_BACKGROUND_SHARE = 0.5        # share of concurrency/rate budget background calls may use
+LLM_MAX_RETRIES = 5
+LLM_RETRY_BASE_SECONDS = 1.0
+LLM_RETRY_MAX_SECONDS = 30.0
+LLM_CACHE_SIZE = 512              # cached deterministic (temperature-0) responses
 
 # ChromaDB
 CHROMA_PERSIST_DIR = "./chroma_db"
+CHROMA_MODE = os.getenv("CHROMA_MODE", "embedded")  # "embedded" (one process) or "http" (workers.py)
+CHROMA_HOST = os.getenv("CHROMA_HOST", "127.0.0.1")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+VECTOR_BACKEND = "auto"         # "chroma", "flat" (exact in-process NumPy index) or "auto" (see memory/vectorstore.py)
+FLAT_INDEX_MAX_ITEMS = 1000     # auto: a store moves from flat to Chroma once it grows past this
+FLAT_INDEX_DIR = "./flat_index"
+
+# HNSW index profiles - applied when a collection is created; change an existing
+# one with scripts/migrate_index.py. Tune with python -m benchmarks.index_tuning.
+HNSW_PROFILES = {
+    "small": {"M": 8, "construction_ef": 64, "search_ef": 32},       # < ~5k vectors, least memory
+    "default": {"M": 16, "construction_ef": 100, "search_ef": 100},  # Chroma's defaults
+    "latency": {"M": 12, "construction_ef": 128, "search_ef": 40},   # fastest queries at scale
+    "recall": {"M": 32, "construction_ef": 400, "search_ef": 200},   # large stores, best recall
+}
+SEMANTIC_INDEX_PROFILE = "default"
+EPISODIC_INDEX_PROFILE = "default"
 
 # Semantic memory
 CHUNK_SIZE = 800
 CHUNK_OVERLAP = 100
 SEMANTIC_TOP_K = 10
+INGEST_BATCH_SIZE = 256         # chunks embedded and added per collection.add
+INGEST_WINDOW_CHUNKS = 4        # streaming splitter window, in chunks
+INGEST_WATCH_ENABLED = False    # server/workers/CLI: ingest new or changed PDFs in ./data in the background
+INGEST_WATCH_POLL_SECONDS = 5.0  # rescan interval (the only trigger where inotify is unavailable)
+INGEST_WATCH_SETTLE_SECONDS = 2.0  # skip files modified more recently than this (still being copied)
+INGEST_WATCH_BATCH_FILES = 4    # files taken off the watcher queue per step (each streams in by INGEST_BATCH_SIZE)
+ANSWER_CACHE_SIZE = 1000        # cached factual/semantic_only replies (0 disables)
+ANSWER_CACHE_PATH = "./answer_cache.jsonl"  # persisted across restarts ("" for memory only)
 
 # Episodic memory
 EPISODIC_TOP_K = 3
 RECENCY_HALF_LIFE_HOURS = 72
+EPISODIC_CAPACITY = 2000        # max episodes in the hot index per namespace (0 = unlimited)
+EVICTION_LOW_WATER = 0.9        # evict down to this fraction of capacity
+EVICTION_WEIGHTS = {"recency": 0.5, "frequency": 0.3, "consolidated": 0.2}
+EPISODIC_ARCHIVE_DIR = "./episodic_archive"
+REFLECTION_BATCH_TOKENS = 12000  # input budget for one packed store_many reflection prompt
+REFLECTION_BATCH_MAX = 16       # max conversations per packed prompt
+EPISODIC_DEDUP_THRESHOLD = 0.95  # fold a new episode into its nearest neighbour above this similarity (>1 disables)
+ROLLING_REFLECTION_TURNS = 4    # fold new turns into the running reflection every this many turns (0 = reflect once at close)
+ROLLING_REFLECTION_IDLE_SECONDS = 60  # server: also fold pending turns once a session is idle this long
+EMBEDDING_MIRROR_DIR = "./embedding_mirror"
+EMBEDDING_MIRROR_DTYPE = "float32"  # or "int8" (4x smaller, ~1% similarity error)
 
 # Consolidation
 CONSOLIDATION_THRESHOLD = 0.70  # similarity threshold for merging
-CONSOLIDATION_EVERY_N = 5       # consolidate every N conversations
 PROMOTION_MIN_OCCURRENCES = 3   # promote pattern after N appearances
+CONSOLIDATION_TAG_BUCKETS = True  # only compare episodes that share a context tag when clustering
+CONSOLIDATION_MODE = "inline"   # "inline" (scheduled in-process) or "batch" (nightly job only)
+BATCH_DIR = "./batch_jobs"      # job and result files for batch consolidation
+BATCH_POLL_SECONDS = 30         # Message Batches status polling interval
+
+# Consolidation scheduler (memory/scheduler.py) - when inline consolidation runs
+SCHEDULER_DIR = "./scheduler"           # per-namespace scheduler state
+SCHEDULER_IDLE_SECONDS = 120            # only consolidate sessions idle at least this long (except growth)
+SCHEDULER_MIN_NEW_EPISODES = 5          # never run for fewer new episodes than this
+SCHEDULER_MAX_NEW_EPISODES = 50         # always run once this many have accumulated, idle or not
+SCHEDULER_MIN_DUPLICATE_RATE = 0.10     # run early if this share of sampled episodes has a near-duplicate
+SCHEDULER_SAMPLE_SIZE = 64              # episodes sampled to estimate the duplicate rate
+CONSOLIDATION_TIME_BUDGET_SECONDS = 60  # per scheduled run; unfinished work resumes next run
+CONSOLIDATION_TOKEN_BUDGET = 50000      # estimated LLM tokens per scheduled run
 
 # Procedural memory
 PROCEDURAL_MEMORY_FILE = "./procedural_memory.txt"
 MAX_PROCEDURAL_RULES = 15
+PROCEDURAL_SNAPSHOT_EVERY = 50  # compact the rule journal into a snapshot after N commits
+
+# Sessions (multi-tenant serving)
+SESSION_DIR = "./sessions"            # evicted working memory is parked here
+PROCEDURAL_DIR = "./procedural"       # per-user procedural rule files
+MAX_ACTIVE_SESSIONS = 1000            # LRU bound on sessions held in RAM
+SESSION_IDLE_SECONDS = 1800           # evict_idle() parks sessions idle this long
+
+# Server (server.py)
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+LLM_CONCURRENCY = 8            # max agent operations calling the LLM at once
+MAX_PENDING_REQUESTS = 256     # global queue bound - extra requests are rejected
+MAX_SESSION_QUEUE = 4          # per-session queue bound
+DRAIN_TIMEOUT_SECONDS = 30     # how long shutdown waits for in-flight requests
+SNAPSHOT_DIR = "./snapshots"   # the snapshot method writes only here, under a client-given file name
+
+# Multi-process workers (workers.py)
+WORKER_COUNT = 4               # agent worker processes behind the router
+WORKER_BASE_PORT = 8770        # workers listen on WORKER_BASE_PORT + i
+
+# Context budget (memory/budget.py) - caps the input of every answer call
+CONTEXT_BUDGET_TOKENS = 16000  # prompt + retrieved context + history (0 = unlimited)
+CONTEXT_BUDGET_WEIGHTS = {     # share of what the fixed parts leave, per route and section
+    "factual":    {"semantic": 0.6, "history": 0.3, "episodic": 0.05, "procedural": 0.05},
+    "personal":   {"episodic": 0.5, "history": 0.4, "semantic": 0.05, "procedural": 0.05},
+    "behavioral": {"procedural": 0.3, "semantic": 0.3, "episodic": 0.2, "history": 0.2},
+    "default":    {"semantic": 0.4, "history": 0.25, "episodic": 0.2, "procedural": 0.15},
+}
+
+# Batch chat (CognitiveAgent.chat_many)
+CHAT_MANY_CONCURRENCY = 8      # queries generated at once (the LLM gateway limits still apply)
 
 # Conflict detection
 CONFLICT_DETECTION_ENABLED = True
@@ -3,11 +3,14 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import config
 from agent import CognitiveAgent
+from memory.watcher import IngestWatcher
 
 
 def main():
     agent = CognitiveAgent()
+    watcher = IngestWatcher(agent.semantic).start() if config.INGEST_WATCH_ENABLED else None
 
     print("Cognitive Memory Agent")
     print("Commands: /new (new conversation), /ingest (reload docs), /sleep (consolidate), /quit (exit)")
@@ -23,8 +26,9 @@ def main():
             continue
 
         if user_input.lower() == "/quit":
-            # Save current conversation before exiting
+            # Save current conversation, then consolidate if due (the session is over)
             agent.new_conversation()
+            agent.maybe_consolidate(idle_seconds=0)
             break
 
         if user_input.lower() == "/new":
@@ -39,13 +43,17 @@ def main():
 
         if user_input.lower() == "/sleep":
             print("\n--- Running memory consolidation ---")
-            agent.consolidation.run()
-            print("--- Consolidation complete ---")
+            if agent.scheduler.run("manual"):
+                print("--- Consolidation complete ---")
+            else:
+                print("--- Consolidation paused at budget; /sleep again to resume ---")
             continue
 
         response = agent.chat(user_input)
         print(f"\nAgent: {response}")
 
+    if watcher is not None:
+        watcher.stop()
     print("\nGoodbye.")
 
 
@@ -0,0 +1,141 @@
+"""Answer cache - reuse replies whose inputs are fully determined by retrieval.
+
+For factual-routed turns (and every turn in semantic_only mode) the reply
+depends only on the system prompt, the conversation so far, the query and
+the retrieved chunks. answer_key() hashes exactly those inputs plus the
+generation settings, so a hit is a reply the model already gave to the same
+request. The chunk texts are part of the key, so answers about documents
+that were re-ingested with new content can never be served; ingestion also
+clears the cache outright.
+
+The conversation so far is part of the key as well, because the reply was
+generated with it. In practice that means hits come from the first turn of
+a conversation (the same opening question from another session or user, or
+after a restart); a follow-up only hits if the whole conversation repeats.
+
+Entries are kept in LRU order (ANSWER_CACHE_SIZE) and persisted as an
+append-only JSON-lines journal, compacted once it holds twice the bound.
+Several processes (workers.py) can share one journal: appends, compaction
+and clear() hold a file lock, and compaction rewrites what is on disk -
+every process's entries - rather than this process's view of it.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import config
+from memory.llm import task_params
+from memory.storage import file_lock
+
+
+def normalize_query(query: str) -> str:
+    """Case, whitespace and trailing punctuation do not change the question."""
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!. ").lower()
+
+
+def answer_key(query: str, chunk_ids: list[str], chunks: list[str], system: str,
+               history: list[dict]) -> str:
+    """Cache key for one answer request (see module docstring)."""
+    payload = {
+        "query": normalize_query(query),
+        "chunk_ids": chunk_ids,
+        "chunks": hashlib.sha256("\x00".join(chunks).encode("utf-8")).hexdigest(),
+        "system": system,
+        "history": history,
+        **task_params("answer"),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """Bounded, persistent key -> reply map. Thread-safe.
+
+    Args:
+        path: Journal file (ANSWER_CACHE_PATH if None). Empty string for memory only.
+        size: Max entries (ANSWER_CACHE_SIZE if None, 0 disables the cache).
+    """
+
+    def __init__(self, path: str = None, size: int = None):
+        self.path = config.ANSWER_CACHE_PATH if path is None else path
+        self.size = config.ANSWER_CACHE_SIZE if size is None else size
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._journal_len = 0
+        self.hits = 0
+        self.misses = 0
+        if self.path and self.size and os.path.exists(self.path):
+            self._entries, self._journal_len = self._read()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            reply = self._entries.get(key)
+            if reply is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return reply
+
+    def put(self, key: str, reply: str):
+        if not self.size:
+            return
+        with self._lock:
+            self._entries[key] = reply
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+            if not self.path:
+                return
+            with file_lock(self.path + ".lock"):
+                with open(self.path, "a") as f:
+                    f.write(json.dumps({"key": key, "reply": reply}) + "\n")
+                self._journal_len += 1
+                if self._journal_len >= 2 * self.size:
+                    self._compact()
+
+    def clear(self):
+        """Drop every entry (called when documents are ingested)."""
+        with self._lock:
+            self._entries.clear()
+            if self.path:
+                with file_lock(self.path + ".lock"):
+                    open(self.path, "w").close()
+                self._journal_len = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _read(self) -> tuple[OrderedDict, int]:
+        """The journal's live entries, least recently used first, and its line count."""
+        entries: OrderedDict[str, str] = OrderedDict()
+        lines = 0
+        with open(self.path, "r") as f:
+            for line in f:
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line from a crash
+                entries[entry["key"]] = entry["reply"]
+                entries.move_to_end(entry["key"])
+        while len(entries) > self.size:
+            entries.popitem(last=False)
+        return entries, lines
+
+    def _compact(self):
+        """Rewrite the journal with only the live entries, oldest first. Call under the file lock.
+
+        Entries are re-read first, so other processes' appends survive and
+        entries dropped by another process's clear() are not written back.
+        """
+        entries, _ = self._read()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for key, reply in entries.items():
+                f.write(json.dumps({"key": key, "reply": reply}) + "\n")
+        os.replace(tmp_path, self.path)
+        self._journal_len = len(entries)
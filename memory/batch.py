@@ -0,0 +1,204 @@
+"""Offline batch consolidation - collect, submit, apply.
+
+Nightly maintenance across many users runs in three stages instead of inline
+in new_conversation:
+
+1. collect_job: cluster every namespace and write all merge and promotion
+   requests to one JSONL job file.
+2. An executor runs the job: LocalBatchExecutor (through the LLM gateway, for
+   tests and small deployments) or AnthropicBatchExecutor (Message Batches API).
+3. apply_results: apply the replies. Safe to re-run - merged episodes get
+   deterministic ids and promoted rules are deduplicated.
+
+Note: promotion requests are built from the pre-merge episodes, since merges
+are only applied after the batch returns.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import config
+from memory.consolidation import Consolidation
+from memory.episodic import EpisodicMemory
+from memory.llm import LLMGateway, as_gateway, parse_json
+from memory.procedural import ProceduralMemory
+from memory.storage import open_client
+from memory.vectorstore import collection_names
+
+DEFAULT_NAMESPACE = ""  # the single-user collection and PROCEDURAL_MEMORY_FILE
+
+
+def list_namespaces(db) -> list[str]:
+    """All episodic namespaces in a ChromaDB client (DEFAULT_NAMESPACE for the unscoped one)."""
+    namespaces = []
+    for name in collection_names(db):
+        if name == "episodic_memory":
+            namespaces.append(DEFAULT_NAMESPACE)
+        elif name.startswith("episodic_memory_"):
+            namespaces.append(name[len("episodic_memory_"):])
+    return sorted(namespaces)
+
+
+def open_namespace(namespace: str, db, llm: LLMGateway = None, embedding_function=None) -> Consolidation:
+    """Build a Consolidation bound to one namespace's episodic and procedural stores."""
+    llm = as_gateway(llm)
+    procedural_path = None
+    if namespace:
+        procedural_path = os.path.join(config.PROCEDURAL_DIR, f"{namespace}.txt")
+    episodic = EpisodicMemory(
+        client=db, llm=llm, namespace=namespace or None, embedding_function=embedding_function
+    )
+    procedural = ProceduralMemory(llm=llm, path=procedural_path)
+    return Consolidation(episodic, procedural, llm=llm)
+
+
+def _custom_id(kind: str, namespace: str, episode_ids: list[str]) -> str:
+    """Deterministic id (Message Batches allow [a-zA-Z0-9_-]{1,64})."""
+    digest = hashlib.sha1(
+        json.dumps([kind, namespace, sorted(episode_ids)]).encode("utf-8")
+    ).hexdigest()[:24]
+    return f"{kind}_{digest}"
+
+
+def collect_job(consolidations: dict[str, Consolidation], job_path: str) -> int:
+    """Write every merge and promotion request across namespaces to a JSONL job file.
+
+    Returns the number of requests written.
+    """
+    count = 0
+    with open(job_path, "w") as f:
+        for namespace, consolidation in consolidations.items():
+            episodes = consolidation.episodic.get_all(embeddings=False)
+            if len(episodes) < 2:
+                continue
+            for cluster in consolidation.find_clusters():
+                ids = [ep["id"] for ep in cluster]
+                f.write(json.dumps({
+                    "custom_id": _custom_id("merge", namespace, ids),
+                    "kind": "merge",
+                    "namespace": namespace,
+                    "episode_ids": ids,
+                    "params": consolidation.merge_request(cluster),
+                }) + "\n")
+                count += 1
+
+            request = consolidation.promotion_request(episodes)
+            if request is not None:
+                ids = [ep["id"] for ep in episodes]
+                f.write(json.dumps({
+                    "custom_id": _custom_id("promote", namespace, ids),
+                    "kind": "promote",
+                    "namespace": namespace,
+                    "episode_ids": ids,
+                    "params": request,
+                }) + "\n")
+                count += 1
+    return count
+
+
+def read_jsonl(path: str) -> list[dict]:
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class LocalBatchExecutor:
+    """Runs a job through the LLM gateway, one request at a time (for tests)."""
+
+    def __init__(self, llm: LLMGateway = None):
+        self.llm = as_gateway(llm)
+
+    def run(self, job_path: str, results_path: str):
+        with open(results_path, "w") as out:
+            for request in read_jsonl(job_path):
+                try:
+                    response = self.llm.create(request["kind"], **request["params"])
+                    text = response.content[0].text
+                except Exception as e:
+                    print(f"  Request {request['custom_id']} failed: {type(e).__name__}: {e}")
+                    text = None
+                out.write(json.dumps({"custom_id": request["custom_id"], "text": text}) + "\n")
+
+
+class AnthropicBatchExecutor:
+    """Runs a job through the Anthropic Message Batches API and waits for it."""
+
+    def __init__(self, client=None, poll_seconds: float = config.BATCH_POLL_SECONDS):
+        self.client = client or as_gateway(None).client
+        self.poll_seconds = poll_seconds
+
+    def run(self, job_path: str, results_path: str):
+        requests = [
+            {"custom_id": r["custom_id"], "params": r["params"]} for r in read_jsonl(job_path)
+        ]
+        batch = self.client.messages.batches.create(requests=requests)
+        print(f"  Submitted batch {batch.id} ({len(requests)} requests)")
+        while batch.processing_status != "ended":
+            time.sleep(self.poll_seconds)
+            batch = self.client.messages.batches.retrieve(batch.id)
+
+        with open(results_path, "w") as out:
+            for entry in self.client.messages.batches.results(batch.id):
+                text = None
+                if entry.result.type == "succeeded":
+                    text = entry.result.message.content[0].text
+                out.write(json.dumps({"custom_id": entry.custom_id, "text": text}) + "\n")
+
+
+def apply_results(consolidations: dict[str, Consolidation], job_path: str, results_path: str) -> dict:
+    """Apply batch replies to each namespace. Safe to call more than once."""
+    requests = {r["custom_id"]: r for r in read_jsonl(job_path)}
+    stats = {"merged": 0, "promoted": 0, "skipped": 0, "failed": 0}
+
+    for result in read_jsonl(results_path):
+        request = requests.get(result["custom_id"])
+        consolidation = consolidations.get(request["namespace"]) if request else None
+        if consolidation is None or result["text"] is None:
+            stats["failed"] += 1
+            continue
+        try:
+            parsed = parse_json(result["text"])
+        except (json.JSONDecodeError, IndexError):
+            stats["failed"] += 1
+            continue
+
+        if request["kind"] == "merge":
+            if not isinstance(parsed, dict):
+                stats["failed"] += 1
+            elif consolidation.apply_merge(
+                request["episode_ids"], parsed, merged_id=f"consolidated_{request['custom_id']}"
+            ):
+                stats["merged"] += 1
+            else:
+                stats["skipped"] += 1  # episodes changed since the job was collected
+        else:
+            stats["promoted"] += consolidation.apply_promotion(parsed)
+    return stats
+
+
+def run_batch_consolidation(
+    executor,
+    work_dir: str = config.BATCH_DIR,
+    db=None,
+    llm: LLMGateway = None,
+    embedding_function=None,
+) -> dict:
+    """Collect, execute and apply one batch consolidation over every namespace."""
+    db = db or open_client()
+    os.makedirs(work_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    job_path = os.path.join(work_dir, f"consolidation-{stamp}.jsonl")
+    results_path = os.path.join(work_dir, f"consolidation-{stamp}.results.jsonl")
+
+    consolidations = {
+        ns: open_namespace(ns, db, llm=llm, embedding_function=embedding_function)
+        for ns in list_namespaces(db)
+    }
+    n_requests = collect_job(consolidations, job_path)
+    print(f"  Collected {n_requests} requests from {len(consolidations)} namespaces -> {job_path}")
+    if not n_requests:
+        return {"merged": 0, "promoted": 0, "skipped": 0, "failed": 0}
+
+    executor.run(job_path, results_path)
+    return apply_results(consolidations, job_path, results_path)
@@ -0,0 +1,68 @@
+"""Context budget - fits the sections of a turn's prompt into an input-token budget.
+
+A turn sends the base system prompt, recalled episodes, procedural rules, an
+optional conflict notice, retrieved chunks, the conversation so far and the
+new message. The base prompt, the conflict notice, the new message and the
+headers of non-empty sections are always sent. What is left of
+CONTEXT_BUDGET_TOKENS is split between episodes, rules, chunks and history by
+the route's weights (CONTEXT_BUDGET_WEIGHTS); a section that needs less than
+its share passes the rest on to the others.
+
+Items arrive most valuable first - episodes by recall score, rules in their
+ranked order, chunks by similarity, conversation turns newest first - and
+each section keeps a prefix, so the lowest-value items are the ones dropped.
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (4 characters per token, like LLMGateway.estimate_tokens)."""
+    return (len(text) + 3) // 4
+
+
+def allocate(budget: int, weights: dict[str, float], sections: dict[str, list[int]],
+             reserved: int = 0) -> dict[str, int]:
+    """How many leading items of each section fit in the budget.
+
+    Args:
+        budget: Total input tokens.
+        weights: Relative share per section name (need not sum to 1; missing
+            sections only get space left over by the others).
+        sections: Token cost of each item, most valuable first.
+        reserved: Tokens taken by content that is always sent.
+    """
+    available = max(0, budget - reserved)
+    demand = {name: sum(costs) for name, costs in sections.items()}
+    share = dict.fromkeys(sections, 0.0)
+
+    # Weighted split; sections needing less than their share return the rest
+    active = {name for name in sections if demand[name] and weights.get(name, 0) > 0}
+    remaining = float(available)
+    while active and remaining > 0:
+        total = sum(weights[name] for name in active)
+        grants = {name: remaining * weights[name] / total for name in active}
+        satisfied = {name for name in active if grants[name] >= demand[name]}
+        if not satisfied:
+            share.update(grants)
+            break
+        for name in satisfied:
+            share[name] = demand[name]
+            remaining -= demand[name]
+        active -= satisfied
+
+    kept, used = {}, 0
+    for name, costs in sections.items():
+        count = spent = 0
+        while count < len(costs) and spent + costs[count] <= share[name]:
+            spent += costs[count]
+            count += 1
+        kept[name] = count
+        used += spent
+
+    # Whole items rarely fill a share exactly; offer the slack, highest weight first
+    slack = available - used
+    for name in sorted(sections, key=lambda name: -weights.get(name, 0)):
+        costs = sections[name]
+        while kept[name] < len(costs) and costs[kept[name]] <= slack:
+            slack -= costs[kept[name]]
+            kept[name] += 1
+    return kept
@@ -1,11 +1,14 @@
 """Memory consolidation - periodic sleep phase that merges, compresses, and promotes."""
 
-import json
+import time
 import numpy as np
-from anthropic import Anthropic
 import config
 from memory.episodic import EpisodicMemory
+from memory.llm import LLMGateway, as_gateway, task_params
 from memory.procedural import ProceduralMemory
+from memory.tags import split_tags
+from memory.tracing import tracer
+from memory.vectorstore import promotion_deferred
 
 
 MERGE_PROMPT = """You are a memory consolidation system. Multiple episodic memories cover overlapping topics. Merge them into ONE unified memory that preserves all unique information.
@@ -50,69 +53,184 @@ def cosine_similarity(a: list[float], b: list[float]) -> float:
     return dot / norm if norm > 0 else 0.0
 
 
-def cluster_episodes(episodes: list[dict], threshold: float) -> list[list[dict]]:
-    """Group episodes by embedding similarity using simple greedy clustering."""
-    if not episodes or episodes[0].get("embedding") is None:
-        return [[ep] for ep in episodes]
-
-    used = set()
+def cluster_vectors(vectors: np.ndarray, threshold: float,
+                    buckets: list[list[int]] = None) -> list[list[int]]:
+    """Greedy clustering by cosine similarity over a (n, dim) matrix.
+
+    Each unassigned row in order seeds a cluster and absorbs every other
+    unassigned row within the threshold. With buckets (lists of row indexes,
+    e.g. one per tag) a row is only compared with rows sharing a bucket.
+    Returns lists of row indexes.
+    """
+    norms = np.linalg.norm(vectors, axis=1)
+    unit = np.divide(vectors, norms[:, None], out=np.zeros(vectors.shape, np.float32),
+                     where=norms[:, None] > 0)
+    unused = np.ones(len(unit), dtype=bool)
+    if buckets is not None:
+        buckets = [np.asarray(rows, dtype=np.int64) for rows in buckets]
+        member_of = [[] for _ in range(len(unit))]
+        for b, rows in enumerate(buckets):
+            for row in rows:
+                member_of[row].append(b)
     clusters = []
-
-    for i, ep_a in enumerate(episodes):
-        if i in used:
+    for i in range(len(unit)):
+        if not unused[i]:
             continue
-        cluster = [ep_a]
-        used.add(i)
+        unused[i] = False
+        if buckets is None:
+            candidates = np.flatnonzero(unused)
+        elif member_of[i]:
+            rows = np.unique(np.concatenate([buckets[b] for b in member_of[i]]))
+            candidates = rows[unused[rows]]
+        else:
+            candidates = np.zeros(0, dtype=np.int64)
+        members = candidates[unit[candidates] @ unit[i] >= threshold]
+        unused[members] = False
+        clusters.append([i, *members.tolist()])
+    return clusters
 
-        for j, ep_b in enumerate(episodes):
-            if j in used:
-                continue
-            sim = cosine_similarity(ep_a["embedding"], ep_b["embedding"])
-            if sim >= threshold:
-                cluster.append(ep_b)
-                used.add(j)
 
-        clusters.append(cluster)
+def tag_buckets(tags: list[tuple[str, ...]]) -> list[list[int]]:
+    """Row indexes per tag; untagged rows share one bucket."""
+    buckets: dict[str, list[int]] = {}
+    for row, row_tags in enumerate(tags):
+        for tag in row_tags or ("",):
+            buckets.setdefault(tag, []).append(row)
+    return list(buckets.values())
 
-    return clusters
+
+def cluster_episodes(episodes: list[dict], threshold: float, by_tags: bool = False) -> list[list[dict]]:
+    """Group episodes by embedding similarity using simple greedy clustering.
+
+    With by_tags, only episodes that share a context tag are compared.
+    """
+    if not episodes or episodes[0].get("embedding") is None:
+        return [[ep] for ep in episodes]
+
+    vectors = np.array([ep["embedding"] for ep in episodes], dtype=np.float32)
+    buckets = None
+    if by_tags:
+        buckets = tag_buckets([split_tags(ep["metadata"].get("context_tags", "")) for ep in episodes])
+    return [[episodes[i] for i in cluster] for cluster in cluster_vectors(vectors, threshold, buckets)]
+
+
+class _Budget:
+    """Per-run allowance of wall time and estimated LLM tokens (None = unlimited).
+
+    The first request of a run is always allowed, so a single oversized
+    cluster cannot stall consolidation forever.
+    """
+
+    def __init__(self, seconds: float = None, tokens: int = None):
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.tokens = tokens
+        self.spent = 0
+
+    def spend(self, request: dict) -> bool:
+        """Reserve a request's estimated cost; False if it does not fit."""
+        cost = LLMGateway.estimate_tokens(request)
+        if self.spent:
+            if self.deadline is not None and time.monotonic() > self.deadline:
+                return False
+            if self.tokens is not None and self.spent + cost > self.tokens:
+                return False
+        self.spent += cost
+        return True
 
 
 class Consolidation:
     """Periodic memory consolidation - merge similar episodes and promote patterns."""
 
-    def __init__(self, episodic: EpisodicMemory, procedural: ProceduralMemory):
+    def __init__(
+        self, episodic: EpisodicMemory, procedural: ProceduralMemory, llm: LLMGateway = None
+    ):
         self.episodic = episodic
         self.procedural = procedural
-        self.llm = Anthropic(api_key=config.ANTHROPIC_API_KEY)
-
-    def run(self):
-        """Execute a full consolidation cycle."""
-        episodes = self.episodic.get_all()
-        if len(episodes) < 2:
-            print("  Not enough episodes to consolidate.")
-            return
-
-        print(f"  Consolidating {len(episodes)} episodes...")
-
-        # Step 1: Cluster similar episodes
-        clusters = cluster_episodes(episodes, config.CONSOLIDATION_THRESHOLD)
-        mergeable = [c for c in clusters if len(c) >= 2]
+        self.llm = as_gateway(llm)
+
+    def run(self, time_budget: float = None, token_budget: int = None,
+            pending: dict = None) -> dict | None:
+        """Execute a consolidation cycle, optionally within a time and token budget.
+
+        If the budget runs out the cycle stops between LLM calls and returns
+        the unfinished work; pass it back as `pending` to resume. Returns None
+        once the cycle is complete.
+        """
+        with tracer.span("consolidation"):
+            return self._run(_Budget(time_budget, token_budget), pending)
+
+    def _run(self, budget: "_Budget", pending: dict | None) -> dict | None:
+        if pending:
+            # Resume: skip clusters whose episodes have since changed
+            mergeable = [self.episodic.get(ids) for ids in pending["clusters"]]
+            mergeable = [c for c, ids in zip(mergeable, pending["clusters"]) if len(c) == len(ids)]
+            promote = pending.get("promote", True)
+            print(f"  Resuming consolidation ({len(mergeable)} clusters left)...")
+        else:
+            n_episodes = len(self.episodic.mirror)
+            if n_episodes < 2:
+                print("  Not enough episodes to consolidate.")
+                return None
+
+            print(f"  Consolidating {n_episodes} episodes...")
+
+            # Step 1: Cluster similar episodes
+            mergeable = self.find_clusters()
+            promote = True
 
         # Step 2: Merge clusters
         merged_count = 0
-        for cluster in mergeable:
-            success = self._merge_cluster(cluster)
-            if success:
-                merged_count += 1
+        with tracer.span("consolidation.merge"):
+            for i, cluster in enumerate(mergeable):
+                request = self.merge_request(cluster)
+                if not budget.spend(request):
+                    print(f"  Budget reached after {merged_count} merges; {len(mergeable) - i} deferred.")
+                    return {"clusters": [[ep["id"] for ep in c] for c in mergeable[i:]], "promote": promote}
+                if self._merge_cluster(cluster, request):
+                    merged_count += 1
 
         if merged_count:
             print(f"  Merged {merged_count} clusters.")
 
         # Step 3: Promote recurring patterns to procedural memory
-        self._promote_patterns()
+        if promote:
+            with tracer.span("consolidation.promote"):
+                request = self.promotion_request(self.episodic.get_all(embeddings=False))
+                if request is not None:
+                    if not budget.spend(request):
+                        print("  Budget reached; pattern promotion deferred.")
+                        return {"clusters": [], "promote": True}
+                    self.apply_promotion(self.llm.create_json(
+                        "promote", validate=lambda value: isinstance(value, list), **request
+                    ))
+        return None
+
+    def find_clusters(self) -> list[list[dict]]:
+        """Clusters of two or more similar episodes, clustered on the embedding mirror."""
+        with tracer.span("consolidation.cluster"):
+            self.episodic.sync()
+            ids = self.episodic.mirror.ids()
+            buckets = None
+            if config.CONSOLIDATION_TAG_BUCKETS:
+                buckets = tag_buckets([self.episodic.tags.tags_of(episode_id) for episode_id in ids])
+            groups = cluster_vectors(
+                self.episodic.mirror.vectors(), config.CONSOLIDATION_THRESHOLD, buckets
+            )
+            mergeable = [[ids[i] for i in group] for group in groups if len(group) >= 2]
+        with tracer.span("consolidation.fetch"):
+            return [self.episodic.get(cluster_ids) for cluster_ids in mergeable]
 
-    def _merge_cluster(self, cluster: list[dict]) -> bool:
+    def _merge_cluster(self, cluster: list[dict], request: dict = None) -> bool:
         """Merge a cluster of similar episodes into one."""
+        merged = self.llm.create_json(
+            "merge", validate=lambda value: isinstance(value, dict), **(request or self.merge_request(cluster))
+        )
+        if not isinstance(merged, dict):
+            return False
+        return self.apply_merge([ep["id"] for ep in cluster], merged)
+
+    def merge_request(self, cluster: list[dict]) -> dict:
+        """LLM request parameters for merging a cluster (messages.create kwargs)."""
         episode_texts = []
         for ep in cluster:
             meta = ep["metadata"]
@@ -122,34 +240,31 @@ class Consolidation:
                 f"What to avoid: {meta.get('what_to_avoid', 'N/A')}"
             )
 
-        try:
-            response = self.llm.messages.create(
-                model=config.MODEL_NAME,
-                max_tokens=512,
-                temperature=0.3,
-                messages=[{
-                    "role": "user",
-                    "content": MERGE_PROMPT.format(
-                        episodes="\n\n---\n\n".join(episode_texts)
-                    ),
-                }],
-            )
-            text = response.content[0].text
-            if "```" in text:
-                text = text.split("```")[1]
-                if text.startswith("json"):
-                    text = text[4:]
-            merged = json.loads(text.strip())
-        except (json.JSONDecodeError, IndexError, KeyError):
+        return {
+            **task_params("merge"),
+            "messages": [{
+                "role": "user",
+                "content": MERGE_PROMPT.format(
+                    episodes="\n\n---\n\n".join(episode_texts)
+                ),
+            }],
+        }
+
+    def apply_merge(self, episode_ids: list[str], merged: dict, merged_id: str = None) -> bool:
+        """Replace the given episodes with one merged episode.
+
+        With a deterministic merged_id this is idempotent: re-applying only
+        finishes deleting leftover originals. Returns False if the originals
+        changed since the merge was requested.
+        """
+        if merged_id and self.episodic.collection.get(ids=[merged_id])["ids"]:
+            self.episodic.delete(episode_ids)
+            return True
+        originals = self.episodic.collection.get(ids=episode_ids, include=["metadatas"])
+        if len(originals["ids"]) != len(episode_ids):
             return False
 
-        # Delete originals
-        ids_to_delete = [ep["id"] for ep in cluster]
-        self.episodic.delete(ids_to_delete)
-
         # Store merged episode - ensure all metadata values are strings
-        import time
-
         def to_str(val):
             if isinstance(val, list):
                 return ", ".join(str(v) for v in val) if val else "N/A"
@@ -160,31 +275,44 @@ class Consolidation:
         what_to_avoid = to_str(merged.get("what_to_avoid"))
         context_tags = ",".join(merged.get("context_tags", [])) or "general"
 
+        # The merged episode inherits the access history of its sources
+        now = time.time()
+        access_count = sum(int(m.get("access_count", 0)) for m in originals["metadatas"])
+        last_recalled = max((m.get("last_recalled", 0) for m in originals["metadatas"]), default=now)
+        occurrences = sum(int(m.get("occurrences", 1)) for m in originals["metadatas"])
+
         merged_doc = (
             f"Summary: {summary}\n"
             f"What worked: {what_worked}\n"
             f"What to avoid: {what_to_avoid}\n\n"
-            f"[Consolidated from {len(cluster)} episodes]"
-        )
-        self.episodic.collection.add(
-            ids=[f"consolidated_{int(time.time() * 1000)}"],
-            documents=[merged_doc],
-            metadatas=[{
-                "timestamp": time.time(),
-                "summary": summary,
-                "what_worked": what_worked,
-                "what_to_avoid": what_to_avoid,
-                "context_tags": context_tags,
-                "consolidated": "true",
-            }],
+            f"[Consolidated from {len(episode_ids)} episodes]"
         )
+        # Promotion is checked after the delete, against the merged count
+        with promotion_deferred(self.episodic.collection):
+            self.episodic.add(
+                ids=[merged_id or f"consolidated_{int(time.time() * 1000)}"],
+                documents=[merged_doc],
+                metadatas=[{
+                    "timestamp": now,
+                    "summary": summary,
+                    "what_worked": what_worked,
+                    "what_to_avoid": what_to_avoid,
+                    "context_tags": context_tags,
+                    "consolidated": "true",
+                    "access_count": access_count,
+                    "last_recalled": last_recalled,
+                    "occurrences": occurrences,
+                }],
+            )
+
+            # Delete originals only after the merged episode is safely stored
+            self.episodic.delete(episode_ids)
         return True
 
-    def _promote_patterns(self):
-        """Extract recurring patterns from episodes and promote to procedural memory."""
-        episodes = self.episodic.get_all()
+    def promotion_request(self, episodes: list[dict]) -> dict | None:
+        """LLM request parameters for pattern promotion, or None if too few episodes."""
         if len(episodes) < config.PROMOTION_MIN_OCCURRENCES:
-            return
+            return None
 
         episode_texts = []
         for ep in episodes:
@@ -195,32 +323,25 @@ class Consolidation:
                 f"What to avoid: {meta.get('what_to_avoid', 'N/A')}"
             )
 
-        try:
-            response = self.llm.messages.create(
-                model=config.MODEL_NAME,
-                max_tokens=512,
-                temperature=0.3,
-                messages=[{
-                    "role": "user",
-                    "content": PROMOTION_PROMPT.format(
-                        episodes="\n\n---\n\n".join(episode_texts)
-                    ),
-                }],
-            )
-            text = response.content[0].text
-            if "```" in text:
-                text = text.split("```")[1]
-                if text.startswith("json"):
-                    text = text[4:]
-            rules = json.loads(text.strip())
-        except (json.JSONDecodeError, IndexError, KeyError):
-            return
-
-        if isinstance(rules, list):
-            promoted = 0
-            for rule in rules:
-                if isinstance(rule, str) and rule.strip():
-                    self.procedural.add_rule(rule.strip())
-                    promoted += 1
-            if promoted:
-                print(f"  Promoted {promoted} patterns to procedural memory.")
+        return {
+            **task_params("promote"),
+            "messages": [{
+                "role": "user",
+                "content": PROMOTION_PROMPT.format(
+                    episodes="\n\n---\n\n".join(episode_texts)
+                ),
+            }],
+        }
+
+    def apply_promotion(self, rules) -> int:
+        """Add promoted rules (a parsed JSON list) to procedural memory. Idempotent.
+
+        Returns how many rules were new; ones already known are not counted.
+        """
+        if not isinstance(rules, list):
+            return 0
+        valid = [r.strip() for r in rules if isinstance(r, str) and r.strip()]
+        promoted = self.procedural.add_rules(valid)
+        if promoted:
+            print(f"  Promoted {promoted} patterns to procedural memory.")
+        return promoted
@@ -1,11 +1,21 @@
 """Episodic memory - stores past conversations with LLM-generated reflections."""
 
+import gzip
 import json
 import math
+import os
 import time
-import chromadb
-from anthropic import Anthropic
+import uuid
+from contextlib import contextmanager
+import numpy as np
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
 import config
+from memory.llm import LLMGateway, as_gateway, task_params
+from memory.storage import index_metadata, open_client
+from memory.tags import TagIndex
+from memory.tracing import tracer
+from memory.vectors import EmbeddingMirror
+from memory.vectorstore import open_collection
 
 
 REFLECTION_PROMPT_TEMPLATE = """You are a memory encoder. Your task is to extract a structured reflection from a conversation so it can be stored and retrieved later.
@@ -21,80 +31,346 @@ Extract the following fields and return ONLY valid JSON (no markdown, no code fe
 - "what_to_avoid": specific mistakes or pitfalls identified, or "N/A" if none"""
 
 
+BATCH_REFLECTION_PROMPT_TEMPLATE = """You are a memory encoder. Your task is to extract a structured reflection from each conversation below so they can be stored and retrieved later.
+
+<conversations>
+{conversations}
+</conversations>
+
+Return ONLY a valid JSON array (no markdown, no code fences) with one object per conversation, each with these fields:
+- "index": the index attribute of the conversation it describes
+- "context_tags": 2-4 specific keywords for retrieval (e.g. "QA-7", "processor", "Zeltron" not generic words like "technology")
+- "summary": one factual sentence capturing the key topic and outcome
+- "what_worked": specific approaches that were effective, or "N/A" if none
+- "what_to_avoid": specific mistakes or pitfalls identified, or "N/A" if none"""
+
+ROLLING_REFLECTION_PROMPT_TEMPLATE = """You are a memory encoder. You keep a structured reflection of an ongoing conversation up to date as it continues.
+
+<reflection>
+{reflection}
+</reflection>
+
+<new_turns>
+{turns}
+</new_turns>
+
+The reflection covers the conversation before the new turns, which are not shown again. Update it so it covers the whole conversation so far, keeping earlier points that still hold, and return ONLY valid JSON (no markdown, no code fences) with the same fields:
+- "context_tags": 2-4 specific keywords for retrieval (e.g. "QA-7", "processor", "Zeltron" not generic words like "technology")
+- "summary": one factual sentence capturing the key topic and outcome
+- "what_worked": specific approaches that were effective, or "N/A" if none
+- "what_to_avoid": specific mistakes or pitfalls identified, or "N/A" if none"""
+
+REFLECTION_FIELDS = ("context_tags", "summary", "what_worked", "what_to_avoid")
+
+
 class EpisodicMemory:
-    """Stores past conversation experiences with reflections for future recall."""
+    """Stores past conversation experiences with reflections for future recall.
 
-    def __init__(self):
-        db = chromadb.PersistentClient(path=config.CHROMA_PERSIST_DIR)
-        self.collection = db.get_or_create_collection(
-            name="episodic_memory",
-            metadata={"hnsw:space": "cosine"},
+    Args:
+        client: Shared ChromaDB client. A new persistent client is opened if None.
+        llm: LLM gateway (or raw Anthropic client). The process default if None.
+        namespace: Per-user namespace. Each namespace gets its own collection.
+        embedding_function: ChromaDB embedding function. Chroma's default if None.
+        capacity: Max episodes kept in the hot index (EPISODIC_CAPACITY if None,
+            0 for unlimited). The least important episodes beyond it are archived.
+        index_profile: HNSW profile used if the collection is created
+            (EPISODIC_INDEX_PROFILE if None).
+    """
+
+    def __init__(
+        self,
+        client=None,
+        llm: LLMGateway = None,
+        namespace: str = None,
+        embedding_function=None,
+        capacity: int = None,
+        index_profile: str = None,
+    ):
+        db = client or open_client()
+        self._client = db
+        self._max_batch_size = None
+        name = f"episodic_memory_{namespace}" if namespace else "episodic_memory"
+        self.collection = open_collection(
+            db,
+            name,
+            index_metadata(index_profile or config.EPISODIC_INDEX_PROFILE),
+            embedding_function,
         )
-        self.llm = Anthropic(api_key=config.ANTHROPIC_API_KEY)
+        # Embeddings are computed here so the mirror gets them without a read-back
+        self.embedding_function = embedding_function or DefaultEmbeddingFunction()
+        self.llm = as_gateway(llm)
+        self.capacity = config.EPISODIC_CAPACITY if capacity is None else capacity
+        self.archive_path = os.path.join(config.EPISODIC_ARCHIVE_DIR, f"{name}.jsonl.gz")
+        # Access stats from recall, written back lazily so chat turns stay read-only
+        self._pending_access: dict[str, tuple[int, float]] = {}
+        # Flat float32 copy of the embeddings for consolidation and bulk similarity
+        self.mirror = EmbeddingMirror(name)
+        # Inverted context_tags index for tag-filtered recall and tag-bucketed clustering
+        self.tags = TagIndex()
+        self.sync()
+
+    def store(self, conversation_text: str, reflection: dict = None) -> bool:
+        """Reflect on a conversation and store it as an episodic memory.
 
-    def store(self, conversation_text: str):
-        """Reflect on a conversation and store it as an episodic memory."""
+        A ready reflection (e.g. the agent's rolling one) skips the LLM call.
+        A near-duplicate of an existing episode (similarity at or above
+        EPISODIC_DEDUP_THRESHOLD) is folded into it instead, without an LLM
+        call. Returns True if a new episode was added.
+        """
         if not conversation_text.strip():
-            return
+            return False
 
-        reflection = self._reflect(conversation_text)
+        reflection = reflection or self._reflect(conversation_text)
         if not reflection:
-            return
+            return False
 
-        episode_id = f"episode_{int(time.time() * 1000)}"
+        now = time.time()
+        document, metadata = self._episode(conversation_text, reflection, now)
+        embedding = np.asarray(self.embedding_function([document]), dtype=np.float32)
+        if self._fold_into_nearest(embedding[0], metadata, now):
+            return False
+        self.add([_new_episode_id()], [document], [metadata], embeddings=embedding)
+        self.enforce_capacity()
+        return True
+
+    def _fold_into_nearest(self, embedding: np.ndarray, metadata: dict, now: float) -> bool:
+        """Merge a new episode into its nearest neighbour if they are near-duplicates.
+
+        The neighbour keeps its document embedding; it gets the new timestamp,
+        one more occurrence and any what_worked/what_to_avoid items it lacks.
+        """
+        if self.collection.count() == 0:
+            return False
+        with tracer.span("episodic.dedup"):
+            nearest = self.collection.query(
+                query_embeddings=[embedding], n_results=1,
+                include=["documents", "metadatas", "distances", "embeddings"],
+            )
+        if not nearest["ids"][0] or 1 - nearest["distances"][0][0] < config.EPISODIC_DEDUP_THRESHOLD:
+            return False
+
+        self.flush_access()
+        episode_id = nearest["ids"][0][0]
+        existing = dict(nearest["metadatas"][0][0])
+        document = nearest["documents"][0][0]
+        for field, label in (("what_worked", "What worked"), ("what_to_avoid", "What to avoid")):
+            combined = _merge_items(existing.get(field, "N/A"), metadata[field])
+            document = document.replace(f"{label}: {existing.get(field, 'N/A')}\n", f"{label}: {combined}\n", 1)
+            existing[field] = combined
+        existing["context_tags"] = _merge_items(
+            existing.get("context_tags", ""), metadata["context_tags"], separator=","
+        )
+        existing["timestamp"] = now
+        existing["occurrences"] = int(existing.get("occurrences", 1)) + 1
+        with self._writing():
+            self.collection.update(
+                ids=[episode_id], documents=[document], metadatas=[existing],
+                embeddings=[nearest["embeddings"][0][0]],
+            )
+            self.tags.add([episode_id], [existing])
+        return True
+
+    def store_many(self, conversations: list[str]) -> int:
+        """Reflect on and store many conversations (bulk imports, replays, restarts).
+
+        Transcripts are packed into shared reflection prompts of up to
+        REFLECTION_BATCH_TOKENS; any conversation the batched reply does not
+        cover is reflected on its own. All episodes go in with one add()
+        (split to Chroma's max batch size).
+        Returns the number of episodes stored.
+        """
+        conversations = [c for c in conversations if c.strip()]
+        reflections = [None] * len(conversations)
+        for batch in self._pack(conversations):
+            parsed = self._reflect_many([conversations[i] for i in batch]) if len(batch) > 1 else {}
+            for position, index in enumerate(batch):
+                reflections[index] = parsed.get(position) or self._reflect(conversations[index])
+
+        now = time.time()
+        ids, documents, metadatas = [], [], []
+        for text, reflection in zip(conversations, reflections):
+            if not reflection:
+                continue
+            document, metadata = self._episode(text, reflection, now)
+            ids.append(_new_episode_id())
+            documents.append(document)
+            metadatas.append(metadata)
+        if ids:
+            self.add(ids, documents, metadatas)
+            self.enforce_capacity()
+        return len(ids)
+
+    def add(self, ids: list[str], documents: list[str], metadatas: list[dict], embeddings=None):
+        """Insert ready-made episodes, mirror their embeddings and index their tags.
+
+        The collection add is split into batches of at most max_batch_size().
+        """
+        if embeddings is None:
+            embeddings = np.asarray(self.embedding_function(documents), dtype=np.float32)
+        step = self.max_batch_size()
+        with self._writing():
+            for start in range(0, len(ids), step):
+                end = start + step
+                self.collection.add(
+                    ids=ids[start:end], documents=documents[start:end],
+                    metadatas=metadatas[start:end], embeddings=embeddings[start:end],
+                )
+            self.mirror.add(ids, embeddings)
+            self.tags.add(ids, metadatas)
+
+    def max_batch_size(self) -> int:
+        """Most records the Chroma client accepts in one add (asked once)."""
+        if self._max_batch_size is None:
+            self._max_batch_size = self._client.get_max_batch_size()
+        return self._max_batch_size
+
+    @contextmanager
+    def _writing(self):
+        """One write to the collection, mirror and tag index, under the store's write generation.
+
+        Copies that were current move to the new generation with it; one that
+        had already missed a write stays behind and rebuilds on the next sync.
+        """
+        with self.mirror.source.writing() as (before, after):
+            yield
+            if self.mirror.source_generation == before:
+                self.mirror.mark_synced(after)
+            if self.tags.generation == before:
+                self.tags.generation = after
+
+    def sync(self, mirror: bool = True):
+        """Rebuild the tag index (and the mirror) if the collection was written
+        without them: by another process, or by a write that failed midway."""
+        with self.mirror.source.current() as generation:
+            if mirror:
+                self.mirror.sync(self.collection, generation)
+            self.tags.sync(self.collection, generation)
+
+    @staticmethod
+    def _episode(conversation_text: str, reflection: dict, now: float) -> tuple[str, dict]:
+        """Document text and metadata for a new episode."""
         document = (
             f"Summary: {reflection['summary']}\n"
             f"What worked: {reflection['what_worked']}\n"
             f"What to avoid: {reflection['what_to_avoid']}\n\n"
             f"Full conversation:\n{conversation_text}"
         )
+        tags = reflection["context_tags"]
+        metadata = {
+            "timestamp": now,
+            "summary": reflection["summary"],
+            "what_worked": reflection["what_worked"],
+            "what_to_avoid": reflection["what_to_avoid"],
+            "context_tags": tags if isinstance(tags, str) else ",".join(tags),
+            "access_count": 0,
+            "last_recalled": now,
+            "occurrences": 1,
+        }
+        return document, metadata
 
-        self.collection.add(
-            ids=[episode_id],
-            documents=[document],
-            metadatas=[{
-                "timestamp": time.time(),
-                "summary": reflection["summary"],
-                "what_worked": reflection["what_worked"],
-                "what_to_avoid": reflection["what_to_avoid"],
-                "context_tags": ",".join(reflection["context_tags"]),
-            }],
-        )
+    def recall(self, query: str, track: bool = True, tags: list[str] = None) -> list[dict] | None:
+        """Retrieve relevant past episodes with recency weighting.
 
-    def recall(self, query: str) -> list[dict] | None:
-        """Retrieve relevant past episodes with recency weighting."""
+        Args:
+            track: Count this as an access (bumps access_count and last_recalled,
+                which feed the eviction score). Internal lookups pass False.
+            tags: Only search episodes carrying at least one of these tags.
+        """
         if self.collection.count() == 0:
             return None
 
-        n = min(config.EPISODIC_TOP_K * 2, self.collection.count())
+        candidates = None
+        if tags is not None:
+            self.sync(mirror=False)
+            candidates = sorted(self.tags.ids_for(tags))
+            if not candidates:
+                return None
+        n = min(config.EPISODIC_TOP_K * 2, len(candidates) if candidates else self.collection.count())
         results = self.collection.query(
             query_texts=[query],
             n_results=n,
+            ids=candidates,
         )
+        return self._rank(results, 0, track)
 
-        if not results["documents"][0]:
+    def recall_many(self, queries: list[str], track: bool = True, embeddings=None) -> list[list[dict] | None]:
+        """recall() for several queries with one index call (embeddings: precomputed query vectors)."""
+        count = self.collection.count()
+        if count == 0 or not queries:
+            return [None for _ in queries]
+        results = self.collection.query(
+            query_embeddings=self.embedding_function(queries) if embeddings is None else embeddings,
+            n_results=min(config.EPISODIC_TOP_K * 2, count),
+        )
+        return [self._rank(results, row, track) for row in range(len(queries))]
+
+    def _rank(self, results: dict, row: int, track: bool) -> list[dict] | None:
+        """Recency-weighted top episodes for one query of a query() result."""
+        if not results["documents"][row]:
             return None
 
         # Apply recency weighting and re-rank
         scored = []
         now = time.time()
-        for i, doc in enumerate(results["documents"][0]):
-            meta = results["metadatas"][0][i]
-            distance = results["distances"][0][i]
+        for i, doc in enumerate(results["documents"][row]):
+            meta = results["metadatas"][row][i]
+            distance = results["distances"][row][i]
             similarity = 1 - distance  # cosine distance -> similarity
 
             age_hours = (now - meta["timestamp"]) / 3600
             recency = math.exp(-0.693 * age_hours / config.RECENCY_HALF_LIFE_HOURS)
 
             score = similarity * 0.7 + recency * 0.3
-            scored.append({"score": score, "metadata": meta, "document": doc})
+            scored.append({
+                "id": results["ids"][row][i], "score": score, "metadata": meta, "document": doc,
+            })
 
         scored.sort(key=lambda x: x["score"], reverse=True)
-        return scored[:config.EPISODIC_TOP_K]
+        top = scored[:config.EPISODIC_TOP_K]
+        if track:
+            self._record_access(top, now)
+        return top
+
+    def _record_access(self, episodes: list[dict], now: float):
+        """Buffer an access for each recalled episode (see flush_access)."""
+        for ep in episodes:
+            count, _ = self._pending_access.get(ep["id"], (0, now))
+            self._pending_access[ep["id"]] = (count + 1, now)
 
-    def recall_as_context(self, query: str) -> str | None:
+    def flush_access(self):
+        """Write buffered access statistics back to episode metadata."""
+        if not self._pending_access:
+            return
+        pending, self._pending_access = self._pending_access, {}
+        results = self.collection.get(ids=list(pending), include=["metadatas"])
+        metadatas = []
+        for episode_id, meta in zip(results["ids"], results["metadatas"]):
+            count, last_recalled = pending[episode_id]
+            meta = dict(meta)
+            meta["access_count"] = int(meta.get("access_count", 0)) + count
+            meta["last_recalled"] = last_recalled
+            metadatas.append(meta)
+        if metadatas:
+            self.collection.update(ids=results["ids"], metadatas=metadatas)
+
+    def recall_by_tags(self, tags: list[str], match: str = "any", limit: int = None) -> list[dict]:
+        """Episodes carrying any (or every, match="all") of the tags, newest first.
+
+        A pure index lookup - no vector search. Episodes have the same shape
+        as get(); access is not tracked.
+        """
+        self.sync(mirror=False)
+        episodes = self.get(sorted(self.tags.ids_for(tags, match=match)))
+        episodes.sort(key=lambda ep: ep["metadata"].get("timestamp", 0), reverse=True)
+        return episodes[:limit] if limit else episodes
+
+    def recall_as_context(self, query: str, track: bool = True) -> str | None:
         """Format recalled episodes as text for system prompt injection."""
-        episodes = self.recall(query)
+        return self.format_episodes(self.recall(query, track=track))
+
+    @staticmethod
+    def format_episodes(episodes: list[dict] | None) -> str | None:
+        """Recalled episodes as system prompt text (None if there are none)."""
         if not episodes:
             return None
 
@@ -109,45 +385,206 @@ class EpisodicMemory:
             )
         return "\n\n".join(parts)
 
-    def get_all(self) -> list[dict]:
-        """Return all stored episodes (used by consolidation)."""
+    def get_all(self, embeddings: bool = True) -> list[dict]:
+        """Return all stored episodes (used by consolidation).
+
+        Args:
+            embeddings: Include each episode's embedding. Bulk vector work should
+                use self.mirror instead.
+        """
+        self.flush_access()
         if self.collection.count() == 0:
             return []
 
-        results = self.collection.get(include=["documents", "metadatas", "embeddings"])
+        include = ["documents", "metadatas"] + (["embeddings"] if embeddings else [])
+        results = self.collection.get(include=include)
         episodes = []
         for i, doc in enumerate(results["documents"]):
             episodes.append({
                 "id": results["ids"][i],
                 "document": doc,
                 "metadata": results["metadatas"][i],
-                "embedding": results["embeddings"][i] if results["embeddings"] is not None else None,
+                "embedding": results["embeddings"][i] if results.get("embeddings") is not None else None,
             })
         return episodes
 
+    def get(self, ids: list[str]) -> list[dict]:
+        """Return episodes by ID, without embeddings, in the order given."""
+        self.flush_access()
+        results = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        by_id = {
+            episode_id: {"id": episode_id, "document": doc, "metadata": meta, "embedding": None}
+            for episode_id, doc, meta in zip(results["ids"], results["documents"], results["metadatas"])
+        }
+        return [by_id[episode_id] for episode_id in ids if episode_id in by_id]
+
     def delete(self, ids: list[str]):
         """Delete episodes by ID (used by consolidation)."""
         if ids:
-            self.collection.delete(ids=ids)
+            with self._writing():
+                self.collection.delete(ids=ids)
+                self.mirror.delete(ids)
+                self.tags.delete(ids)
+
+    @staticmethod
+    def importance(meta: dict, now: float) -> float:
+        """Retention score from recency, access frequency and consolidated status."""
+        last_touched = max(meta.get("timestamp", 0), meta.get("last_recalled", 0))
+        age_hours = (now - last_touched) / 3600
+        recency = math.exp(-0.693 * age_hours / config.RECENCY_HALF_LIFE_HOURS)
+        frequency = 1 - 1 / (1 + int(meta.get("access_count", 0)))  # 0, 0.5, 0.67, ...
+        consolidated = 1.0 if meta.get("consolidated") == "true" else 0.0
+        weights = config.EVICTION_WEIGHTS
+        return (
+            weights["recency"] * recency
+            + weights["frequency"] * frequency
+            + weights["consolidated"] * consolidated
+        )
+
+    def enforce_capacity(self) -> int:
+        """Archive the least important episodes once the store exceeds capacity.
+
+        Evicts down to EVICTION_LOW_WATER of capacity so the scan is not paid on
+        every store. Returns the number of episodes archived.
+        """
+        self.flush_access()
+        count = self.collection.count()
+        if not self.capacity or count <= self.capacity:
+            return 0
+
+        results = self.collection.get(include=["metadatas"])
+        now = time.time()
+        ranked = sorted(
+            zip(results["ids"], results["metadatas"]),
+            key=lambda pair: self.importance(pair[1], now),
+        )
+        target = int(self.capacity * config.EVICTION_LOW_WATER)
+        victims = [episode_id for episode_id, _ in ranked[:count - target]]
+        self.archive(victims)
+        return len(victims)
+
+    def archive(self, ids: list[str]):
+        """Move episodes to the compressed cold archive and out of the index."""
+        if not ids:
+            return
+        results = self.collection.get(ids=ids, include=["documents", "metadatas", "embeddings"])
+        os.makedirs(os.path.dirname(self.archive_path), exist_ok=True)
+        archived_at = time.time()
+        # Appending gzip members keeps the file a valid gzip stream
+        with gzip.open(self.archive_path, "at", encoding="utf-8") as f:
+            for i, episode_id in enumerate(results["ids"]):
+                embedding = results["embeddings"][i] if results["embeddings"] is not None else None
+                f.write(json.dumps({
+                    "id": episode_id,
+                    "document": results["documents"][i],
+                    "metadata": results["metadatas"][i],
+                    "embedding": [float(x) for x in embedding] if embedding is not None else None,
+                    "archived_at": archived_at,
+                }) + "\n")
+        self.delete(results["ids"])
+
+    def iter_archive(self):
+        """Yield archived episodes (same shape as get_all, plus archived_at)."""
+        if not os.path.exists(self.archive_path):
+            return
+        with gzip.open(self.archive_path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
 
     def _reflect(self, conversation_text: str) -> dict | None:
         """Use LLM to generate structured reflection on a conversation."""
-        try:
-            response = self.llm.messages.create(
-                model=config.MODEL_NAME,
-                max_tokens=512,
-                temperature=0.3,
-                messages=[{
-                    "role": "user",
-                    "content": REFLECTION_PROMPT_TEMPLATE.format(conversation=conversation_text),
-                }],
-            )
-            text = response.content[0].text
-            # Extract JSON from response (handle markdown code blocks)
-            if "```" in text:
-                text = text.split("```")[1]
-                if text.startswith("json"):
-                    text = text[4:]
-            return json.loads(text.strip())
-        except (json.JSONDecodeError, IndexError, KeyError):
-            return None
+        reflection = self.llm.create_json(
+            "reflect",
+            validate=_is_reflection,
+            **task_params("reflect"),
+            messages=[{
+                "role": "user",
+                "content": REFLECTION_PROMPT_TEMPLATE.format(conversation=conversation_text),
+            }],
+        )
+        return reflection
+
+    def reflect_incremental(self, reflection: dict | None, new_turns: str) -> dict | None:
+        """Fold new turns into a running reflection (or start one). None if the reply did not parse.
+
+        The prompt holds only the previous reflection and the new turns, so its
+        size does not grow with the conversation.
+        """
+        if reflection is None:
+            return self._reflect(new_turns)
+        return self.llm.create_json(
+            "reflect",
+            validate=_is_reflection,
+            **task_params("reflect"),
+            messages=[{
+                "role": "user",
+                "content": ROLLING_REFLECTION_PROMPT_TEMPLATE.format(
+                    reflection=json.dumps({field: reflection[field] for field in REFLECTION_FIELDS}),
+                    turns=new_turns,
+                ),
+            }],
+        )
+
+    def _reflect_many(self, conversations: list[str]) -> dict[int, dict]:
+        """One LLM call for several conversations. Maps position -> reflection."""
+        blocks = "\n\n".join(
+            f'<conversation index="{i}">\n{text}\n</conversation>'
+            for i, text in enumerate(conversations)
+        )
+        reflections = self.llm.create_json(
+            "reflect",
+            validate=lambda value: isinstance(value, list),
+            **task_params("reflect", max_tokens=min(8192, 300 * len(conversations))),
+            messages=[{
+                "role": "user",
+                "content": BATCH_REFLECTION_PROMPT_TEMPLATE.format(conversations=blocks),
+            }],
+        )
+        if not isinstance(reflections, list):
+            return {}
+        parsed = {}
+        for item in reflections:
+            if _is_reflection(item) and isinstance(item.get("index"), int):
+                if 0 <= item["index"] < len(conversations):
+                    parsed[item["index"]] = item
+        return parsed
+
+    @staticmethod
+    def _pack(conversations: list[str]) -> list[list[int]]:
+        """Group conversation indexes into batches within the reflection token budget."""
+        batches, current, tokens = [], [], 0
+        for i, text in enumerate(conversations):
+            cost = len(text) // 4  # same 4 chars/token estimate as the gateway
+            if current and (
+                tokens + cost > config.REFLECTION_BATCH_TOKENS
+                or len(current) >= config.REFLECTION_BATCH_MAX
+            ):
+                batches.append(current)
+                current, tokens = [], 0
+            current.append(i)
+            tokens += cost
+        if current:
+            batches.append(current)
+        return batches
+
+
+def _new_episode_id() -> str:
+    """A unique episode id; timestamps collide across processes and within a millisecond."""
+    return f"episode_{uuid.uuid4().hex}"
+
+
+def _merge_items(existing: str, new: str, separator: str = ";") -> str:
+    """Append the separated items of `new` that `existing` lacks ("N/A" is empty)."""
+    items = [i.strip() for i in str(existing).split(separator) if i.strip() and i.strip() != "N/A"]
+    seen = {i.lower().rstrip(".") for i in items}
+    for item in str(new).split(separator):
+        item = item.strip()
+        if item and item != "N/A" and item.lower().rstrip(".") not in seen:
+            items.append(item)
+            seen.add(item.lower().rstrip("."))
+    joiner = "; " if separator == ";" else separator
+    return joiner.join(items) or "N/A"
+
+
+def _is_reflection(value) -> bool:
+    return isinstance(value, dict) and all(field in value for field in REFLECTION_FIELDS)
@@ -0,0 +1,328 @@
+"""LLM gateway - the single path every memory system uses to call the model.
+
+Provides token-bucket rate limiting (requests and tokens per minute), bounded
+concurrency, jittered retries on 429/5xx, a cache for deterministic calls and
+the shared code-fence-tolerant JSON parsing. Background purposes (reflection,
+rule maintenance, consolidation) may only use part of the concurrency and
+rate budget, so a sleep phase cannot starve user-facing chat calls.
+
+Call sites take their model and sampling settings from task_params(purpose)
+(config.LLM_TASKS), so auxiliary calls can run on a smaller model; a JSON
+reply from such a model that does not parse is re-asked on MODEL_NAME.
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import anthropic
+from anthropic import Anthropic
+
+import config
+from memory.tracing import tracer
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Purposes that are never on the user-facing critical path
+BACKGROUND_PURPOSES = {"reflect", "rules", "merge", "promote"}
+
+_RETRYABLE = (
+    anthropic.RateLimitError,
+    anthropic.APIConnectionError,
+    anthropic.InternalServerError,
+)
+
+
+def task_params(purpose: str, **overrides) -> dict:
+    """model, max_tokens and temperature for a purpose (LLM_TASKS), plus overrides."""
+    default = {"model": config.MODEL_NAME, "max_tokens": config.MAX_TOKENS,
+               "temperature": config.TEMPERATURE}
+    return {**default, **config.LLM_TASKS.get(purpose, {}), **overrides}
+
+
+def parse_json(text: str):
+    """Parse a JSON reply, tolerating a surrounding markdown code fence."""
+    if "```" in text:
+        text = text.split("```")[1]
+        if text.startswith("json"):
+            text = text[4:]
+    return json.loads(text.strip())
+
+
+class TokenBucket:
+    """Thread-safe token bucket. acquire() blocks until the amount is available.
+
+    `reserve` keeps part of the bucket for other callers: the acquire only
+    succeeds if at least `reserve` remains afterwards.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float, reserve: float = 0.0):
+        amount = min(amount, self.capacity - reserve)  # never wait forever on one huge call
+        while True:
+            with self._lock:
+                self._refill()
+                if self.level - amount >= reserve:
+                    self.level -= amount
+                    return
+                wait = (amount + reserve - self.level) / self.rate
+            time.sleep(min(wait, 1.0))
+
+    def refund(self, amount: float):
+        """Return (or, if negative, charge) tokens after the real cost is known."""
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+
+class LLMGateway:
+    """Rate-limited, retrying, caching wrapper around an Anthropic client.
+
+    Args:
+        client: Anthropic-compatible client. A new one (with SDK retries off,
+            since the gateway retries itself) is created if None.
+        requests_per_minute, tokens_per_minute, max_in_flight: Override the
+            LLM_* defaults from config.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+        max_in_flight: int = None,
+    ):
+        self.client = client or Anthropic(api_key=config.ANTHROPIC_API_KEY, max_retries=0)
+        self._requests = TokenBucket(requests_per_minute or config.LLM_REQUESTS_PER_MINUTE)
+        self._tokens = TokenBucket(tokens_per_minute or config.LLM_TOKENS_PER_MINUTE)
+        max_in_flight = max_in_flight or config.LLM_MAX_IN_FLIGHT
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        background = max(1, int(max_in_flight * config.LLM_BACKGROUND_SHARE))
+        self._background_slots = threading.BoundedSemaphore(background)
+        self._cache: OrderedDict[str, object] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.retries = 0
+        self.fallbacks = 0
+
+    def create(self, purpose: str, cache: bool = None, **kwargs):
+        """Call messages.create with rate limiting, retries and optional caching.
+
+        Args:
+            purpose: What the call is for (answer, conflict, reflect, ...). Used for
+                priority and token accounting.
+            cache: Cache the response. Defaults to True for temperature-0 calls.
+            **kwargs: Passed through to messages.create.
+
+        A call to a model other than MODEL_NAME that fails with an API error
+        (retired or unknown model, rejected request, retries exhausted) is
+        retried once on MODEL_NAME (LLM_JSON_FALLBACK).
+        """
+        return self._create_or_fall_back(purpose, cache, kwargs)[0]
+
+    def _create_or_fall_back(self, purpose: str, cache: bool, kwargs: dict) -> tuple:
+        """create(), returning the response and the model that gave it."""
+        model = kwargs.get("model")
+        try:
+            return self._create(purpose, cache, kwargs), model
+        except (anthropic.AuthenticationError, anthropic.PermissionDeniedError):
+            raise  # MODEL_NAME would be refused as well
+        except anthropic.APIError as e:
+            if not config.LLM_JSON_FALLBACK or model == config.MODEL_NAME:
+                raise
+            print(f"  {model} failed for {purpose} ({type(e).__name__}), using {config.MODEL_NAME}")
+        self.fallbacks += 1
+        with tracer.span(f"llm.fallback.{purpose}"):
+            return self._create(purpose, cache, {**kwargs, "model": config.MODEL_NAME}), config.MODEL_NAME
+
+    def _create(self, purpose: str, cache: bool, kwargs: dict):
+        if cache is None:
+            cache = kwargs.get("temperature") == 0
+        key = self._cache_key(kwargs) if cache else None
+        if key is not None:
+            with self._cache_lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    self.cache_hits += 1
+                    return self._cache[key]
+
+        with self._admitted(purpose, kwargs) as settle:
+            response = self._with_retries(kwargs)
+            settle(response)
+
+        if key is not None:
+            with self._cache_lock:
+                self._cache[key] = response
+                while len(self._cache) > config.LLM_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return response
+
+    def create_json(self, purpose: str, validate=None, **kwargs):
+        """Like create, but parse the reply as JSON. Returns None if it does not parse.
+
+        Args:
+            validate: Optional predicate on the parsed value; a reply failing it
+                counts as unparsed.
+
+        An unparsed reply from a model other than MODEL_NAME is retried once on
+        MODEL_NAME (LLM_JSON_FALLBACK), as is a failed call (see create).
+        """
+        response, model = self._create_or_fall_back(purpose, None, kwargs)
+        parsed = self._parse(response, validate)
+        if parsed is None and config.LLM_JSON_FALLBACK and model != config.MODEL_NAME:
+            self.fallbacks += 1
+            with tracer.span(f"llm.fallback.{purpose}"):
+                parsed = self._parse(
+                    self.create(purpose, **{**kwargs, "model": config.MODEL_NAME}), validate
+                )
+        return parsed
+
+    @staticmethod
+    def _parse(response, validate=None):
+        try:
+            parsed = parse_json(response.content[0].text)
+        except (json.JSONDecodeError, IndexError, AttributeError):
+            return None
+        if validate is not None and not validate(parsed):
+            return None
+        return parsed
+
+    @contextmanager
+    def stream(self, purpose: str, **kwargs):
+        """Rate-limited messages.stream. Yields the SDK stream object.
+
+        A stream the caller abandons (client disconnect, generator closed) or
+        that breaks off is still settled and recorded, from the usage it
+        reported so far.
+        """
+        with self._admitted(purpose, kwargs) as settle:
+            with self.client.messages.stream(**kwargs) as stream:
+                response = None
+                try:
+                    yield stream
+                    response = stream.get_final_message()
+                finally:
+                    settle(response if response is not None else self._partial_usage(stream))
+
+    @staticmethod
+    def _partial_usage(stream):
+        """A stand-in response with the usage of an unfinished stream (None if it never started).
+
+        The output count only arrives with the last event, so the text
+        received so far is counted too (4 chars/token).
+        """
+        try:
+            message = stream.current_message_snapshot
+        except (AssertionError, AttributeError):
+            return None
+        usage = message.usage
+        text = "".join(getattr(block, "text", "") for block in message.content)
+        return SimpleNamespace(usage=SimpleNamespace(
+            input_tokens=usage.input_tokens or 0,
+            output_tokens=max(usage.output_tokens or 0, len(text) // 4),
+        ))
+
+    @contextmanager
+    def _admitted(self, purpose: str, kwargs: dict):
+        """Hold a concurrency slot and rate budget for the duration of one call."""
+        background = purpose in BACKGROUND_PURPOSES
+        estimate = self.estimate_tokens(kwargs)
+        share = 1 - config.LLM_BACKGROUND_SHARE
+
+        with tracer.span(f"llm.wait.{INTERACTIVE if not background else BACKGROUND}"):
+            if background:
+                self._background_slots.acquire()
+            self._slots.acquire()
+            self._requests.acquire(1, reserve=self._requests.capacity * share if background else 0)
+            self._tokens.acquire(estimate, reserve=self._tokens.capacity * share if background else 0)
+
+        def settle(response):
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                actual = (usage.input_tokens or 0) + (usage.output_tokens or 0)
+                self._tokens.refund(estimate - actual)
+            tracer.record_usage(purpose, response)
+
+        try:
+            with tracer.span(f"llm.{purpose}"):
+                yield settle
+        finally:
+            self._slots.release()
+            if background:
+                self._background_slots.release()
+
+    def _with_retries(self, kwargs: dict):
+        for attempt in range(config.LLM_MAX_RETRIES + 1):
+            try:
+                return self.client.messages.create(**kwargs)
+            except (*_RETRYABLE, anthropic.APIStatusError) as e:
+                status = getattr(e, "status_code", None)
+                retryable = isinstance(e, _RETRYABLE) or status in (408, 409, 429, 529)
+                if not retryable or attempt == config.LLM_MAX_RETRIES:
+                    raise
+                self.retries += 1
+                time.sleep(self._backoff(attempt, e))
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, honouring a retry-after header if present."""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return float(retry_after) + random.uniform(0, 1)
+            except ValueError:
+                pass
+        ceiling = min(config.LLM_RETRY_MAX_SECONDS, config.LLM_RETRY_BASE_SECONDS * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+    @staticmethod
+    def estimate_tokens(kwargs: dict) -> int:
+        """Rough token cost (4 chars/token for input plus the output cap)."""
+        chars = len(kwargs.get("system", "") or "")
+        for message in kwargs.get("messages", []):
+            content = message.get("content", "")
+            chars += len(content) if isinstance(content, str) else len(json.dumps(content))
+        return chars // 4 + kwargs.get("max_tokens", 0)
+
+    @staticmethod
+    def _cache_key(kwargs: dict) -> str:
+        return hashlib.sha256(json.dumps(kwargs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+_default_gateway = None
+_default_lock = threading.Lock()
+
+
+def default_gateway() -> LLMGateway:
+    """The process-wide gateway, so every caller shares one rate budget."""
+    global _default_gateway
+    with _default_lock:
+        if _default_gateway is None:
+            _default_gateway = LLMGateway()
+        return _default_gateway
+
+
+def as_gateway(llm) -> LLMGateway:
+    """Accept a gateway, a raw Anthropic-compatible client, or None (process default)."""
+    if llm is None:
+        return default_gateway()
+    if isinstance(llm, LLMGateway):
+        return llm
+    return LLMGateway(client=llm)
@@ -2,8 +2,10 @@
 
 import json
 import os
-from anthropic import Anthropic
+from contextlib import contextmanager
 import config
+from memory.llm import LLMGateway, as_gateway, task_params
+from memory.storage import file_lock
 
 
 UPDATE_PROMPT = """You are a rule maintenance system. You incrementally update behavioral guidelines based on new evidence.
@@ -27,33 +29,190 @@ Instructions:
 Return ONLY a JSON array of rule strings. No explanation, no markdown."""
 
 
+def _apply_op(rules: list[str], op: dict) -> list[str]:
+    """Apply one journaled rule operation. Replaying an op twice is a no-op."""
+    if op["op"] == "set":
+        return list(op["rules"])
+    if op["op"] == "add" and op["rule"] not in rules:
+        rules = rules + [op["rule"]]
+        if len(rules) > config.MAX_PROCEDURAL_RULES:
+            rules = rules[-config.MAX_PROCEDURAL_RULES:]
+    return rules
+
+
 class ProceduralMemory:
-    """Self-updating behavioral rules that evolve with experience."""
+    """Self-updating behavioral rules that evolve with experience.
+
+    Rules are persisted as a JSON snapshot plus an append-only journal of
+    operations. Each commit appends one journal line; the snapshot is rewritten
+    atomically (temp file + rename) every PROCEDURAL_SNAPSHOT_EVERY commits.
+
+    Commits hold a file lock and replay other processes' journal entries
+    first, so several workers can share one rule file. A concurrent LLM
+    rewrite (update) still replaces the whole list - the last one wins.
+    """
 
-    def __init__(self):
-        self.llm = Anthropic(api_key=config.ANTHROPIC_API_KEY)
+    def __init__(self, llm: LLMGateway = None, path: str = None):
+        self.llm = as_gateway(llm)
+        self.path = path or config.PROCEDURAL_MEMORY_FILE
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.journal_path = self.path + ".journal"
+        self.lock_path = self.path + ".lock"
+        self._pending: list[dict] | None = None
+        self._journal_len = 0
+        self._journal_good = 0
+        self._signature = None
         self.rules: list[str] = self._load()
 
+    def _disk_signature(self) -> tuple:
+        """Cheap fingerprint of the snapshot and journal files."""
+        signature = []
+        for path in (self.path, self.journal_path):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def refresh(self):
+        """Pick up rule changes committed by other processes."""
+        if self._pending is None and self._disk_signature() != self._signature:
+            self.rules = self._load()
+
     def _load(self) -> list[str]:
-        """Load rules from file."""
-        if not os.path.exists(config.PROCEDURAL_MEMORY_FILE):
-            return []
+        """Load the snapshot and replay any journaled operations on top of it."""
+        self._signature = self._disk_signature()
+        rules = []
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    rules = json.load(f)
+            except (json.JSONDecodeError, IOError):
+                print(f"  Warning: unreadable procedural snapshot {self.path}, replaying journal only")
+
+        self._journal_len = 0
+        self._journal_good = 0  # byte offset just past the last complete entry
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated entry")
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn write from a crash (or an append still in progress)
+                    ops = entry.get("ops") if isinstance(entry, dict) else None
+                    for op in ops or []:
+                        rules = _apply_op(rules, op)
+                    self._journal_len += 1
+                    self._journal_good += len(line)
+        return rules
+
+    def _drop_torn_tail(self):
+        """Cut the journal back to its last complete entry. Call under the file lock.
+
+        Holding the lock rules out an append in progress, so anything past that
+        entry is a crashed write; appending after it would hide every later entry.
+        """
         try:
-            with open(config.PROCEDURAL_MEMORY_FILE, "r") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return []
-
-    def _save(self):
-        """Persist rules to file."""
-        with open(config.PROCEDURAL_MEMORY_FILE, "w") as f:
+            if os.path.getsize(self.journal_path) > self._journal_good:
+                os.truncate(self.journal_path, self._journal_good)
+        except FileNotFoundError:
+            pass
+
+    def _commit(self, ops: list[dict]):
+        """Append a batch of operations to the journal as one atomic line."""
+        if not ops:
+            return
+        with file_lock(self.lock_path):
+            # Apply on top of whatever other processes committed in the meantime
+            rules = self._load()
+            self._drop_torn_tail()
+            for op in ops:
+                rules = _apply_op(rules, op)
+            self.rules = rules
+            with open(self.journal_path, "a") as f:
+                f.write(json.dumps({"ops": ops}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_len += 1
+            if self._journal_len >= config.PROCEDURAL_SNAPSHOT_EVERY:
+                self._snapshot()
+            self._signature = self._disk_signature()
+
+    def _snapshot(self):
+        """Atomically rewrite the snapshot and truncate the journal."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
             json.dump(self.rules, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        # A crash before this truncation is harmless: replay is idempotent
+        open(self.journal_path, "w").close()
+        self._journal_len = 0
+
+    def reset(self):
+        """Forget every rule: remove the snapshot, journal and lock file.
+
+        Runs under the file lock so it cannot interleave with another process's
+        commit; deleting only the snapshot would let the journal replay the rules.
+        """
+        with file_lock(self.lock_path):
+            for path in (self.path, self.path + ".tmp", self.journal_path, self.lock_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self.rules = []
+        self._journal_len = 0
+        self._journal_good = 0
+        self._signature = self._disk_signature()
+
+    def _record(self, op: dict):
+        """Apply an operation in memory and journal it (or queue it inside a batch)."""
+        self.rules = _apply_op(self.rules, op)
+        if self._pending is not None:
+            self._pending.append(op)
+        else:
+            self._commit([op])
+
+    @contextmanager
+    def batch(self):
+        """Group several rule changes into a single journal commit.
+
+        If the block raises, the in-memory rules are rolled back and nothing is written.
+        """
+        if self._pending is not None:
+            yield self
+            return
+        before = list(self.rules)
+        self._pending = []
+        try:
+            yield self
+        except BaseException:
+            self.rules = before
+            raise
+        else:
+            self._commit(self._pending)
+        finally:
+            self._pending = None
+
+    def get_rules(self) -> list[str]:
+        """Current rules, most important first."""
+        self.refresh()
+        return list(self.rules)
 
     def get_rules_text(self) -> str | None:
         """Format rules for system prompt injection."""
-        if not self.rules:
+        return self.format_rules(self.get_rules())
+
+    @staticmethod
+    def format_rules(rules: list[str]) -> str | None:
+        if not rules:
             return None
-        lines = [f"{i+1}. {rule}" for i, rule in enumerate(self.rules)]
+        lines = [f"{i+1}. {rule}" for i, rule in enumerate(rules)]
         return "\n".join(lines)
 
     def update(self, new_learnings: str):
@@ -63,36 +222,36 @@ class ProceduralMemory:
 
         current = self.get_rules_text() or "No rules yet."
 
-        try:
-            response = self.llm.messages.create(
-                model=config.MODEL_NAME,
-                max_tokens=1024,
-                temperature=0.3,
-                messages=[{
-                    "role": "user",
-                    "content": UPDATE_PROMPT.format(
-                        current_rules=current,
-                        new_learnings=new_learnings,
-                        max_rules=config.MAX_PROCEDURAL_RULES,
-                    ),
-                }],
-            )
-            text = response.content[0].text
-            if "```" in text:
-                text = text.split("```")[1]
-                if text.startswith("json"):
-                    text = text[4:]
-            updated = json.loads(text.strip())
-            if isinstance(updated, list) and all(isinstance(r, str) for r in updated):
-                self.rules = updated[:config.MAX_PROCEDURAL_RULES]
-                self._save()
-        except (json.JSONDecodeError, IndexError, KeyError):
-            pass  # keep existing rules if update fails
-
-    def add_rule(self, rule: str):
-        """Directly add a rule (used by consolidation promotion)."""
-        if rule not in self.rules:
-            self.rules.append(rule)
-            if len(self.rules) > config.MAX_PROCEDURAL_RULES:
-                self.rules = self.rules[-config.MAX_PROCEDURAL_RULES:]
-            self._save()
+        updated = self.llm.create_json(
+            "rules",
+            validate=lambda rules: isinstance(rules, list) and all(isinstance(r, str) for r in rules),
+            **task_params("rules"),
+            messages=[{
+                "role": "user",
+                "content": UPDATE_PROMPT.format(
+                    current_rules=current,
+                    new_learnings=new_learnings,
+                    max_rules=config.MAX_PROCEDURAL_RULES,
+                ),
+            }],
+        )
+        # Keep existing rules if the update did not parse
+        if updated is not None:
+            self._record({"op": "set", "rules": updated[:config.MAX_PROCEDURAL_RULES]})
+
+    def add_rule(self, rule: str) -> bool:
+        """Directly add a rule (used by consolidation promotion). Returns False if it was already there."""
+        if rule in self.rules:
+            return False
+        self._record({"op": "add", "rule": rule})
+        return True
+
+    def replace_rules(self, rules: list[str]):
+        """Replace every rule (used when importing a snapshot)."""
+        self._record({"op": "set", "rules": list(rules)[:config.MAX_PROCEDURAL_RULES]})
+
+    def add_rules(self, rules: list[str]) -> int:
+        """Add several rules with a single journal commit. Returns how many were new."""
+        self.refresh()
+        with self.batch():
+            return sum(self.add_rule(rule) for rule in rules)
@@ -0,0 +1,132 @@
+"""Consolidation scheduler - decides when a namespace should sleep.
+
+Instead of consolidating every N conversations, the scheduler looks at:
+- growth: episodes stored since the last run,
+- duplicate density: the share of a random sample of episodes that has a
+  near-duplicate (cosine >= CONSOLIDATION_THRESHOLD) in the store, computed
+  on the embedding mirror without any LLM calls,
+- idle time: consolidation only runs while the session is not chatting,
+  unless SCHEDULER_MAX_NEW_EPISODES have piled up - a session that never
+  pauses long enough would otherwise grow without bound.
+
+Each run is limited to CONSOLIDATION_TIME_BUDGET_SECONDS and
+CONSOLIDATION_TOKEN_BUDGET; whatever is left over is persisted with the rest
+of the state and resumed by the next run.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+import config
+from memory.consolidation import Consolidation
+from memory.tracing import tracer
+
+
+class ConsolidationScheduler:
+    """Per-namespace consolidation trigger with persisted state.
+
+    Args:
+        consolidation: The namespace's Consolidation.
+        path: State file (SCHEDULER_DIR/{collection}.json if None).
+    """
+
+    def __init__(self, consolidation: Consolidation, path: str = None):
+        self.consolidation = consolidation
+        self.episodic = consolidation.episodic
+        self.path = path or os.path.join(
+            config.SCHEDULER_DIR, f"{self.episodic.collection.name}.json"
+        )
+        self.last_activity = 0.0  # in memory only: a fresh process counts as idle
+        self.state = self._load()
+
+    def touch(self):
+        """Record session activity (call on every chat turn)."""
+        self.last_activity = time.time()
+
+    def note_stored(self, n: int = 1):
+        """Count newly stored episodes towards the next run."""
+        self.state["new_episodes"] += n
+        self._save()
+
+    def duplicate_rate(self, sample_size: int = None) -> float:
+        """Estimated share of episodes that have a near-duplicate in the store."""
+        vectors = self.episodic.mirror.vectors()
+        if len(vectors) < 2:
+            return 0.0
+        sample_size = min(sample_size or config.SCHEDULER_SAMPLE_SIZE, len(vectors))
+        rows = np.random.default_rng().choice(len(vectors), size=sample_size, replace=False)
+        norms = np.linalg.norm(vectors, axis=1)
+        norms[norms == 0] = 1.0
+        scores = (vectors[rows] / norms[rows, None]) @ (vectors / norms[:, None]).T
+        scores[np.arange(sample_size), rows] = -1.0  # ignore each row's match with itself
+        return float((scores.max(axis=1) >= config.CONSOLIDATION_THRESHOLD).mean())
+
+    def signals(self) -> dict:
+        """The inputs to due(), for logging and stats."""
+        return {
+            "new_episodes": self.state["new_episodes"],
+            "duplicate_rate": self.duplicate_rate(),
+            "idle_seconds": time.time() - self.last_activity,
+            "pending": self.state["pending"] is not None,
+            "last_run_at": self.state["last_run_at"],
+        }
+
+    def due(self, idle_seconds: float = None) -> str | None:
+        """Why consolidation should run now ("resume", "duplicates", "growth"), or None."""
+        if idle_seconds is None:
+            idle_seconds = config.SCHEDULER_IDLE_SECONDS
+        new = self.state["new_episodes"]
+        if new >= config.SCHEDULER_MAX_NEW_EPISODES:
+            return "growth"  # the hard limit does not wait for the session to go idle
+        if time.time() - self.last_activity < idle_seconds:
+            return None
+        if self.state["pending"] is not None:
+            return "resume"
+        if new < config.SCHEDULER_MIN_NEW_EPISODES:
+            return None
+        if self.duplicate_rate() >= config.SCHEDULER_MIN_DUPLICATE_RATE:
+            return "duplicates"
+        return None
+
+    def run(self, reason: str = "manual") -> bool:
+        """Run one budgeted consolidation pass. Returns True if it finished."""
+        print(f"  Running memory consolidation (sleep phase, {reason})...")
+        start = time.perf_counter()
+        with tracer.span(f"scheduler.{reason}"):
+            pending = self.consolidation.run(
+                time_budget=config.CONSOLIDATION_TIME_BUDGET_SECONDS,
+                token_budget=config.CONSOLIDATION_TOKEN_BUDGET,
+                pending=self.state["pending"],
+            )
+        if self.state["pending"] is None:
+            self.state["new_episodes"] = 0  # a fresh pass has seen everything stored so far
+        self.state["pending"] = pending
+        self.state["last_run_at"] = time.time()
+        self.state["last_run_seconds"] = time.perf_counter() - start
+        self._save()
+        return pending is None
+
+    def maybe_run(self, idle_seconds: float = None) -> bool:
+        """Run if due. Returns True if a pass ran."""
+        reason = self.due(idle_seconds)
+        if reason is None:
+            return False
+        self.run(reason)
+        return True
+
+    def _load(self) -> dict:
+        state = {"new_episodes": 0, "last_run_at": None, "last_run_seconds": None, "pending": None}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                state.update(json.load(f))
+        return state
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
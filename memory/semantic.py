@@ -1,29 +1,113 @@
 """Semantic memory - RAG over documents stored in ChromaDB."""
 
+import bisect
 import os
-import chromadb
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+import numpy as np
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import config
+from memory.answer_cache import AnswerCache
+from memory.storage import index_metadata, open_client
+from memory.vectorstore import open_collection
 
+# Preamble of the message that injects retrieved chunks into a turn
+RETRIEVAL_HEADER = (
+    "[KNOWLEDGE BASE RETRIEVAL]\n"
+    "The following excerpts were retrieved from your document memory. "
+    "Use ONLY this information to answer factual questions about these topics. "
+    "If the user's question is not covered by these excerpts, say you don't have "
+    "that information in your knowledge base.\n\n"
+)
 
-class SemanticMemory:
-    """Factual knowledge base built from documents."""
+class ReadWriteLock:
+    """Many concurrent readers or one writer. A waiting writer holds back new readers."""
 
     def __init__(self):
-        self.client = chromadb.PersistentClient(path=config.CHROMA_PERSIST_DIR)
-        self.collection = self.client.get_or_create_collection(
-            name="semantic_memory",
-            metadata={"hnsw:space": "cosine"},
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def reading(self):
+        with self._condition:
+            while self._writing or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+def file_signature(path: str) -> dict:
+    """Chunk metadata that identifies the version of a source file."""
+    stat = os.stat(path)
+    return {"source_mtime": stat.st_mtime, "source_size": stat.st_size}
+
+
+class SemanticMemory:
+    """Factual knowledge base built from documents.
+
+    Args:
+        client: Shared ChromaDB client. A new one is opened if None.
+        embedding_function: ChromaDB embedding function. Chroma's default if None.
+        index_profile: HNSW profile used if the collection is created
+            (SEMANTIC_INDEX_PROFILE if None).
+        answers: Cache of replies to factual questions over this store (a
+            persistent AnswerCache if None). Cleared whenever documents are added.
+
+    Searches run under the read side of `gate` and every write batch under
+    the write side, so the count and the query of one search see the same
+    store. Documents are written batch by batch: a search during ingestion
+    may see part of a document.
+    """
+
+    def __init__(self, client=None, embedding_function=None, index_profile: str = None,
+                 answers: AnswerCache = None):
+        self.client = client or open_client()
+        # Chunks are embedded here, before a batch takes the write side of the gate
+        self.embedding_function = embedding_function or DefaultEmbeddingFunction()
+        self.gate = ReadWriteLock()
+        self.collection = open_collection(
+            self.client,
+            "semantic_memory",
+            index_metadata(index_profile or config.SEMANTIC_INDEX_PROFILE),
+            embedding_function,
         )
         self.splitter = RecursiveCharacterTextSplitter(
             chunk_size=config.CHUNK_SIZE,
             chunk_overlap=config.CHUNK_OVERLAP,
             separators=["\n\n", "\n", ".", "?", "!", " ", ""],
+            add_start_index=True,
         )
+        self.answers = answers if answers is not None else AnswerCache()
 
     def ingest_pdf(self, pdf_path: str):
-        """Load a PDF, chunk it, and store in ChromaDB."""
+        """Stream a PDF page by page, chunk it, and store in ChromaDB."""
         filename = os.path.basename(pdf_path)
 
         # Check if already ingested
@@ -32,20 +116,120 @@ class SemanticMemory:
             print(f"  Already ingested: {filename} ({len(existing['ids'])} chunks)")
             return
 
-        loader = PyPDFLoader(pdf_path)
-        pages = loader.load()
-        full_text = "\n\n".join(p.page_content for p in pages)
-        chunks = self.splitter.split_text(full_text)
+        n_chunks = self.ingest_pages(_pdf_pages(pdf_path), source=filename,
+                                     metadata=file_signature(pdf_path))
+        print(f"  Ingested: {filename} -> {n_chunks} chunks")
 
-        ids = [f"{filename}_chunk_{i}" for i in range(len(chunks))]
-        metadatas = [{"source": filename, "chunk_index": i} for i in range(len(chunks))]
+    def ingest_text(self, text: str, source: str) -> int:
+        """Chunk raw text and store it under the given source name."""
+        return self.ingest_pages([(text, None)], source)
 
-        self.collection.add(
-            ids=ids,
-            documents=chunks,
-            metadatas=metadatas,
-        )
-        print(f"  Ingested: {filename} -> {len(chunks)} chunks")
+    def ingest_pages(self, pages: Iterable[tuple[str, int | None]], source: str,
+                     metadata: dict = None) -> int:
+        """Chunk (text, page_number) pairs as they arrive and add them in batches.
+
+        `metadata` is added to every chunk. Returns the number of chunks stored.
+        """
+        count = 0
+        batch = []
+        for chunk in self.iter_chunks(pages):
+            batch.append(chunk)
+            if len(batch) >= config.INGEST_BATCH_SIZE:
+                self._add_chunks(batch, source, count, metadata)
+                count += len(batch)
+                batch = []
+        if batch:
+            self._add_chunks(batch, source, count, metadata)
+            count += len(batch)
+        return count
+
+    def stored_signature(self, source: str) -> dict | None:
+        """Metadata of one stored chunk of a source (holds its file_signature), or None."""
+        stored = self.collection.get(where={"source": source}, limit=1, include=["metadatas"])
+        return stored["metadatas"][0] if stored["ids"] else None
+
+    def replace_pdf(self, pdf_path: str) -> int:
+        """(Re-)ingest a changed PDF in place. Returns the number of chunks stored.
+
+        The stored chunks of the source are deleted first and the new ones are
+        streamed in INGEST_BATCH_SIZE batches, so memory does not grow with the
+        file. If reading fails midway, the partial document is removed again.
+        """
+        source = os.path.basename(pdf_path)
+        signature = file_signature(pdf_path)
+        self._delete_source(source)
+        try:
+            return self.ingest_pages(_pdf_pages(pdf_path), source, metadata=signature)
+        except BaseException:
+            self._delete_source(source)
+            raise
+
+    def _delete_source(self, source: str):
+        with self.gate.writing():
+            stale = self.collection.get(where={"source": source}, include=[])["ids"]
+            if stale:
+                self.collection.delete(ids=stale)
+                self.answers.clear()
+
+    def iter_chunks(self, pages: Iterable[tuple[str, int | None]]) -> Iterator[tuple[str, int | None]]:
+        """Yield (chunk, page_number) from a stream of pages with bounded memory.
+
+        Text is split a window of a few chunks at a time. The last, possibly
+        incomplete chunk of each window is carried into the next one, so
+        chunks and their overlap run across page boundaries just as if the
+        pages had been joined. A chunk's page is the page it starts on.
+        """
+        window = config.CHUNK_SIZE * config.INGEST_WINDOW_CHUNKS
+        buffer = ""
+        offsets, page_numbers = [], []  # where each page starts in the buffer
+
+        def split(final: bool):
+            nonlocal buffer, offsets, page_numbers
+            docs = self.splitter.create_documents([buffer])
+            emit = docs if final else docs[:-1]
+            for doc in emit:
+                start = doc.metadata["start_index"]
+                yield doc.page_content, page_numbers[bisect.bisect_right(offsets, start) - 1]
+            if final or not emit:
+                return
+            # Carry the tail forward, rebasing page offsets onto the new buffer
+            cut = docs[-1].metadata["start_index"]
+            first = bisect.bisect_right(offsets, cut) - 1
+            buffer = buffer[cut:]
+            offsets = [0] + [offset - cut for offset in offsets[first + 1:]]
+            page_numbers = page_numbers[first:]
+
+        for text, page in pages:
+            if buffer:
+                buffer += "\n\n"
+            offsets.append(len(buffer))
+            page_numbers.append(page)
+            buffer += text
+            if len(buffer) >= window:
+                yield from split(final=False)
+        if buffer.strip():
+            yield from split(final=True)
+
+    def _add_chunks(self, chunks: list[tuple[str, int | None]], source: str, first_index: int,
+                    extra: dict = None):
+        ids, documents, metadatas = self._chunk_records(chunks, source, first_index, extra)
+        embeddings = np.asarray(self.embedding_function(documents), dtype=np.float32)
+        with self.gate.writing():
+            self.collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+            self.answers.clear()
+
+    @staticmethod
+    def _chunk_records(chunks: list[tuple[str, int | None]], source: str, first_index: int,
+                       extra: dict = None) -> tuple[list[str], list[str], list[dict]]:
+        ids, documents, metadatas = [], [], []
+        for i, (text, page) in enumerate(chunks, start=first_index):
+            ids.append(f"{source}_chunk_{i}")
+            documents.append(text)
+            metadata = {"source": source, "chunk_index": i, **(extra or {})}
+            if page is not None:
+                metadata["page"] = page
+            metadatas.append(metadata)
+        return ids, documents, metadatas
 
     def ingest_all(self, data_dir: str = "./data"):
         """Ingest all PDFs from the data directory."""
@@ -61,38 +245,56 @@ class SemanticMemory:
         for pdf in pdfs:
             self.ingest_pdf(os.path.join(data_dir, pdf))
 
+    def search(self, query: str) -> tuple[list[str], list[str]]:
+        """IDs and texts of the chunks most relevant to a query."""
+        return self.search_many([query])[0]
+
+    def search_many(self, queries: list[str], embeddings=None) -> list[tuple[list[str], list[str]]]:
+        """search() for several queries with one index call (embeddings: precomputed query vectors)."""
+        with self.gate.reading():
+            count = self.collection.count()
+            if count == 0 or not queries:
+                return [([], []) for _ in queries]
+
+            if embeddings is None:
+                embeddings = self.embedding_function(queries)
+            results = self.collection.query(
+                query_embeddings=embeddings,
+                n_results=min(config.SEMANTIC_TOP_K, count),
+            )
+        return list(zip(results["ids"], results["documents"]))
+
     def recall(self, query: str) -> str | None:
         """Retrieve relevant chunks for a query."""
-        if self.collection.count() == 0:
-            return None
-
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=min(config.SEMANTIC_TOP_K, self.collection.count()),
-        )
+        _, chunks = self.search(query)
+        return self.format_chunks(chunks)
 
-        if not results["documents"][0]:
+    @staticmethod
+    def format_chunks(chunks: list[str]) -> str | None:
+        if not chunks:
             return None
-
-        chunks = results["documents"][0]
-        formatted = "\n\n".join(
+        return "\n\n".join(
             f"[Chunk {i+1}]\n{chunk}" for i, chunk in enumerate(chunks)
         )
-        return formatted
 
     def recall_as_message(self, query: str) -> dict | None:
         """Retrieve chunks and format as a user message for injection."""
-        context = self.recall(query)
+        _, chunks = self.search(query)
+        return self.context_message(chunks)
+
+    @classmethod
+    def context_message(cls, chunks: list[str]) -> dict | None:
+        """The user message that injects retrieved chunks into a turn."""
+        context = cls.format_chunks(chunks)
         if not context:
             return None
 
-        return {
-            "role": "user",
-            "content": (
-                f"[KNOWLEDGE BASE RETRIEVAL]\n"
-                f"The following excerpts were retrieved from your document memory. "
-                f"Use ONLY this information to answer factual questions about these topics. "
-                f"If the user's question is not covered by these excerpts, say you don't have "
-                f"that information in your knowledge base.\n\n{context}"
-            ),
-        }
+        return {"role": "user", "content": RETRIEVAL_HEADER + context}
+
+
+def _pdf_pages(pdf_path: str) -> Iterator[tuple[str, int]]:
+    """(text, page_number) per page, read lazily."""
+    return (
+        (doc.page_content, doc.metadata.get("page", 0) + 1)
+        for doc in PyPDFLoader(pdf_path).lazy_load()
+    )
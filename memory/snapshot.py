@@ -0,0 +1,266 @@
+"""Snapshots - move an agent's whole memory as one compressed, versioned file.
+
+A snapshot is a zip archive:
+
+    manifest.json                  format version, collections, counts
+    collections/{name}/{n}.json    ids, documents and metadatas of one shard
+    collections/{name}/{n}.npy     the shard's embeddings, float32
+    procedural.json                rules of every procedural store
+    archive/{file}                 cold episode archives (EPISODIC_ARCHIVE_DIR)
+
+Export is safe while agents keep writing (in-process, or with CHROMA_MODE =
+"http"): each collection is read by id in shards and its id list re-read
+until no new ids appear (at most MAX_EXPORT_PASSES times). Ids deleted
+mid-export are listed in the manifest and skipped on import, so every
+collection matches its state at the last listing. Import adds the stored
+embeddings directly - nothing is re-embedded - through open_collection, so
+small stores land on the flat backend (see memory/vectorstore.py), and
+rebuilds the embedding mirrors, so a new replica starts in seconds.
+
+reset_state deletes every store a node keeps on disk, for a clean slate.
+"""
+
+import io
+import json
+import os
+import shutil
+import time
+import zipfile
+
+import numpy as np
+from chromadb.api.client import SharedSystemClient
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+import config
+from memory.procedural import ProceduralMemory
+from memory.storage import open_client
+from memory.vectors import EmbeddingMirror
+from memory.vectorstore import (
+    FlatCollection,
+    collection_names,
+    existing_collection,
+    flat_collection_names,
+    open_collection,
+)
+
+SNAPSHOT_VERSION = 1
+SHARD_SIZE = 1000
+MAX_EXPORT_PASSES = 10
+
+
+def _memory_collections(client) -> list[str]:
+    return [
+        name for name in collection_names(client)
+        if name == "semantic_memory"
+        or (name.startswith("episodic_memory") and not name.endswith("__rebuild"))
+    ]
+
+
+def _procedural_paths() -> dict[str, str]:
+    """Snapshot key -> rule file path for the default store and every user's.
+
+    A store that has not been compacted yet exists only as its journal.
+    """
+    paths = {"default": config.PROCEDURAL_MEMORY_FILE}
+    if os.path.isdir(config.PROCEDURAL_DIR):
+        for name in sorted(os.listdir(config.PROCEDURAL_DIR)):
+            store = name.removesuffix(".journal")
+            if store.endswith(".txt"):
+                paths[f"user:{store[:-len('.txt')]}"] = os.path.join(config.PROCEDURAL_DIR, store)
+    return paths
+
+
+def _procedural_path(key: str) -> str:
+    if key == "default":
+        return config.PROCEDURAL_MEMORY_FILE
+    return os.path.join(config.PROCEDURAL_DIR, f"{key.removeprefix('user:')}.txt")
+
+
+def _embedding_function_name(collection) -> str | None:
+    if isinstance(collection, FlatCollection):
+        return collection.embedding_function_name
+    function = (collection.configuration or {}).get("embedding_function")
+    try:
+        return function.name() if function is not None else None
+    except Exception:
+        return None
+
+
+def _export_collection(archive: zipfile.ZipFile, collection) -> dict:
+    """Write one collection's shards; returns its manifest entry."""
+    prefix = f"collections/{collection.name}"
+    written: set[str] = set()
+    shards = 0
+    dim = None
+    pending = collection.get(include=[])["ids"]
+    for _ in range(MAX_EXPORT_PASSES):  # ids added after the last pass are left out
+        for start in range(0, len(pending), SHARD_SIZE):
+            page = collection.get(
+                ids=pending[start:start + SHARD_SIZE],
+                include=["embeddings", "documents", "metadatas"],
+            )
+            if not page["ids"]:
+                continue  # deleted since listing
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            dim = embeddings.shape[1]
+            buffer = io.BytesIO()
+            np.save(buffer, embeddings)
+            archive.writestr(f"{prefix}/{shards}.npy", buffer.getvalue())
+            archive.writestr(f"{prefix}/{shards}.json", json.dumps({
+                "ids": page["ids"],
+                "documents": page["documents"],
+                "metadatas": page["metadatas"],
+            }))
+            written.update(page["ids"])
+            shards += 1
+        current = set(collection.get(include=[])["ids"])
+        pending = sorted(current - written)
+        if not pending:
+            break
+    return {
+        "name": collection.name,
+        "count": len(written & current),
+        "dim": dim,
+        "shards": shards,
+        "deleted": sorted(written - current),
+        "metadata": collection.metadata or {"hnsw:space": "cosine"},
+        "embedding_function": _embedding_function_name(collection),
+    }
+
+
+def export_snapshot(path: str, client=None) -> dict:
+    """Write every memory store to a snapshot file. Returns the manifest.
+
+    Flush pending episodic access stats first if agents are running in this
+    process (SessionManager.export_snapshot does).
+    """
+    client = client or open_client()
+    manifest = {"version": SNAPSHOT_VERSION, "created_at": time.time(), "collections": []}
+    tmp_path = path + ".tmp"
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name in _memory_collections(client):
+            manifest["collections"].append(_export_collection(archive, existing_collection(client, name)))
+
+        rules = {}
+        for key, rule_path in _procedural_paths().items():
+            if os.path.exists(rule_path) or os.path.exists(rule_path + ".journal"):
+                rules[key] = ProceduralMemory(path=rule_path).rules
+        archive.writestr("procedural.json", json.dumps(rules))
+        manifest["procedural"] = sorted(rules)
+
+        manifest["archives"] = []
+        if os.path.isdir(config.EPISODIC_ARCHIVE_DIR):
+            for name in sorted(os.listdir(config.EPISODIC_ARCHIVE_DIR)):
+                archive.write(os.path.join(config.EPISODIC_ARCHIVE_DIR, name), f"archive/{name}")
+                manifest["archives"].append(name)
+
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def import_snapshot(path: str, client=None, embedding_function=None, replace: bool = False) -> dict:
+    """Load a snapshot into this node's stores. Returns the manifest.
+
+    Args:
+        path: Snapshot file written by export_snapshot.
+        client: ChromaDB client (open_client() if None).
+        embedding_function: The function agents on this node will query with
+            (Chroma's default if None). Must match the one the snapshot was
+            embedded with.
+        replace: Overwrite existing non-empty collections and rule files
+            instead of refusing.
+    """
+    client = client or open_client()
+    with zipfile.ZipFile(path, "r") as archive:
+        manifest = json.loads(archive.read("manifest.json"))
+        if manifest["version"] > SNAPSHOT_VERSION:
+            raise ValueError(f"snapshot version {manifest['version']} is newer than supported ({SNAPSHOT_VERSION})")
+
+        expected = (embedding_function or DefaultEmbeddingFunction()).name()
+        existing = {name: existing_collection(client, name) for name in collection_names(client)}
+        for entry in manifest["collections"]:
+            if entry["name"] in existing and existing[entry["name"]].count() and not replace:
+                raise ValueError(f"collection {entry['name']} is not empty (use replace=True)")
+            if entry["embedding_function"] not in (None, expected):
+                raise ValueError(
+                    f"{entry['name']} was embedded with {entry['embedding_function']}, not {expected}"
+                )
+        procedural = {
+            key: (ProceduralMemory(path=_procedural_path(key)), rules)
+            for key, rules in json.loads(archive.read("procedural.json")).items()
+        }
+        if not replace:
+            for key, (store, _) in procedural.items():
+                if store.rules:
+                    raise ValueError(f"procedural store {key} already has rules (use replace=True)")
+            for name in manifest["archives"]:
+                if os.path.exists(os.path.join(config.EPISODIC_ARCHIVE_DIR, name)):
+                    raise ValueError(f"episode archive {name} already exists (use replace=True)")
+
+        chroma_names = {c.name for c in client.list_collections()}
+        for entry in manifest["collections"]:
+            name = entry["name"]
+            if name in chroma_names:
+                client.delete_collection(name)
+            if name in flat_collection_names():
+                FlatCollection(name).drop()
+            collection = open_collection(client, name, entry["metadata"], embedding_function)
+            deleted = set(entry["deleted"])
+            for shard in range(entry["shards"]):
+                records = json.loads(archive.read(f"collections/{name}/{shard}.json"))
+                embeddings = np.load(io.BytesIO(archive.read(f"collections/{name}/{shard}.npy")))
+                keep = [i for i, record_id in enumerate(records["ids"]) if record_id not in deleted]
+                if not keep:
+                    continue
+                collection.add(
+                    ids=[records["ids"][i] for i in keep],
+                    embeddings=embeddings[keep],
+                    documents=[records["documents"][i] for i in keep],
+                    metadatas=[records["metadatas"][i] for i in keep],
+                )
+            if name.startswith("episodic_memory"):
+                # A new generation, so running processes rebuild their tag indexes too
+                mirror = EmbeddingMirror(name)
+                with mirror.source.writing() as (_, generation):
+                    mirror.rebuild(collection)
+                    mirror.mark_synced(generation)
+
+        for store, rules in procedural.values():
+            store.replace_rules(rules)
+
+        if manifest["archives"]:
+            os.makedirs(config.EPISODIC_ARCHIVE_DIR, exist_ok=True)
+        for name in manifest["archives"]:
+            with open(os.path.join(config.EPISODIC_ARCHIVE_DIR, name), "wb") as f:
+                f.write(archive.read(f"archive/{name}"))
+    return manifest
+
+
+def reset_state():
+    """Delete every memory store under the configured paths.
+
+    Besides CHROMA_PERSIST_DIR that is the flat indexes, embedding mirrors,
+    scheduler state, answer cache, episode archives, parked sessions, batch
+    jobs and every procedural rule store. Snapshot files are kept. Close
+    running agents first.
+    """
+    for path in _procedural_paths().values():
+        ProceduralMemory(path=path).reset()
+    # Chroma caches one system per path; a stale one would keep the old collections
+    SharedSystemClient.clear_system_cache()
+    for path in (
+        config.CHROMA_PERSIST_DIR,
+        config.FLAT_INDEX_DIR,
+        config.EMBEDDING_MIRROR_DIR,
+        config.SCHEDULER_DIR,
+        config.EPISODIC_ARCHIVE_DIR,
+        config.SESSION_DIR,
+        config.PROCEDURAL_DIR,
+        config.BATCH_DIR,
+    ):
+        shutil.rmtree(path, ignore_errors=True)
+    if config.ANSWER_CACHE_PATH:
+        for suffix in ("", ".tmp", ".lock"):
+            if os.path.exists(config.ANSWER_CACHE_PATH + suffix):
+                os.remove(config.ANSWER_CACHE_PATH + suffix)
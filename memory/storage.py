@@ -0,0 +1,178 @@
+"""Storage backends - where ChromaDB lives and how processes share files.
+
+With CHROMA_MODE = "embedded" each process opens the on-disk store directly,
+which is only safe for a single process. With "http" every process talks to
+one Chroma server (see workers.py), which owns the collections. Files that
+several processes write (rule journals, embedding mirrors) are guarded with
+file_lock. A WriteGeneration lets copies derived from a store (the embedding
+mirror, the tag index) notice every write to it, not just ones that change
+its size.
+
+Collections are created with an HNSW profile from config.HNSW_PROFILES.
+M and construction_ef are fixed once a collection exists, so changing them
+means rebuilding it (migrate_collection); search_ef can be changed in place.
+"""
+
+import os
+import struct
+from contextlib import contextmanager
+
+import chromadb
+
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows - single-process deployments only
+    fcntl = None
+
+
+def open_client():
+    """The ChromaDB client for the configured CHROMA_MODE."""
+    if config.CHROMA_MODE == "http":
+        return chromadb.HttpClient(host=config.CHROMA_HOST, port=config.CHROMA_PORT)
+    return chromadb.PersistentClient(path=config.CHROMA_PERSIST_DIR)
+
+
+def index_metadata(profile: str) -> dict:
+    """Collection metadata for a named HNSW profile (cosine space)."""
+    try:
+        params = config.HNSW_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"unknown index profile {profile!r} (see config.HNSW_PROFILES)") from None
+    return {"hnsw:space": "cosine", **{f"hnsw:{key}": value for key, value in params.items()}}
+
+
+def index_params(collection) -> dict:
+    """The HNSW parameters a collection is actually using, in HNSW_PROFILES form."""
+    hnsw = (collection.configuration or {}).get("hnsw") or {}
+    return {
+        "M": hnsw.get("max_neighbors"),
+        "construction_ef": hnsw.get("ef_construction"),
+        "search_ef": hnsw.get("ef_search"),
+    }
+
+
+def migrate_collection(client, name: str, profile: str, embedding_function=None,
+                       page_size: int = 1000) -> str:
+    """Move an existing collection onto a new index profile.
+
+    If only search_ef differs it is changed in place. Otherwise every record
+    (ids, stored embeddings, documents, metadatas) is copied into a new
+    collection built with the profile, which then replaces the original under
+    the same name - nothing is re-embedded. Returns "unchanged", "modified" or
+    "rebuilt". Run it while nothing else writes to the collection; a rebuild
+    interrupted after the old collection was dropped is finished by running
+    it again.
+    """
+    metadata = index_metadata(profile)
+    target = config.HNSW_PROFILES[profile]
+    extra = {"embedding_function": embedding_function} if embedding_function else {}
+    staging = f"{name}__rebuild"
+    existing = {c.name for c in client.list_collections()}
+
+    if name not in existing and staging in existing:
+        client.get_collection(staging, **extra).modify(name=name)  # finish an interrupted rebuild
+        return "rebuilt"
+
+    collection = client.get_collection(name, **extra)
+    current = index_params(collection)
+    if current == target:
+        return "unchanged"
+    if current["M"] == target["M"] and current["construction_ef"] == target["construction_ef"]:
+        collection.modify(configuration={"hnsw": {"ef_search": target["search_ef"]}})
+        return "modified"
+
+    if staging in existing:
+        client.delete_collection(staging)  # leftover from a copy that did not finish
+    user_metadata = {k: v for k, v in (collection.metadata or {}).items() if not k.startswith("hnsw:")}
+    # Keep the collection's embedding function so later queries embed the same way
+    function = embedding_function or (collection.configuration or {}).get("embedding_function")
+    rebuilt = client.create_collection(
+        staging,
+        metadata={**user_metadata, **metadata},
+        **({"embedding_function": function} if function else {}),
+    )
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset
+        )
+        if not page["ids"]:
+            break
+        rebuilt.add(
+            ids=page["ids"],
+            embeddings=page["embeddings"],
+            documents=page["documents"],
+            metadatas=page["metadatas"],
+        )
+        offset += len(page["ids"])
+    client.delete_collection(name)
+    rebuilt.modify(name=name)
+    return "rebuilt"
+
+
+@contextmanager
+def file_lock(path: str):
+    """Hold an exclusive advisory lock on `path` (created if missing) across processes."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class WriteGeneration:
+    """Cross-process write counter for a store, kept in a small file.
+
+    Writers wrap each write in writing(); holders of a derived copy note the
+    generation it reflects and rebuild once current() has moved past it. A
+    write that crashed (or raised) midway is settled into a new generation
+    no copy reflects, so every copy rebuilds.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock_path = path + ".lock"
+
+    @contextmanager
+    def writing(self):
+        """Hold the lock for one write. Yields (before, after) generations."""
+        with file_lock(self._lock_path):
+            before = self._settle()
+            self._write(before + 1, before)  # started, not yet committed
+            yield before, before + 1
+            self._write(before + 1, before + 1)
+
+    @contextmanager
+    def current(self):
+        """Hold the lock and yield the committed generation, so a copy can be
+        checked and rebuilt without racing a writer."""
+        with file_lock(self._lock_path):
+            yield self._settle()
+
+    def _settle(self) -> int:
+        started, committed = self._read()
+        if started != committed:  # we hold the lock, so that writer is gone
+            self._write(started, started)
+        return started
+
+    def _read(self) -> tuple[int, int]:
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read(16)
+        except FileNotFoundError:
+            return 0, 0
+        return struct.unpack("<qq", data) if len(data) == 16 else (0, 0)
+
+    def _write(self, started: int, committed: int):
+        # 16 bytes in place, under the lock; a torn write just reads as unsettled
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.pwrite(fd, struct.pack("<qq", started, committed), 0)
+        finally:
+            os.close(fd)
@@ -0,0 +1,96 @@
+"""Inverted tag index - context tag -> episode ids for one episodic collection.
+
+Chroma stores an episode's context_tags as one comma-joined string, which
+metadata filters cannot match individual tags in. The index splits and
+normalizes them (trimmed, lowercase) and keeps tag -> ids and id -> tags maps
+in RAM. EpisodicMemory updates it on every add, fold and delete; it is built
+from the collection's metadata on open and rebuilt whenever the collection's
+write generation moves past the one it reflects (another process wrote to
+the store, even without changing its size).
+"""
+
+import threading
+
+
+def split_tags(value) -> tuple[str, ...]:
+    """Normalized tags from a comma-joined string (or a list of tags)."""
+    parts = value.split(",") if isinstance(value, str) else (value or [])
+    tags = []
+    for part in parts:
+        tag = str(part).strip().lower()
+        if tag and tag != "n/a" and tag not in tags:
+            tags.append(tag)
+    return tuple(tags)
+
+
+class TagIndex:
+    """Tag -> episode id sets, kept in step with an episodic collection. Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: dict[str, set[str]] = {}
+        self._tags: dict[str, tuple[str, ...]] = {}
+        self.generation = None  # write generation of the collection the index reflects
+
+    def add(self, ids: list[str], metadatas: list[dict]):
+        """Index episodes by their context_tags (re-adding an id replaces its tags)."""
+        with self._lock:
+            for episode_id, meta in zip(ids, metadatas):
+                self._remove(episode_id)
+                tags = split_tags((meta or {}).get("context_tags", ""))
+                self._tags[episode_id] = tags
+                for tag in tags:
+                    self._ids.setdefault(tag, set()).add(episode_id)
+
+    def delete(self, ids: list[str]):
+        with self._lock:
+            for episode_id in ids:
+                self._remove(episode_id)
+
+    def ids_for(self, tags, match: str = "any") -> set[str]:
+        """Episode ids carrying any (or, with match="all", every) of the tags."""
+        wanted = split_tags(tags)
+        with self._lock:
+            sets = [self._ids.get(tag, set()) for tag in wanted]
+            if not sets:
+                return set()
+            if match == "all":
+                return set.intersection(*sets)
+            return set.union(*sets)
+
+    def tags_of(self, episode_id: str) -> tuple[str, ...]:
+        with self._lock:
+            return self._tags.get(episode_id, ())
+
+    def counts(self) -> dict[str, int]:
+        """Episodes per tag, most used first."""
+        with self._lock:
+            return dict(sorted(((t, len(ids)) for t, ids in self._ids.items()),
+                               key=lambda pair: -pair[1]))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._tags)
+
+    def rebuild(self, collection, page_size: int = 1000):
+        """Re-index every episode from the collection's metadata."""
+        with self._lock:
+            self._ids.clear()
+            self._tags.clear()
+        for offset in range(0, collection.count(), page_size):
+            page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            self.add(page["ids"], page["metadatas"])
+
+    def sync(self, collection, generation: int):
+        """Rebuild if the collection was written (generation) or resized since the index reflected it."""
+        if generation != self.generation or len(self) != collection.count():
+            self.rebuild(collection)
+            self.generation = generation
+
+    def _remove(self, episode_id: str):
+        for tag in self._tags.pop(episode_id, ()):
+            ids = self._ids.get(tag)
+            if ids is not None:
+                ids.discard(episode_id)
+                if not ids:
+                    del self._ids[tag]
@@ -0,0 +1,93 @@
+"""Lightweight in-process tracing - stage timings and LLM token accounting."""
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Tracer:
+    """Aggregates timed spans per stage and token usage per LLM call purpose.
+
+    Thread-safe. Use the module-level `tracer` instance:
+
+        with tracer.span("chat.semantic"):
+            ...
+        tracer.record_usage("answer", response)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._spans = defaultdict(lambda: {"count": 0, "total_s": 0.0, "max_s": 0.0})
+            self._tokens = defaultdict(lambda: {"calls": 0, "input_tokens": 0, "output_tokens": 0})
+
+    @contextmanager
+    def span(self, name: str):
+        """Time a block and add it to the stage's aggregate."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats = self._spans[name]
+                stats["count"] += 1
+                stats["total_s"] += elapsed
+                stats["max_s"] = max(stats["max_s"], elapsed)
+
+    def record_usage(self, purpose: str, response):
+        """Record input/output tokens from an Anthropic response (or its usage)."""
+        usage = getattr(response, "usage", response)
+        with self._lock:
+            stats = self._tokens[purpose]
+            stats["calls"] += 1
+            stats["input_tokens"] += getattr(usage, "input_tokens", 0) or 0
+            stats["output_tokens"] += getattr(usage, "output_tokens", 0) or 0
+
+    def snapshot(self) -> dict:
+        """Return a copy of all aggregates: {"spans": {...}, "tokens": {...}}."""
+        with self._lock:
+            spans = {
+                name: {**s, "mean_s": s["total_s"] / s["count"] if s["count"] else 0.0}
+                for name, s in self._spans.items()
+            }
+            tokens = {purpose: dict(t) for purpose, t in self._tokens.items()}
+        return {"spans": spans, "tokens": tokens}
+
+    def to_prometheus(self, prefix: str = "cma") -> str:
+        """Render the aggregates in the Prometheus text exposition format."""
+        snap = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent per agent stage.",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for name, s in sorted(snap["spans"].items()):
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {s["total_s"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+        lines += [
+            f"# HELP {prefix}_stage_seconds_max Slowest observed run per stage.",
+            f"# TYPE {prefix}_stage_seconds_max gauge",
+        ]
+        for name, s in sorted(snap["spans"].items()):
+            lines.append(f'{prefix}_stage_seconds_max{{stage="{name}"}} {s["max_s"]:.6f}')
+        lines += [
+            f"# HELP {prefix}_llm_calls_total LLM calls per purpose.",
+            f"# TYPE {prefix}_llm_calls_total counter",
+        ]
+        for purpose, t in sorted(snap["tokens"].items()):
+            lines.append(f'{prefix}_llm_calls_total{{purpose="{purpose}"}} {t["calls"]}')
+        lines += [
+            f"# HELP {prefix}_llm_tokens_total LLM tokens per purpose and direction.",
+            f"# TYPE {prefix}_llm_tokens_total counter",
+        ]
+        for purpose, t in sorted(snap["tokens"].items()):
+            lines.append(f'{prefix}_llm_tokens_total{{purpose="{purpose}",direction="input"}} {t["input_tokens"]}')
+            lines.append(f'{prefix}_llm_tokens_total{{purpose="{purpose}",direction="output"}} {t["output_tokens"]}')
+        return "\n".join(lines) + "\n"
+
+
+tracer = Tracer()
@@ -0,0 +1,263 @@
+"""Memory-mapped embedding mirror - a compact copy of a collection's vectors.
+
+Chroma's get() returns embeddings as Python lists inside per-item dicts, which
+for thousands of episodes means hundreds of MB of boxed floats. The mirror
+keeps the same vectors in flat files next to the store:
+
+    {name}.vec     rows of float32, or int8 when quantized
+    {name}.scale   per-row float32 scale (int8 only)
+    {name}.ids     parallel fixed-width id array
+    {name}.count   committed row count, a write generation and the source
+                   generation the rows reflect (three int64)
+    {name}.json    dim and dtype
+    {name}.gen     the collection's WriteGeneration (memory/storage.py)
+
+Rows are appended on store and swap-removed on delete. Writers of the
+collection hold `source.writing()` and mark the mirror synced to the new
+generation once its rows are updated, so a write the mirror missed - a crash
+in between, or a writer that bypassed it - shows up as a generation mismatch
+and triggers a rebuild from the collection on the next sync, even when the
+row count still matches. Nothing is fsynced (the mirror can always be
+rebuilt); call flush() before copying the files.
+
+Several processes may share a mirror: writes hold a file lock, and every
+operation first re-reads the id index if another process bumped the
+generation.
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+import config
+from memory.storage import WriteGeneration, file_lock
+
+ID_BYTES = 64
+INITIAL_ROWS = 1024
+
+
+class EmbeddingMirror:
+    """Flat memory-mapped copy of a collection's embeddings with a parallel id array.
+
+    Args:
+        name: File prefix, usually the collection name.
+        directory: Where the files live (EMBEDDING_MIRROR_DIR if None).
+        dtype: "float32", or "int8" for per-row symmetric quantization
+            (EMBEDDING_MIRROR_DTYPE if None). Fixed once the mirror has data.
+    """
+
+    def __init__(self, name: str, directory: str = None, dtype: str = None):
+        directory = directory or config.EMBEDDING_MIRROR_DIR
+        os.makedirs(directory, exist_ok=True)
+        self._prefix = os.path.join(directory, name)
+        self._lock = threading.Lock()
+        self.dim = 0
+        self.dtype = dtype or config.EMBEDDING_MIRROR_DTYPE
+        self.count = 0
+        self._capacity = 0
+        self._vectors = self._scales = self._ids = None
+        self._index: dict[str, int] = {}
+        # [count, generation, source generation]; older two-field headers grow in place
+        self._header = self._open(".count", np.int64, (3,))
+        self._generation = -1
+        self.source = WriteGeneration(self._prefix + ".gen")
+        with self._lock:
+            self._refresh()
+
+    # -- reading ---------------------------------------------------------
+
+    def ids(self) -> list[str]:
+        with self._reading():
+            return [self._decode(raw) for raw in self._ids[:self.count]] if self.count else []
+
+    def vectors(self) -> np.ndarray:
+        """The (count, dim) float32 matrix. Zero-copy for float32 mirrors.
+
+        The float32 view aliases the file; copy it if it must survive later
+        deletes (which move rows).
+        """
+        with self._reading():
+            if not self.count:
+                return np.zeros((0, self.dim), dtype=np.float32)
+            if self.dtype == "int8":
+                return self._vectors[:self.count].astype(np.float32) * self._scales[:self.count, None]
+            return self._vectors[:self.count]
+
+    def similarities(self, query) -> np.ndarray:
+        """Dot product of every row with a query vector, without dequantizing the matrix."""
+        query = np.asarray(query, dtype=np.float32)
+        with self._reading():
+            if not self.count:
+                return np.zeros(0, dtype=np.float32)
+            scores = self._vectors[:self.count] @ query
+            if self.dtype == "int8":
+                scores = scores * self._scales[:self.count]
+            return scores
+
+    def __len__(self) -> int:
+        with self._reading():
+            return self.count
+
+    def __contains__(self, episode_id: str) -> bool:
+        with self._reading():
+            return episode_id in self._index
+
+    # -- writing ---------------------------------------------------------
+
+    def add(self, ids: list[str], embeddings):
+        """Append rows (existing ids are overwritten in place)."""
+        if not len(ids):
+            return
+        with self._writing():
+            self._add_rows(ids, embeddings)
+
+    def delete(self, ids: list[str]):
+        """Remove rows by moving the last row into each hole."""
+        with self._writing():
+            for episode_id in ids:
+                row = self._index.pop(episode_id, None)
+                if row is None:
+                    continue
+                last = self.count - 1
+                if row != last:
+                    self._vectors[row] = self._vectors[last]
+                    if self._scales is not None:
+                        self._scales[row] = self._scales[last]
+                    self._ids[row] = self._ids[last]
+                    self._index[self._decode(self._ids[row])] = row
+                self.count -= 1
+
+    def rebuild(self, collection, page_size: int = 1000):
+        """Replace the mirror's contents with every embedding in a Chroma collection."""
+        with self._writing():
+            self.count = 0
+            self._index = {}
+            offset = 0
+            while True:
+                page = collection.get(include=["embeddings"], limit=page_size, offset=offset)
+                if not page["ids"]:
+                    break
+                self._add_rows(page["ids"], page["embeddings"])
+                offset += len(page["ids"])
+
+    @property
+    def source_generation(self) -> int:
+        """Generation of the collection (self.source) that the rows reflect."""
+        return int(self._header[2])
+
+    def mark_synced(self, generation: int):
+        with self._lock:
+            self._header[2] = generation
+
+    def sync(self, collection, generation: int):
+        """Rebuild if the collection was written since the mirror reflected it.
+
+        `generation` is the collection's current one (from source.current()).
+        A count mismatch also triggers a rebuild.
+        """
+        if self.source_generation != generation or len(self) != collection.count():
+            self.rebuild(collection)
+            self.mark_synced(generation)
+
+    def flush(self):
+        """Write mapped rows through to disk."""
+        with self._lock:
+            for array in (self._vectors, self._scales, self._ids, self._header):
+                if array is not None:
+                    array.flush()
+
+    # -- internals -------------------------------------------------------
+
+    @contextmanager
+    def _reading(self):
+        with self._lock:
+            self._refresh()
+            yield
+
+    @contextmanager
+    def _writing(self):
+        """Exclusive across threads and processes; publishes count and generation on exit."""
+        with self._lock, file_lock(self._prefix + ".lock"):
+            self._refresh()
+            try:
+                yield
+            except BaseException:
+                self._generation = -1  # in-memory index may be half-updated; reload next time
+                raise
+            self._header[0] = self.count
+            self._header[1] += 1
+            self._generation = int(self._header[1])
+
+    def _refresh(self):
+        """Re-read the header and id index if another process has written since."""
+        generation = int(self._header[1])
+        if generation == self._generation:
+            return
+        if not self.dim and os.path.exists(self._prefix + ".json"):
+            with open(self._prefix + ".json", "r") as f:
+                header = json.load(f)
+            self.dim, self.dtype = header["dim"], header["dtype"]
+        if self.dim:
+            self._map(self._rows_on_disk())
+            self.count = min(int(self._header[0]), self._capacity)
+            self._index = {self._decode(raw): row for row, raw in enumerate(self._ids[:self.count])}
+        self._generation = generation
+
+    def _add_rows(self, ids: list[str], embeddings):
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if not self.dim:
+            self.dim = matrix.shape[1]
+            self._map(INITIAL_ROWS)
+            tmp_path = self._prefix + ".json.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"dim": self.dim, "dtype": self.dtype}, f)
+            os.replace(tmp_path, self._prefix + ".json")
+        new = [i for i, episode_id in enumerate(ids) if episode_id not in self._index]
+        if self.count + len(new) > self._capacity:
+            self._map(max(self._capacity * 2, self.count + len(new)))
+        for i, episode_id in enumerate(ids):
+            row = self._index.get(episode_id)
+            if row is None:
+                row = self._index[episode_id] = self.count
+                self.count += 1
+            self._write_row(row, episode_id, matrix[i])
+
+    def _write_row(self, row: int, episode_id: str, vector: np.ndarray):
+        encoded = episode_id.encode("utf-8")
+        if len(encoded) > ID_BYTES:
+            raise ValueError(f"id longer than {ID_BYTES} bytes: {episode_id!r}")
+        if self.dtype == "int8":
+            scale = float(np.abs(vector).max()) / 127 or 1.0
+            self._vectors[row] = np.round(vector / scale).astype(np.int8)
+            self._scales[row] = scale
+        else:
+            self._vectors[row] = vector
+        self._ids[row] = encoded
+
+    def _rows_on_disk(self) -> int:
+        itemsize = np.dtype(self.dtype).itemsize
+        return os.path.getsize(self._prefix + ".vec") // (self.dim * itemsize)
+
+    def _map(self, rows: int):
+        """(Re)open the files with room for `rows` rows, growing them if needed."""
+        self._vectors = self._open(".vec", self.dtype, (rows, self.dim))
+        self._ids = self._open(".ids", f"S{ID_BYTES}", (rows,))
+        if self.dtype == "int8":
+            self._scales = self._open(".scale", np.float32, (rows,))
+        self._capacity = rows
+
+    def _open(self, suffix: str, dtype, shape: tuple) -> np.memmap:
+        path = self._prefix + suffix
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        mode = "r+" if os.path.exists(path) else "w+"
+        if mode == "r+" and os.path.getsize(path) < size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+        return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+    @staticmethod
+    def _decode(raw: bytes) -> str:
+        return bytes(raw).decode("utf-8")
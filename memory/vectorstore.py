@@ -0,0 +1,482 @@
+"""Vector stores - the collection interface behind SemanticMemory and EpisodicMemory.
+
+The memory systems only use a small part of chromadb's Collection API:
+count, add, get (by ids, an equality `where`, limit/offset), query (by text
+or embedding, optionally restricted to ids), update and delete. Anything that
+provides those methods with Chroma's argument names and result shapes can
+back a store. Two do:
+
+- A Chroma collection (HNSW index, SQLite persistence).
+- FlatCollection: an exact in-process NumPy index. Searching a few hundred
+  vectors is one matrix product, cheaper than Chroma's per-call overhead.
+  It persists as {name}.{generation}.npy (float32 embeddings) plus
+  {name}.json (ids, documents, metadatas), in FLAT_INDEX_DIR. A new
+  generation is written before the JSON that names it replaces the old one,
+  so a crash leaves the previous state intact.
+
+open_collection picks the backend from VECTOR_BACKEND. "auto" returns an
+AutoCollection: a store starts flat and is copied into Chroma (stored
+embeddings, no re-embedding) once it grows past FLAT_INDEX_MAX_ITEMS.
+Stores never move back. A promotion leaves a {name}.moved marker; flat
+handles opened before it (another AutoCollection, a snapshot export, a
+batch job) raise StoreMoved instead of reading an empty store or writing an
+orphan one, and an AutoCollection follows the store to Chroma. Flat stores
+are local files, so "auto" only uses them with CHROMA_MODE = "embedded". Writers hold a file lock and readers
+reload when the JSON changed, the same scheme the procedural rule files
+use. benchmarks/flat_index.py measures where the crossover lies.
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+
+import config
+from memory.storage import file_lock
+
+GET_INCLUDE = ("metadatas", "documents")
+QUERY_INCLUDE = ("metadatas", "documents", "distances")
+
+
+class StoreMoved(RuntimeError):
+    """The flat store was moved to Chroma after this handle opened it."""
+
+
+def _flat_dir(directory: str = None) -> str:
+    return directory or config.FLAT_INDEX_DIR
+
+
+def flat_collection_names(directory: str = None) -> list[str]:
+    """Names of the flat stores on disk."""
+    directory = _flat_dir(directory)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len(".json")] for name in os.listdir(directory) if name.endswith(".json"))
+
+
+def _matches(metadata: dict, where: dict | None) -> bool:
+    """Equality filters: {"key": value} or {"key": {"$eq": value}}, combined with AND."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+            continue
+        expected = condition.get("$eq") if isinstance(condition, dict) else condition
+        if (metadata or {}).get(key) != expected:
+            return False
+    return True
+
+
+def _function_name(function) -> str | None:
+    try:
+        return function.name()
+    except Exception:
+        return None
+
+
+class FlatCollection:
+    """Exact cosine search over an in-memory matrix, with Chroma's Collection API subset.
+
+    Args:
+        name: Store name (the file prefix in `directory`).
+        metadata: Collection metadata, kept for a later move to Chroma.
+        embedding_function: Embeds documents added without embeddings and
+            query texts. Chroma's default if None.
+        directory: Where the files live (FLAT_INDEX_DIR if None).
+    """
+
+    def __init__(self, name: str, metadata: dict = None, embedding_function=None,
+                 directory: str = None):
+        self.name = name
+        self.metadata = metadata or {"hnsw:space": "cosine"}
+        self.embedding_function = embedding_function or DefaultEmbeddingFunction()
+        self.configuration = {"embedding_function": self.embedding_function}
+        # Name of the function the stored vectors came from (kept in the JSON file)
+        self.embedding_function_name = _function_name(self.embedding_function)
+        directory = _flat_dir(directory)
+        os.makedirs(directory, exist_ok=True)
+        self._prefix = os.path.join(directory, name)
+        self._json_path = self._prefix + ".json"
+        self._moved_path = self._prefix + ".moved"
+        # A marker present at open is from an earlier incarnation of this store
+        self._moved_seen = self._moved_signature()
+        self._lock = threading.RLock()
+        self._signature = None
+        self._generation = 0
+        self._clear()
+        with self._lock:
+            self._refresh()
+
+    # -- Collection API ----------------------------------------------------
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._ids)
+
+    def add(self, ids: list[str], embeddings=None, metadatas: list[dict] = None,
+            documents: list[str] = None):
+        """Insert new records (ids that already exist are skipped, like Chroma)."""
+        vectors = self._vectors_for(ids, embeddings, documents)
+        with self._writing():
+            keep = [i for i, record_id in enumerate(ids) if record_id not in self._index]
+            if not keep:
+                return
+            for i in keep:
+                self._index[ids[i]] = len(self._ids)
+                self._ids.append(ids[i])
+                self._documents.append(documents[i] if documents else None)
+                self._metadatas.append(dict(metadatas[i]) if metadatas and metadatas[i] else None)
+            added = vectors[keep]
+            self._set_vectors(np.concatenate([self._vectors, added]) if len(self._vectors) else added)
+
+    def get(self, ids: list[str] = None, where: dict = None, limit: int = None,
+            offset: int = None, include: list[str] = GET_INCLUDE) -> dict:
+        with self._lock:
+            self._refresh()
+            rows = self._rows(ids, where)
+            rows = rows[offset or 0:][:limit] if limit is not None else rows[offset or 0:]
+            return {
+                "ids": [self._ids[r] for r in rows],
+                "documents": [self._documents[r] for r in rows] if "documents" in include else None,
+                "metadatas": [self._copy(self._metadatas[r]) for r in rows] if "metadatas" in include else None,
+                "embeddings": self._vectors[rows].copy() if "embeddings" in include else None,
+                "include": list(include),
+            }
+
+    def query(self, query_embeddings=None, query_texts: list[str] = None, n_results: int = 10,
+              ids: list[str] = None, where: dict = None, include: list[str] = QUERY_INCLUDE) -> dict:
+        if query_embeddings is None:
+            texts = [query_texts] if isinstance(query_texts, str) else query_texts
+            query_embeddings = self.embedding_function(texts)
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1.0)
+        result = {key: [] for key in ("ids", "distances", "documents", "metadatas", "embeddings")}
+        with self._lock:
+            self._refresh()
+            rows = np.asarray(self._rows(ids, where), dtype=np.int64)
+            scores = self._unit[rows] @ queries.T if len(rows) else np.zeros((0, len(queries)))
+            k = min(n_results, len(rows))
+            for column in range(len(queries)):
+                top = np.argpartition(-scores[:, column], k - 1)[:k] if k else np.zeros(0, np.int64)
+                top = top[np.argsort(-scores[top, column], kind="stable")]
+                hits = rows[top]
+                result["ids"].append([self._ids[r] for r in hits])
+                result["distances"].append([float(1 - s) for s in scores[top, column]])
+                result["documents"].append([self._documents[r] for r in hits])
+                result["metadatas"].append([self._copy(self._metadatas[r]) for r in hits])
+                result["embeddings"].append(self._vectors[hits].copy())
+        for key in ("distances", "documents", "metadatas", "embeddings"):
+            if key not in include:
+                result[key] = None
+        result["include"] = list(include)
+        return result
+
+    def update(self, ids: list[str], embeddings=None, metadatas: list[dict] = None,
+               documents: list[str] = None):
+        """Change existing records; metadata keys are merged (None deletes a key), like Chroma."""
+        vectors = None
+        if embeddings is not None or documents is not None:
+            vectors = self._vectors_for(ids, embeddings, documents)
+        with self._writing():
+            changed = self._vectors.copy() if vectors is not None else None
+            for i, record_id in enumerate(ids):
+                row = self._index.get(record_id)
+                if row is None:
+                    continue
+                if documents is not None:
+                    self._documents[row] = documents[i]
+                if metadatas is not None and metadatas[i] is not None:
+                    merged = {**(self._metadatas[row] or {}), **metadatas[i]}
+                    self._metadatas[row] = {k: v for k, v in merged.items() if v is not None}
+                if changed is not None:
+                    changed[row] = vectors[i]
+            if changed is not None:
+                self._set_vectors(changed)
+            else:
+                self._save()
+
+    def delete(self, ids: list[str]):
+        with self._writing():
+            drop = {self._index[i] for i in ids if i in self._index}
+            if not drop:
+                return
+            keep = [r for r in range(len(self._ids)) if r not in drop]
+            self._ids = [self._ids[r] for r in keep]
+            self._documents = [self._documents[r] for r in keep]
+            self._metadatas = [self._metadatas[r] for r in keep]
+            self._index = {record_id: row for row, record_id in enumerate(self._ids)}
+            self._set_vectors(self._vectors[keep])
+
+    # -- files ---------------------------------------------------------------
+
+    def drop(self):
+        """Delete the store's files."""
+        with self._lock, file_lock(self._prefix + ".lock"):
+            self._remove_files()
+
+    def move_to(self, collection, page_size: int = 1000):
+        """Copy every record (stored embeddings) into `collection` and drop the files.
+
+        Runs under the file lock, so no write can land in between, and leaves
+        the marker that makes other open handles raise StoreMoved.
+        """
+        with self._writing():
+            for offset in range(0, len(self._ids), page_size):
+                rows = list(range(offset, min(offset + page_size, len(self._ids))))
+                collection.upsert(
+                    ids=[self._ids[r] for r in rows],
+                    embeddings=self._vectors[rows],
+                    documents=[self._documents[r] for r in rows],
+                    metadatas=[self._copy(self._metadatas[r]) for r in rows],
+                )
+            self._remove_files()
+            with open(self._moved_path, "w") as f:
+                f.write("chroma\n")
+            self._moved_seen = self._moved_signature()
+
+    def _remove_files(self):
+        for path in (self._json_path, self._vectors_path(self._generation)):
+            if os.path.exists(path):
+                os.remove(path)
+        self._clear()
+        self._signature = None
+
+    def _vectors_path(self, generation: int) -> str:
+        return f"{self._prefix}.{generation}.npy"
+
+    def _disk_signature(self):
+        try:
+            stat = os.stat(self._json_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _moved_signature(self):
+        try:
+            stat = os.stat(self._moved_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _refresh(self):
+        """Reload if another process (or a crash recovery) changed the files."""
+        moved = self._moved_signature()
+        if moved is not None and moved != self._moved_seen:
+            raise StoreMoved(f"flat store {self.name} was moved to Chroma")
+        signature = self._disk_signature()
+        if signature == self._signature:
+            return
+        self._signature = signature
+        if signature is None:
+            self._clear()
+            return
+        with open(self._json_path, "r") as f:
+            state = json.load(f)
+        self._generation = state["generation"]
+        self._ids = state["ids"]
+        self._documents = state["documents"]
+        self._metadatas = state["metadatas"]
+        self.metadata = state.get("metadata") or self.metadata
+        self.embedding_function_name = state.get("embedding_function") or self.embedding_function_name
+        self._index = {record_id: row for row, record_id in enumerate(self._ids)}
+        vectors = np.load(self._vectors_path(self._generation)) if self._ids else np.zeros((0, 0), np.float32)
+        self._set_vectors(vectors, persist=False)
+
+    @contextmanager
+    def _writing(self):
+        """Hold the thread and file locks with the latest state loaded."""
+        with self._lock, file_lock(self._prefix + ".lock"):
+            self._refresh()
+            try:
+                yield
+            except BaseException:
+                self._signature = None  # in-memory state may be half-updated; reload next time
+                raise
+
+    def _save(self):
+        """Write the next generation's vectors, then commit it via the JSON file."""
+        previous = self._generation
+        self._generation += 1
+        np.save(self._vectors_path(self._generation), self._vectors)
+        tmp_path = self._json_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "generation": self._generation,
+                "metadata": self.metadata,
+                "embedding_function": self.embedding_function_name,
+                "ids": self._ids,
+                "documents": self._documents,
+                "metadatas": self._metadatas,
+            }, f)
+        os.replace(tmp_path, self._json_path)
+        self._signature = self._disk_signature()
+        if self._moved_seen is not None:  # the store lives here again
+            if os.path.exists(self._moved_path):
+                os.remove(self._moved_path)
+            self._moved_seen = None
+        if os.path.exists(self._vectors_path(previous)):
+            os.remove(self._vectors_path(previous))
+
+    # -- helpers -------------------------------------------------------------
+
+    def _clear(self):
+        self._ids: list[str] = []
+        self._documents: list[str | None] = []
+        self._metadatas: list[dict | None] = []
+        self._index: dict[str, int] = {}
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._unit = self._vectors
+
+    def _set_vectors(self, vectors: np.ndarray, persist: bool = True):
+        self._vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(self._vectors, axis=1, keepdims=True) if len(self._vectors) else 1.0
+        self._unit = self._vectors / np.where(norms > 0, norms, 1.0)
+        if persist:
+            self._save()
+
+    def _vectors_for(self, ids, embeddings, documents) -> np.ndarray:
+        if embeddings is None:
+            embeddings = self.embedding_function(documents)
+        return np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+
+    def _rows(self, ids, where) -> list[int]:
+        if ids is not None:
+            ids = [ids] if isinstance(ids, str) else ids
+            rows = [self._index[i] for i in ids if i in self._index]
+        else:
+            rows = list(range(len(self._ids)))
+        if where:
+            rows = [r for r in rows if _matches(self._metadatas[r], where)]
+        return rows
+
+    @staticmethod
+    def _copy(metadata):
+        return dict(metadata) if metadata is not None else None
+
+
+class AutoCollection:
+    """A store that is flat while small and moves to Chroma past max_items.
+
+    Every Collection method is forwarded to the current backend; add() checks
+    the size afterwards, or at the end of a promotion_deferred() block.
+    `backend` is "flat" or "chroma".
+    """
+
+    def __init__(self, client, name: str, metadata: dict, embedding_function=None,
+                 max_items: int = None):
+        self._client = client
+        self._name = name
+        self._metadata = metadata
+        self._embedding_function = embedding_function
+        self.max_items = config.FLAT_INDEX_MAX_ITEMS if max_items is None else max_items
+        self._deferred = 0
+        self._store = existing_collection(client, name, embedding_function)
+        if self._store is None or not self._store.count():
+            self._store = FlatCollection(name, metadata, embedding_function)
+        self._promote_if_needed()
+
+    @property
+    def backend(self) -> str:
+        return "flat" if isinstance(self._store, FlatCollection) else "chroma"
+
+    def __getattr__(self, attr):
+        value = getattr(self._store, attr)
+        if not callable(value):
+            return value
+        return lambda *args, **kwargs: self._call(attr, *args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        self._call("add", *args, **kwargs)
+        if not self._deferred:
+            self._promote_if_needed()
+
+    @contextmanager
+    def promotion_deferred(self):
+        """Check the size only once the block ends.
+
+        For writes that add before they delete (a consolidation merge), so a
+        store at max_items is not promoted for a count it only has mid-way.
+        """
+        self._deferred += 1
+        try:
+            yield self
+        finally:
+            self._deferred -= 1
+            if not self._deferred:
+                self._promote_if_needed()
+
+    def _call(self, attr: str, *args, **kwargs):
+        """Run a Collection method, following the store if another handle moved it."""
+        try:
+            return getattr(self._store, attr)(*args, **kwargs)
+        except StoreMoved:
+            extra = {"embedding_function": self._embedding_function} if self._embedding_function else {}
+            self._store = self._client.get_collection(self._name, **extra)
+            return getattr(self._store, attr)(*args, **kwargs)
+
+    def _promote_if_needed(self):
+        """Move a flat store that outgrew max_items into Chroma."""
+        if not isinstance(self._store, FlatCollection) or self._call("count") <= self.max_items:
+            return
+        flat = self._store
+        if not isinstance(flat, FlatCollection):  # count() found it already moved
+            return
+        extra = {"embedding_function": self._embedding_function} if self._embedding_function else {}
+        chroma = self._client.get_or_create_collection(
+            name=self._name, metadata=flat.metadata or self._metadata, **extra
+        )
+        try:
+            flat.move_to(chroma)
+        except StoreMoved:
+            pass  # another handle promoted it first
+        self._store = chroma
+
+
+@contextmanager
+def promotion_deferred(collection):
+    """AutoCollection.promotion_deferred for any store; other backends never move."""
+    if isinstance(collection, AutoCollection):
+        with collection.promotion_deferred():
+            yield collection
+    else:
+        yield collection
+
+
+def existing_collection(client, name: str, embedding_function=None):
+    """The store currently holding `name`: a non-empty Chroma collection, else a
+    flat store on disk, else an (empty) Chroma collection, else None."""
+    extra = {"embedding_function": embedding_function} if embedding_function else {}
+    chroma = None
+    if name in {c.name for c in client.list_collections()}:
+        chroma = client.get_collection(name, **extra)
+        if chroma.count():
+            return chroma
+    if name in flat_collection_names():
+        return FlatCollection(name, embedding_function=embedding_function)
+    return chroma
+
+
+def collection_names(client) -> list[str]:
+    """Every store name, in Chroma or flat on disk."""
+    return sorted({c.name for c in client.list_collections()} | set(flat_collection_names()))
+
+
+def open_collection(client, name: str, metadata: dict, embedding_function=None,
+                    backend: str = None):
+    """Open or create a memory store on VECTOR_BACKEND ("chroma", "flat" or "auto")."""
+    backend = backend or config.VECTOR_BACKEND
+    if backend == "auto" and config.CHROMA_MODE != "embedded":
+        backend = "chroma"
+    if backend == "flat":
+        return FlatCollection(name, metadata, embedding_function)
+    if backend == "auto":
+        return AutoCollection(client, name, metadata, embedding_function)
+    extra = {"embedding_function": embedding_function} if embedding_function else {}
+    return client.get_or_create_collection(name=name, metadata=metadata, **extra)
@@ -0,0 +1,226 @@
+"""Ingestion watcher - keeps semantic memory in step with the data directory.
+
+A worker thread rescans the directory whenever inotify reports a finished
+write or a rename into it (Linux, through libc - no extra dependency), and
+every INGEST_WATCH_POLL_SECONDS regardless, which is the only trigger
+where inotify is unavailable. A PDF is queued when its size or mtime
+differs from the file_signature stored on its chunks. Files modified within
+INGEST_WATCH_SETTLE_SECONDS are still being written and wait for the next
+pass.
+
+The queue is worked off INGEST_WATCH_BATCH_FILES files at a time. Each file
+goes through SemanticMemory.replace_pdf: its old chunks are deleted, then
+the new ones are parsed, embedded and added one INGEST_BATCH_SIZE batch at a
+time, so memory stays flat however large the file. Searches meanwhile see
+the document partly ingested. Files that were removed from the directory
+keep their chunks.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+
+import config
+from memory.semantic import SemanticMemory
+from memory.tracing import tracer
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+
+class _Inotify:
+    """Minimal inotify watch on one directory. Raises OSError/AttributeError if unsupported."""
+
+    def __init__(self, path: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), _IN_CLOSE_WRITE | _IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {path}")
+
+    def wait(self, timeout: float) -> bool:
+        """Block until an event arrives (True) or the timeout passes (False)."""
+        ready, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class IngestWatcher:
+    """Background ingestion of new or changed PDFs in a directory.
+
+    Args:
+        semantic: The SemanticMemory to keep up to date.
+        data_dir: Directory to watch (created if missing).
+        poll_seconds, settle_seconds, batch_files: Override the
+            INGEST_WATCH_* defaults from config.
+    """
+
+    def __init__(self, semantic: SemanticMemory, data_dir: str = "./data",
+                 poll_seconds: float = None, settle_seconds: float = None, batch_files: int = None):
+        self.semantic = semantic
+        self.data_dir = data_dir
+        self.poll_seconds = config.INGEST_WATCH_POLL_SECONDS if poll_seconds is None else poll_seconds
+        self.settle_seconds = config.INGEST_WATCH_SETTLE_SECONDS if settle_seconds is None else settle_seconds
+        self.batch_files = batch_files or config.INGEST_WATCH_BATCH_FILES
+        self._known: dict[str, tuple] = {}  # path -> signature last committed (or failed)
+        self._pending: OrderedDict[str, tuple] = OrderedDict()  # path -> signature
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._inotify = None
+        self._unsettled = False
+        self.ingested_files = 0
+        self.ingested_chunks = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_commit = None
+        self.last_lag_seconds = 0.0
+
+    def start(self) -> "IngestWatcher":
+        """Start the worker thread (its first pass ingests whatever is not stored yet)."""
+        os.makedirs(self.data_dir, exist_ok=True)
+        try:
+            self._inotify = _Inotify(self.data_dir)
+        except (OSError, AttributeError, TypeError):
+            self._inotify = None  # not Linux, or no inotify: rescans only
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="ingest-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        """Stop the thread after the batch in progress is ingested."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def run_once(self) -> int:
+        """Scan the directory and ingest everything queued. Returns the files committed."""
+        with self._run_lock:
+            self._scan()
+            committed = 0
+            while not self._stop.is_set():
+                with self._lock:
+                    batch = list(self._pending.items())[:self.batch_files]
+                if not batch:
+                    break
+                committed += self._ingest(batch)
+            return committed
+
+    def stats(self) -> dict:
+        """Queue depth, ingestion lag (seconds from a file's last change to its commit) and totals."""
+        now = time.time()
+        with self._lock:
+            oldest = min((signature[0] for signature in self._pending.values()), default=None)
+            depth = len(self._pending)
+        return {
+            "backend": "inotify" if self._inotify is not None else "polling",
+            "queue_depth": depth,
+            "lag_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+            "last_lag_seconds": round(self.last_lag_seconds, 3),
+            "last_commit": self.last_commit,
+            "ingested_files": self.ingested_files,
+            "ingested_chunks": self.ingested_chunks,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+    # -- internals -------------------------------------------------------
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:  # keep watching; the next pass retries
+                self.errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+            self._wait(self.settle_seconds if self._unsettled else self.poll_seconds)
+
+    def _wait(self, timeout: float):
+        """Sleep until a directory event, the timeout or stop(), checking stop every second."""
+        deadline = time.monotonic() + timeout
+        while not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if self._inotify is None:
+                self._stop.wait(min(remaining, 1.0))
+            elif self._inotify.wait(min(remaining, 1.0)):
+                return
+
+    def _scan(self):
+        """Queue PDFs whose signature differs from the stored one."""
+        now = time.time()
+        self._unsettled = False
+        names = sorted(os.listdir(self.data_dir)) if os.path.isdir(self.data_dir) else []
+        for name in names:
+            if not name.endswith(".pdf"):
+                continue
+            path = os.path.join(self.data_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            signature = (stat.st_mtime, stat.st_size)
+            if now - stat.st_mtime < self.settle_seconds:
+                self._unsettled = True
+                continue
+            if path not in self._known:
+                stored = self.semantic.stored_signature(name)
+                if stored is not None:
+                    # Chunks from before signatures were recorded count as current
+                    self._known[path] = (stored.get("source_mtime", stat.st_mtime),
+                                         stored.get("source_size", stat.st_size))
+            if self._known.get(path) != signature:
+                with self._lock:
+                    self._pending[path] = signature
+
+    def _ingest(self, batch: list[tuple[str, tuple]]) -> int:
+        """Re-ingest one batch of files. Files that fail are skipped until they change again."""
+        done, chunks = [], 0
+        for path, signature in batch:
+            try:
+                with tracer.span("ingest.file"):
+                    chunks += self.semantic.replace_pdf(path)
+                done.append((path, signature))
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"{os.path.basename(path)}: {type(e).__name__}: {e}"
+                self._known[path] = signature
+        now = time.time()
+        with self._lock:
+            for path, signature in batch:
+                if self._pending.get(path) == signature:
+                    del self._pending[path]
+        for path, signature in done:
+            self._known[path] = signature
+        if done:
+            self.last_lag_seconds = max(now - signature[0] for _, signature in done)
+            self.last_commit = now
+            self.ingested_files += len(done)
+            self.ingested_chunks += chunks
+            print(f"  Ingested {len(done)} file(s) in the background -> {chunks} chunks")
+        return len(done)
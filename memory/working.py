@@ -1,16 +1,18 @@
 """Working memory - maintains current conversation state."""
 
-from anthropic import Anthropic
-import config
+from memory.llm import LLMGateway, as_gateway, task_params
 
 
 class WorkingMemory:
     """Chat history buffer that holds the current conversation context."""
 
-    def __init__(self, system_prompt: str = None):
-        self.client = Anthropic(api_key=config.ANTHROPIC_API_KEY)
+    def __init__(self, system_prompt: str = None, client: LLMGateway = None):
+        self.client = as_gateway(client)
         self.system_prompt = system_prompt or self._default_prompt()
         self.messages: list[dict] = []
+        # Rolling reflection of messages[:reflected], kept up to date by the agent
+        self.reflection: dict | None = None
+        self.reflected = 0
 
     def _default_prompt(self) -> str:
         return (
@@ -32,35 +34,61 @@ class WorkingMemory:
     def add_assistant_message(self, content: str):
         self.messages.append({"role": "assistant", "content": content})
 
-    def get_response(self, extra_messages: list[dict] = None) -> str:
-        """Send messages to LLM and get a response.
-
-        Args:
-            extra_messages: Optional messages to append before the LLM call
-                (e.g., semantic context) without persisting them in history.
-        """
-        messages = self.messages.copy()
+    def _build_messages(self, extra_messages: list[dict] = None, start: int = 0) -> list[dict]:
+        messages = self.messages[start:]
         if extra_messages:
             # Insert context messages before the last user message
             last_user = messages.pop()
             messages.extend(extra_messages)
             messages.append(last_user)
+        return messages
+
+    def get_response(self, extra_messages: list[dict] = None, start: int = 0) -> str:
+        """Send messages to LLM and get a response.
 
-        response = self.client.messages.create(
-            model=config.MODEL_NAME,
-            max_tokens=config.MAX_TOKENS,
-            temperature=config.TEMPERATURE,
+        Args:
+            extra_messages: Optional messages to append before the LLM call
+                (e.g., semantic context) without persisting them in history.
+            start: Index of the first history message to send (earlier ones
+                stay in history but are left out of the call).
+        """
+        response = self.client.create(
+            "answer",
+            **task_params("answer"),
             system=self.system_prompt,
-            messages=messages,
+            messages=self._build_messages(extra_messages, start),
         )
         reply = response.content[0].text
         self.add_assistant_message(reply)
         return reply
 
-    def get_conversation_text(self) -> str:
-        """Return full conversation as plain text (for episodic storage)."""
+    def stream_response(self, extra_messages: list[dict] = None, start: int = 0):
+        """Like get_response, but yield text deltas as they arrive.
+
+        The full reply is added to history once the stream completes. If the
+        reader closes the generator early, the part it received is added
+        instead, so history keeps alternating.
+        """
+        parts = []
+        try:
+            with self.client.stream(
+                "answer",
+                **task_params("answer"),
+                system=self.system_prompt,
+                messages=self._build_messages(extra_messages, start),
+            ) as stream:
+                for text in stream.text_stream:
+                    parts.append(text)
+                    yield text
+        except GeneratorExit:
+            self.add_assistant_message("".join(parts))
+            raise
+        self.add_assistant_message("".join(parts))
+
+    def get_conversation_text(self, start: int = 0) -> str:
+        """Return the conversation (from message `start` on) as plain text."""
         lines = []
-        for msg in self.messages:
+        for msg in self.messages[start:]:
             role = msg["role"].capitalize()
             lines.append(f"{role}: {msg['content']}")
         return "\n\n".join(lines)
@@ -69,6 +97,20 @@ class WorkingMemory:
         """Number of user messages in this conversation."""
         return sum(1 for m in self.messages if m["role"] == "user")
 
+    def unreflected_turns(self) -> int:
+        """User messages not yet covered by the rolling reflection."""
+        return sum(1 for m in self.messages[self.reflected:] if m["role"] == "user")
+
+    def fork(self) -> "WorkingMemory":
+        """An independent copy of this conversation (same client and system prompt)."""
+        fork = WorkingMemory(system_prompt=self.system_prompt, client=self.client)
+        fork.messages = list(self.messages)
+        fork.reflection = self.reflection
+        fork.reflected = self.reflected
+        return fork
+
     def reset(self):
-        """Clear conversation history, keep system prompt."""
+        """Clear conversation history and its reflection, keep system prompt."""
         self.messages = []
+        self.reflection = None
+        self.reflected = 0
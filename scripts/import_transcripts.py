@@ -0,0 +1,55 @@
+"""Import historical chat transcripts into episodic memory.
+
+Reads JSON-lines files where each line is {"user_id": ..., "conversation": ...}
+(user_id optional, omit for the single-user store) and stores them with
+EpisodicMemory.store_many, which reflects on several transcripts per LLM call.
+
+Run:
+    python scripts/import_transcripts.py transcripts.jsonl [more.jsonl ...]
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+
+from dotenv import load_dotenv
+load_dotenv()
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from memory.episodic import EpisodicMemory
+from memory.storage import open_client
+from sessions import namespace_for
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-import chat transcripts")
+    parser.add_argument("files", nargs="+", help="JSON-lines transcript files")
+    parser.add_argument("--chunk", type=int, default=200,
+                        help="conversations per store_many call")
+    args = parser.parse_args()
+
+    by_namespace = defaultdict(list)
+    for path in args.files:
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    user_id = record.get("user_id")
+                    by_namespace[namespace_for(user_id) if user_id else None].append(
+                        record["conversation"]
+                    )
+
+    db = open_client()
+    total = 0
+    for namespace, conversations in by_namespace.items():
+        episodic = EpisodicMemory(client=db, namespace=namespace)
+        for start in range(0, len(conversations), args.chunk):
+            total += episodic.store_many(conversations[start:start + args.chunk])
+        print(f"  {namespace or '(default)'}: {len(conversations)} conversations")
+    print(f"Done: {total} episodes stored")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Move existing collections onto a different HNSW index profile.
+
+New collections pick up SEMANTIC_INDEX_PROFILE / EPISODIC_INDEX_PROFILE when
+they are created; this rebuilds ones that already exist (see
+memory.storage.migrate_collection). Stop the agent or server first - the
+rebuild replaces each collection, so open handles would go stale.
+
+Run:
+    python scripts/migrate_index.py --profile recall                  # semantic + every episodic store
+    python scripts/migrate_index.py --profile small --episodic        # episodic stores only
+    python scripts/migrate_index.py --profile latency --collections semantic_memory
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+load_dotenv()
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import config
+from memory.storage import index_params, migrate_collection, open_client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild collections under an HNSW profile")
+    parser.add_argument("--profile", required=True, choices=sorted(config.HNSW_PROFILES))
+    scope = parser.add_mutually_exclusive_group()
+    scope.add_argument("--semantic", action="store_true", help="only the semantic store")
+    scope.add_argument("--episodic", action="store_true", help="only episodic stores")
+    scope.add_argument("--collections", nargs="+", help="explicit collection names")
+    args = parser.parse_args()
+
+    db = open_client()
+    existing = {c.name for c in db.list_collections()}
+    # A rebuild interrupted after dropping the original leaves only its staging copy
+    names = sorted({n.removesuffix("__rebuild") for n in existing})
+    if args.collections:
+        names = args.collections
+    elif args.semantic:
+        names = [n for n in names if n == "semantic_memory"]
+    elif args.episodic:
+        names = [n for n in names if n.startswith("episodic_memory")]
+    else:
+        names = [n for n in names if n == "semantic_memory" or n.startswith("episodic_memory")]
+
+    for name in names:
+        start = time.perf_counter()
+        before = index_params(db.get_collection(name)) if name in existing else "interrupted"
+        outcome = migrate_collection(db, name, args.profile)
+        print(f"  {name}: {outcome} ({before} -> {args.profile}, {time.perf_counter() - start:.1f}s)")
+    print(f"Done: {len(names)} collections")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Batch consolidation across every user namespace (run from cron).
+
+Collects all merge and promotion requests into one job file, runs it through
+a batch executor, then applies the results idempotently. Pair with
+CONSOLIDATION_MODE = "batch" so no consolidation runs on the interactive path.
+
+Run:
+    python scripts/nightly_consolidation.py                # Message Batches API
+    python scripts/nightly_consolidation.py --local        # synchronous, via the gateway
+    python scripts/nightly_consolidation.py --apply JOB RESULTS   # re-apply a finished job
+"""
+
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+load_dotenv()
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from memory.batch import (
+    AnthropicBatchExecutor, LocalBatchExecutor, apply_results, list_namespaces,
+    open_namespace, run_batch_consolidation,
+)
+from memory.storage import open_client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nightly batch consolidation")
+    parser.add_argument("--local", action="store_true", help="run requests synchronously")
+    parser.add_argument("--apply", nargs=2, metavar=("JOB", "RESULTS"),
+                        help="only apply an existing job's results")
+    args = parser.parse_args()
+
+    if args.apply:
+        db = open_client()
+        consolidations = {ns: open_namespace(ns, db) for ns in list_namespaces(db)}
+        stats = apply_results(consolidations, *args.apply)
+    else:
+        executor = LocalBatchExecutor() if args.local else AnthropicBatchExecutor()
+        stats = run_batch_consolidation(executor)
+    print(f"Done: {stats}")
+
+
+if __name__ == "__main__":
+    main()
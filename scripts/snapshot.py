@@ -0,0 +1,47 @@
+"""Export or import a snapshot of every memory store (see memory/snapshot.py).
+
+Export is safe while an agent or server is running against the same
+ChromaDB (CHROMA_MODE = "http"). Import replaces collections, so run it on
+a node whose agents are stopped.
+
+Run:
+    python scripts/snapshot.py export memory.snap
+    python scripts/snapshot.py import memory.snap              # into empty stores
+    python scripts/snapshot.py import memory.snap --replace    # overwrite existing data
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+load_dotenv()
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from memory.snapshot import export_snapshot, import_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a memory snapshot")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write every store to a snapshot file")
+    export.add_argument("path")
+    restore = commands.add_parser("import", help="load a snapshot into this node's stores")
+    restore.add_argument("path")
+    restore.add_argument("--replace", action="store_true", help="overwrite non-empty stores")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "export":
+        manifest = export_snapshot(args.path)
+    else:
+        manifest = import_snapshot(args.path, replace=args.replace)
+    for entry in manifest["collections"]:
+        print(f"  {entry['name']}: {entry['count']} records")
+    print(f"  procedural stores: {len(manifest['procedural'])}, archives: {len(manifest['archives'])}")
+    print(f"Done: {args.command} {args.path} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
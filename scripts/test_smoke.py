@@ -6,16 +6,16 @@ Run with:
     python scripts/test_smoke.py
 """
 
-import json
 import os
 import sys
-import shutil
 
 from dotenv import load_dotenv
 load_dotenv()
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 from agent import CognitiveAgent
+from memory.procedural import ProceduralMemory
+from memory.snapshot import reset_state
 
 
 def divider(step, title):
@@ -26,10 +26,7 @@ def divider(step, title):
 
 def main():
     # Clean slate
-    if os.path.exists("chroma_db"):
-        shutil.rmtree("chroma_db")
-    if os.path.exists("procedural_memory.txt"):
-        os.remove("procedural_memory.txt")
+    reset_state()
 
     agent = CognitiveAgent()
 
@@ -71,8 +68,11 @@ def main():
     agent.chat("What is the Solvik Temperature?")
 
     # --- STEP 5: Consolidation ---
-    divider(5, "CONSOLIDATION - Conv 5 triggers sleep phase")
-    agent.new_conversation()  # This is conversation #5, triggers consolidation
+    divider(5, "CONSOLIDATION - Sleep phase after Conv 5")
+    agent.new_conversation()
+    print(f"  Conv 5 done. Episodes: {agent.episodic.collection.count()}")
+    # The scheduler only runs on its own once a session is idle, so run the pass like /sleep does
+    agent.scheduler.run("manual")
     print(f"[Episodes after consolidation: {agent.episodic.collection.count()}]")
     print(f"[Procedural rules after consolidation: {len(agent.procedural.rules)}]")
     for i, rule in enumerate(agent.procedural.rules):
@@ -89,11 +89,10 @@ def main():
     print(f"Episodic memories:  {agent.episodic.collection.count()}")
     print(f"Procedural rules:   {len(agent.procedural.rules)}")
     print(f"Conversations held: {agent.conversation_count}")
-    print(f"Procedural file:    {os.path.exists('procedural_memory.txt')}")
+    print(f"Procedural journal: {os.path.exists('procedural_memory.txt.journal')}")
 
-    if os.path.exists("procedural_memory.txt"):
-        with open("procedural_memory.txt") as f:
-            rules = json.load(f)
+    if os.path.exists("procedural_memory.txt") or os.path.exists("procedural_memory.txt.journal"):
+        rules = ProceduralMemory().rules  # a fresh load: snapshot + journal replay
         print(f"\nPersisted rules ({len(rules)}):")
         for i, rule in enumerate(rules):
             print(f"  {i+1}. {rule}")
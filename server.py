@@ -0,0 +1,341 @@
+"""JSON-lines server for concurrent local serving of the cognitive memory agent.
+
+Each request is one JSON object per line:
+    {"id": 1, "method": "chat", "session": "alice", "params": {"message": "Hi"}}
+
+Methods: chat, chat_stream, new_conversation, ingest, snapshot, stats, metrics.
+Responses echo the id and carry either "result" or "error". chat_stream sends
+{"id": ..., "delta": "..."} lines before the final result.
+
+Run:
+    python server.py                 # real Anthropic client
+    python server.py --stub 0.2      # offline stub LLM with 200ms latency
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import signal
+import threading
+from collections import defaultdict
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import config
+from memory.tracing import tracer
+from sessions import SessionManager
+
+
+SESSION_METHODS = {"chat", "chat_stream", "new_conversation"}  # serialized per session
+
+
+class Overloaded(Exception):
+    """Raised when a request is rejected because a queue bound was hit."""
+
+
+class AgentServer:
+    """Serves many sessions concurrently with backpressure.
+
+    - Requests for the same session run one at a time, in arrival order.
+      Only SESSION_METHODS are queued per session; ingest, snapshot, stats
+      and metrics never wait behind a conversation.
+    - At most LLM_CONCURRENCY agent operations run at once (they call the LLM).
+    - At most MAX_PENDING_REQUESTS requests are queued globally, and
+      MAX_SESSION_QUEUE per session; anything beyond is rejected immediately.
+    - On shutdown, new requests are refused and in-flight ones are drained.
+    """
+
+    def __init__(
+        self,
+        sessions: SessionManager,
+        llm_concurrency: int = config.LLM_CONCURRENCY,
+        max_pending: int = config.MAX_PENDING_REQUESTS,
+        max_session_queue: int = config.MAX_SESSION_QUEUE,
+    ):
+        self.sessions = sessions
+        self.max_pending = max_pending
+        self.max_session_queue = max_session_queue
+        self._llm_slots = asyncio.Semaphore(llm_concurrency)
+        self._session_locks: dict[str, asyncio.Lock] = {}
+        self._session_depth: dict[str, int] = defaultdict(int)
+        self._ingest_lock = asyncio.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._draining = False
+        self._tasks: set[asyncio.Task] = set()
+        self._server: asyncio.AbstractServer | None = None
+        self._methods = {
+            "chat": self._chat,
+            "chat_stream": self._chat_stream,
+            "new_conversation": self._new_conversation,
+            "ingest": self._ingest,
+            "stats": self._stats,
+            "metrics": self._metrics,
+            "snapshot": self._snapshot,
+        }
+
+    async def start(self, host: str = config.SERVER_HOST, port: int = config.SERVER_PORT):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        asyncio.create_task(self._evict_idle_loop())
+        print(f"Serving on {host}:{port}")
+
+    async def shutdown(self, timeout: float = config.DRAIN_TIMEOUT_SECONDS):
+        """Stop accepting work, wait for in-flight requests, park all sessions."""
+        if self._draining:
+            return
+        self._draining = True
+        print(f"Draining {len(self._tasks)} in-flight requests...")
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=timeout)
+        await asyncio.to_thread(self.sessions.close)
+        print("Shutdown complete.")
+
+    async def _handle_connection(self, reader, writer):
+        write_lock = asyncio.Lock()
+
+        async def send(obj: dict):
+            async with write_lock:
+                writer.write((json.dumps(obj) + "\n").encode("utf-8"))
+                await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    await send({"id": None, "error": {"code": "bad_request", "message": "invalid JSON"}})
+                    continue
+                task = asyncio.create_task(self._dispatch(request, send))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request: dict, send):
+        rid = request.get("id")
+        method = self._methods.get(request.get("method"))
+        session = str(request.get("session", "default"))
+        serialized = request.get("method") in SESSION_METHODS
+        params = request.get("params") or {}
+
+        if self._draining:
+            await send({"id": rid, "error": {"code": "shutting_down", "message": "server is draining"}})
+            return
+        if method is None:
+            await send({"id": rid, "error": {"code": "unknown_method", "message": str(request.get("method"))}})
+            return
+
+        try:
+            self._admit(session if serialized else None)
+        except Overloaded as e:
+            self._rejected += 1
+            await send({"id": rid, "error": {"code": "overloaded", "message": str(e)}})
+            return
+
+        try:
+            if serialized:
+                async with self._session_locks.setdefault(session, asyncio.Lock()):
+                    await method(session, params, rid, send)
+            else:
+                await method(session, params, rid, send)
+            self._completed += 1
+        except ConnectionError:
+            pass  # the client went away mid-reply; there is no one to report to
+        except Exception as e:
+            with contextlib.suppress(ConnectionError):
+                await send({"id": rid, "error": {"code": "internal", "message": f"{type(e).__name__}: {e}"}})
+        finally:
+            self._pending -= 1
+            if serialized:
+                self._session_depth[session] -= 1
+                if not self._session_depth[session]:
+                    del self._session_depth[session]
+                    lock = self._session_locks.get(session)
+                    if lock is not None and not lock.locked():
+                        del self._session_locks[session]
+
+    def _admit(self, session: str | None):
+        """Count a request against the global bound and, if given, its session's queue."""
+        if self._pending >= self.max_pending:
+            raise Overloaded(f"{self._pending} requests pending")
+        if session is not None and self._session_depth[session] >= self.max_session_queue:
+            raise Overloaded(f"session {session} has {self._session_depth[session]} requests queued")
+        self._pending += 1
+        if session is not None:
+            self._session_depth[session] += 1
+
+    def _busy_sessions(self) -> set:
+        """Sessions with a request queued or running, or an idle pass holding their lock."""
+        return set(self._session_depth) | {s for s, lock in self._session_locks.items() if lock.locked()}
+
+    async def _agent(self, session: str):
+        # Never park a session in use to make room for this one
+        return await asyncio.to_thread(self.sessions.get, session, exclude=self._busy_sessions())
+
+    async def _chat(self, session: str, params: dict, rid, send):
+        agent = await self._agent(session)
+        if params.get("dry_run"):
+            # Prompt preview - no LLM call, so no slot needed
+            preview = await asyncio.to_thread(agent.chat, params["message"], dry_run=True)
+            await send({"id": rid, "result": preview})
+            return
+        async with self._llm_slots:
+            reply = await asyncio.to_thread(agent.chat, params["message"])
+        await send({"id": rid, "result": reply})
+
+    async def _chat_stream(self, session: str, params: dict, rid, send):
+        agent = await self._agent(session)
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        stop = threading.Event()
+
+        def produce():
+            stream = agent.chat_stream(params["message"])
+            try:
+                for delta in stream:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, delta)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                stream.close()  # ends the LLM stream if we stopped early
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        async with self._llm_slots:
+            producer = asyncio.create_task(asyncio.to_thread(produce))
+            parts = []
+            try:
+                while (item := await queue.get()) is not done:
+                    if isinstance(item, Exception):
+                        raise item
+                    parts.append(item)
+                    await send({"id": rid, "delta": item})
+            finally:
+                # If the client went away, stop generating before giving up the slot
+                stop.set()
+                await producer
+        await send({"id": rid, "result": "".join(parts)})
+
+    async def _new_conversation(self, session: str, params: dict, rid, send):
+        agent = await self._agent(session)
+        async with self._llm_slots:
+            await asyncio.to_thread(agent.new_conversation)
+        await send({"id": rid, "result": "ok"})
+
+    async def _ingest(self, session: str, params: dict, rid, send):
+        async with self._ingest_lock:
+            await asyncio.to_thread(
+                self.sessions.semantic.ingest_all, params.get("data_dir", "./data")
+            )
+        await send({"id": rid, "result": self.sessions.semantic.collection.count()})
+
+    async def _snapshot(self, session: str, params: dict, rid, send):
+        """Export every memory store to SNAPSHOT_DIR/params["name"] while serving continues."""
+        name = str(params.get("name", ""))
+        if not name or os.path.basename(name) != name or name.startswith("."):
+            await send({"id": rid, "error": {"code": "bad_request", "message": "name must be a plain file name"}})
+            return
+        os.makedirs(config.SNAPSHOT_DIR, exist_ok=True)
+        path = os.path.join(config.SNAPSHOT_DIR, name)
+        manifest = await asyncio.to_thread(self.sessions.export_snapshot, path)
+        await send({"id": rid, "result": {
+            c["name"]: c["count"] for c in manifest["collections"]
+        }})
+
+    async def _stats(self, session: str, params: dict, rid, send):
+        await send({"id": rid, "result": {
+            "pending": self._pending,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "active_sessions": self.sessions.active_count(),
+            "ingest": self.sessions.watcher.stats() if self.sessions.watcher else None,
+        }})
+
+    async def _metrics(self, session: str, params: dict, rid, send):
+        if params.get("format") == "prometheus":
+            await send({"id": rid, "result": tracer.to_prometheus()})
+        else:
+            await send({"id": rid, "result": tracer.snapshot()})
+
+    async def _evict_idle_loop(self, interval: float = 60.0):
+        while not self._draining:
+            await asyncio.sleep(interval)
+            await self._consolidate_idle()
+            await asyncio.to_thread(self.sessions.evict_idle, exclude=self._busy_sessions())
+
+    async def _consolidate_idle(self):
+        """Let each idle session fold pending turns into its rolling reflection
+        and give its scheduler a chance to run consolidation.
+
+        Runs under the session lock, so a request arriving meanwhile waits
+        for the (budget-limited) pass instead of racing it. Sessions with
+        nothing due are skipped without taking the lock or an LLM slot.
+        """
+        for session, agent in await asyncio.to_thread(self.sessions.active_agents):
+            if self._draining:
+                return
+            if session in self._session_depth or agent.scheduler is None:
+                continue
+            if not await asyncio.to_thread(self._idle_work_due, agent):
+                continue
+            lock = self._session_locks.setdefault(session, asyncio.Lock())
+            try:
+                async with lock, self._llm_slots:
+                    await asyncio.to_thread(agent.maybe_reflect, config.ROLLING_REFLECTION_IDLE_SECONDS)
+                    await asyncio.to_thread(agent.maybe_consolidate)
+            except Exception as e:
+                print(f"  Consolidation failed for {session}: {type(e).__name__}: {e}")
+            finally:
+                if session not in self._session_depth and not lock.locked():
+                    self._session_locks.pop(session, None)
+
+
+    @staticmethod
+    def _idle_work_due(agent) -> bool:
+        return (agent.reflection_due(config.ROLLING_REFLECTION_IDLE_SECONDS)
+                or agent.consolidation_due() is not None)
+
+
+async def serve(host: str, port: int, mode: str, llm=None, ingest: bool = True):
+    sessions = await asyncio.to_thread(SessionManager, mode=mode, llm=llm, ingest=ingest)
+    server = AgentServer(sessions)
+    await server.start(host, port)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    await server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--mode", default="full", choices=["full", "semantic_only"])
+    parser.add_argument("--stub", type=float, metavar="SECONDS", default=None,
+                        help="use the offline stub LLM with this mean latency")
+    args = parser.parse_args()
+
+    llm = None
+    if args.stub is not None:
+        from benchmarks.fakes import stub_gateway
+        llm = stub_gateway(latency=args.stub)
+
+    asyncio.run(serve(args.host, args.port, args.mode, llm=llm))
+
+
+if __name__ == "__main__":
+    main()
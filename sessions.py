@@ -0,0 +1,174 @@
+"""Multi-tenant session manager - many users, one process, bounded RAM."""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import config
+from agent import CognitiveAgent
+from memory.llm import LLMGateway, as_gateway
+from memory.semantic import SemanticMemory
+from memory.snapshot import export_snapshot
+from memory.storage import open_client
+from memory.watcher import IngestWatcher
+
+
+def namespace_for(user_id: str) -> str:
+    """Map an arbitrary user id to a name safe for collections and filenames."""
+    slug = re.sub(r"[^a-zA-Z0-9_-]", "_", user_id)[:40]
+    digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:8]
+    return f"{slug}_{digest}"
+
+
+class SessionManager:
+    """Holds one CognitiveAgent per user with shared clients and semantic store.
+
+    Each user gets a namespaced episodic collection and procedural rule file.
+    Working memory lives in RAM only while the session is active; the least
+    recently used sessions are parked to SESSION_DIR and restored on demand.
+    With `watch` (INGEST_WATCH_ENABLED if None) documents in ./data are
+    ingested by a background IngestWatcher instead of at startup. With
+    `ingest` False neither happens: workers.py workers leave ./data to the
+    parent process.
+    """
+
+    def __init__(
+        self,
+        mode: str = "full",
+        max_active: int = config.MAX_ACTIVE_SESSIONS,
+        db=None,
+        llm: LLMGateway = None,
+        embedding_function=None,
+        watch: bool = None,
+        ingest: bool = True,
+    ):
+        self.mode = mode
+        self.max_active = max_active
+        self.db = db or open_client()
+        self.llm = as_gateway(llm)
+        self.embedding_function = embedding_function
+        self.semantic = SemanticMemory(client=self.db, embedding_function=embedding_function)
+        self._active: OrderedDict[str, CognitiveAgent] = OrderedDict()
+        self._last_used: dict[str, float] = {}
+        self._lock = threading.RLock()
+        os.makedirs(config.SESSION_DIR, exist_ok=True)
+
+        # With the watcher, documents are ingested in the background instead of up front
+        self.watcher = None
+        if not ingest:
+            print(f"Using shared semantic memory (mode={mode})...")
+        elif config.INGEST_WATCH_ENABLED if watch is None else watch:
+            print(f"Watching ./data for documents (mode={mode})...")
+            self.watcher = IngestWatcher(self.semantic).start()
+        else:
+            print(f"Loading shared semantic memory (mode={mode})...")
+            self.semantic.ingest_all()
+
+    def get(self, user_id: str, exclude: set = None) -> CognitiveAgent:
+        """Return the agent for a user, restoring it from disk if it was evicted.
+
+        Making room parks the least recently used sessions not in `exclude`
+        (e.g. ones with a request in flight); if every other session is
+        excluded, max_active is exceeded until they finish.
+        """
+        with self._lock:
+            agent = self._active.get(user_id)
+            if agent is None:
+                agent = CognitiveAgent(
+                    mode=self.mode,
+                    user_id=namespace_for(user_id),
+                    semantic=self.semantic,
+                    db=self.db,
+                    llm=self.llm,
+                    embedding_function=self.embedding_function,
+                )
+                self._restore(user_id, agent)
+                self._active[user_id] = agent
+                excess = len(self._active) - self.max_active
+                if excess > 0:
+                    exclude = (exclude or set()) | {user_id}
+                    for oldest in [u for u in self._active if u not in exclude][:excess]:
+                        self._evict(oldest)
+            else:
+                self._active.move_to_end(user_id)
+            self._last_used[user_id] = time.time()
+            return agent
+
+    def evict_idle(
+        self, idle_seconds: float = config.SESSION_IDLE_SECONDS, exclude: set = None
+    ) -> int:
+        """Park every session that has been idle longer than idle_seconds.
+
+        Sessions in `exclude` (e.g. ones with a request in flight) are kept.
+        """
+        cutoff = time.time() - idle_seconds
+        exclude = exclude or set()
+        with self._lock:
+            idle = [
+                u for u in self._active
+                if self._last_used.get(u, 0) < cutoff and u not in exclude
+            ]
+            for user_id in idle:
+                self._evict(user_id)
+        return len(idle)
+
+    def active_agents(self) -> list[tuple[str, CognitiveAgent]]:
+        """Snapshot of the sessions currently held in RAM."""
+        with self._lock:
+            return list(self._active.items())
+
+    def export_snapshot(self, path: str) -> dict:
+        """Write every memory store to a snapshot file (see memory.snapshot)."""
+        for _, agent in self.active_agents():
+            if agent.episodic:
+                agent.episodic.flush_access()
+        return export_snapshot(path, self.db)
+
+    def close(self):
+        """Stop the ingestion watcher and park all active sessions (call on shutdown)."""
+        if self.watcher is not None:
+            self.watcher.stop()
+        with self._lock:
+            for user_id in list(self._active):
+                self._evict(user_id)
+
+    def active_count(self) -> int:
+        return len(self._active)
+
+    def _state_path(self, user_id: str) -> str:
+        return os.path.join(config.SESSION_DIR, f"{namespace_for(user_id)}.json")
+
+    def _evict(self, user_id: str):
+        """Write a session's working memory to disk and drop it from RAM."""
+        agent = self._active.pop(user_id)
+        self._last_used.pop(user_id, None)
+        if agent.episodic:  # None for semantic_only agents
+            agent.episodic.flush_access()
+        state = {
+            "user_id": user_id,
+            "conversation_count": agent.conversation_count,
+            "messages": agent.working.messages,
+            "reflection": agent.working.reflection,
+            "reflected": agent.working.reflected,
+        }
+        path = self._state_path(user_id)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def _restore(self, user_id: str, agent: CognitiveAgent):
+        """Load a parked session's working memory, if any."""
+        path = self._state_path(user_id)
+        if not os.path.exists(path):
+            return
+        with open(path, "r") as f:
+            state = json.load(f)
+        agent.conversation_count = state.get("conversation_count", 0)
+        agent.working.messages = state.get("messages", [])
+        agent.working.reflection = state.get("reflection")
+        agent.working.reflected = state.get("reflected", 0)
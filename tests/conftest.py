@@ -0,0 +1,33 @@
+"""Shared fixtures: every test runs in its own directory with offline fakes."""
+
+import os
+import sys
+
+import chromadb
+import pytest
+from chromadb.api.client import SharedSystemClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+
+import config  # noqa: E402
+from benchmarks.fakes import HashEmbeddingFunction  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run in a temporary directory, so every relative store path is isolated."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, "FLAT_INDEX_DIR", str(tmp_path / "flat_index"))
+    yield tmp_path
+    SharedSystemClient.clear_system_cache()
+
+
+@pytest.fixture
+def db(workdir):
+    return chromadb.PersistentClient(path=str(workdir / "chroma_db"))
+
+
+@pytest.fixture
+def embed():
+    return HashEmbeddingFunction()
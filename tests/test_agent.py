@@ -0,0 +1,76 @@
+"""CognitiveAgent turns with the stub gateway."""
+
+import time
+
+import pytest
+
+import config
+from benchmarks.fakes import stub_gateway
+from benchmarks.workload import build_agent
+
+
+@pytest.fixture
+def agent():
+    return build_agent(stub_gateway(latency=0.0), corpus_paragraphs=5)
+
+
+def test_failed_rolling_reflection_does_not_fail_the_turn(agent, monkeypatch):
+    reflect = agent.episodic.reflect_incremental
+    failing = True
+
+    def flaky(*args, **kwargs):
+        if failing:
+            raise RuntimeError("reflection backend down")
+        return reflect(*args, **kwargs)
+
+    monkeypatch.setattr(agent.episodic, "reflect_incremental", flaky)
+    for i in range(config.ROLLING_REFLECTION_TURNS):
+        assert agent.chat(f"question {i} about the Zeltron budget")
+        assert "".join(agent.chat_stream(f"follow-up {i}"))
+    assert agent.working.reflection is None
+    assert agent.working.unreflected_turns() >= config.ROLLING_REFLECTION_TURNS
+
+    failing = False
+    agent.chat("one more question")
+    assert agent.working.unreflected_turns() == 0
+
+
+def test_growth_consolidates_a_session_that_never_goes_idle(agent, monkeypatch):
+    monkeypatch.setattr(config, "CONSOLIDATION_MODE", "inline")
+    runs = []
+    monkeypatch.setattr(agent.scheduler, "run", runs.append)
+    agent.scheduler.state["new_episodes"] = config.SCHEDULER_MAX_NEW_EPISODES - 2
+
+    agent.chat("What does the Zeltron manual say about calibration?")
+    agent.new_conversation()
+    assert runs == []  # below the hard limit: waits for SCHEDULER_IDLE_SECONDS
+
+    agent.chat("And about the operating temperature?")
+    agent.new_conversation()
+    assert runs == ["growth"]
+
+
+def test_chat_many_keeps_order_and_isolates_forks(agent, monkeypatch):
+    opening = "What does the Zeltron manual say about calibration?"
+    agent.chat(opening)
+    before = list(agent.working.messages)
+    queries = [f"What is the Zeltron budget for site {i}?" for i in range(4)]
+
+    stub = agent.working.client.client.messages
+    create, sent = stub.create, {}
+
+    def first_query_finishes_last(**kwargs):
+        query = kwargs["messages"][-1]["content"]
+        if query in queries:
+            sent[query] = [m["content"] for m in kwargs["messages"]]
+            time.sleep(0.05 * (len(queries) - queries.index(query)))
+        return create(**kwargs)
+
+    monkeypatch.setattr(stub, "create", first_query_finishes_last)
+    replies = agent.chat_many(queries, max_workers=len(queries))
+
+    assert replies == [f"Stub answer: {query}" for query in queries]
+    assert agent.working.messages == before  # the conversation itself is unchanged
+    for query in queries:  # each fork continues the conversation with only its own query
+        assert opening in sent[query]
+        assert not set(sent[query]) & (set(queries) - {query})
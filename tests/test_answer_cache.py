@@ -0,0 +1,41 @@
+"""AnswerCache LRU bound and journal."""
+
+from memory.answer_cache import AnswerCache
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnswerCache(path="", size=2)
+    cache.put("a", "reply a")
+    cache.put("b", "reply b")
+    assert cache.get("a") == "reply a"  # b is now the oldest
+    cache.put("c", "reply c")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c"), len(cache)) == ("reply a", "reply c", 2)
+
+
+def test_journal_replays_into_a_new_cache(workdir):
+    path = str(workdir / "answers.jsonl")
+    cache = AnswerCache(path=path, size=2)
+    for key in ("a", "b", "a", "c"):
+        cache.put(key, f"reply {key}")
+    with open(path, "a") as f:
+        f.write('{"key": "d", "re')  # crash mid-append
+
+    replayed = AnswerCache(path=path, size=2)
+    assert (replayed.get("a"), replayed.get("b"), replayed.get("c")) == ("reply a", None, "reply c")
+
+
+def test_compaction_rewrites_the_shared_journal(workdir):
+    path = str(workdir / "answers.jsonl")
+    first, second = AnswerCache(path=path, size=3), AnswerCache(path=path, size=3)
+    for key in ("a", "c", "d", "e", "f"):
+        first.put(key, f"reply {key}")
+    second.put("b", "reply b")
+    first.put("g", "reply g")  # first's sixth append compacts the journal
+    with open(path) as f:
+        assert [line.split('"')[3] for line in f] == ["f", "b", "g"]
+
+    second.clear()
+    for _ in range(3):
+        first.put("h", "reply h")  # compacts again
+    assert list(AnswerCache(path=path, size=3)._entries) == ["h"]  # cleared entries stay gone
@@ -0,0 +1,42 @@
+"""Context budget allocation."""
+
+import random
+
+from memory.budget import allocate
+
+
+def _cost(costs: list[int], kept: int) -> int:
+    return sum(costs[:kept])
+
+
+def test_small_sections_pass_their_share_on():
+    sections = {"episodes": [10], "chunks": [30] * 10, "history": [30] * 10}
+    kept = allocate(250, {"episodes": 0.5, "chunks": 0.25, "history": 0.25}, sections)
+    # Episodes need 10 of their 125; the rest is split evenly between the others
+    assert kept == {"episodes": 1, "chunks": 4, "history": 4}
+
+
+def test_slack_goes_to_the_highest_weight_first():
+    sections = {"chunks": [40, 30, 30], "history": [25, 25, 25]}
+    # Shares are 60 and 40: one chunk and one turn fit, leaving 35 that either could use
+    kept = allocate(100, {"chunks": 0.6, "history": 0.4}, sections)
+    assert kept == {"chunks": 2, "history": 1}
+
+
+def test_reserved_tokens_and_unweighted_sections():
+    sections = {"rules": [5] * 4, "history": [50] * 4}
+    assert allocate(100, {"rules": 1.0}, sections, reserved=80) == {"rules": 4, "history": 0}
+    assert allocate(100, {"rules": 1.0}, sections, reserved=200) == {"rules": 0, "history": 0}
+
+
+def test_never_exceeds_the_budget():
+    rng = random.Random(7)
+    names = ["episodes", "rules", "chunks", "history"]
+    for _ in range(500):
+        sections = {name: [rng.randint(1, 400) for _ in range(rng.randint(0, 8))] for name in names}
+        weights = {name: rng.choice([0, 0.1, 0.3, 1.0]) for name in names}
+        budget, reserved = rng.randint(0, 4000), rng.randint(0, 1000)
+        kept = allocate(budget, weights, sections, reserved=reserved)
+        spent = sum(_cost(sections[name], n) for name, n in kept.items())
+        assert spent <= max(0, budget - reserved)
+        assert all(0 <= kept[name] <= len(sections[name]) for name in names)
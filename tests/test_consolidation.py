@@ -0,0 +1,20 @@
+"""Consolidation results applied to the stores."""
+
+from benchmarks.fakes import stub_gateway
+from memory.consolidation import Consolidation
+from memory.episodic import EpisodicMemory
+from memory.procedural import ProceduralMemory
+
+
+def test_apply_promotion_counts_only_new_rules(db, embed, workdir):
+    llm = stub_gateway(latency=0.0)
+    procedural = ProceduralMemory(llm=llm, path=str(workdir / "rules.txt"))
+    procedural.add_rule("Cite the manual section")
+    consolidation = Consolidation(EpisodicMemory(client=db, llm=llm, embedding_function=embed), procedural, llm=llm)
+
+    promoted = consolidation.apply_promotion(
+        ["Cite the manual section", "Answer in metric units", " Answer in metric units ", "", 7]
+    )
+    assert promoted == 1
+    assert procedural.rules == ["Cite the manual section", "Answer in metric units"]
+    assert consolidation.apply_promotion(["Answer in metric units"]) == 0
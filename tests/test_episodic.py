@@ -0,0 +1,103 @@
+"""EpisodicMemory: derived copies (embedding mirror, tag index) across handles, ids and batching, store-time dedup."""
+
+import numpy as np
+import pytest
+
+import config
+from benchmarks.fakes import stub_gateway
+from memory.episodic import EpisodicMemory
+
+
+def _episode(i: int, tags: str) -> tuple[str, str, dict]:
+    return f"ep{i}", f"Conversation {i} about the QA-7 resonators", {"context_tags": tags, "timestamp": float(i)}
+
+
+@pytest.fixture
+def open_memory(db, embed):
+    return lambda: EpisodicMemory(client=db, llm=stub_gateway(latency=0.0), embedding_function=embed)
+
+
+def _add(memory, *episodes):
+    ids, documents, metadatas = zip(*episodes)
+    memory.add(list(ids), list(documents), list(metadatas))
+
+
+def test_tag_index_follows_another_handles_same_size_write(open_memory):
+    a, b = open_memory(), open_memory()
+    _add(a, _episode(0, "hardware"), _episode(1, "pricing"))
+    assert [ep["id"] for ep in b.recall_by_tags(["hardware"])] == ["ep0"]
+
+    a.delete(["ep0"])
+    _add(a, _episode(2, "thermal"))
+    assert b.collection.count() == 2
+    assert [ep["id"] for ep in b.recall_by_tags(["thermal"])] == ["ep2"]
+    assert b.recall_by_tags(["hardware"]) == []
+
+
+def test_mirror_rebuilds_after_a_write_that_failed_midway(open_memory):
+    memory = open_memory()
+    _add(memory, _episode(0, "hardware"), _episode(1, "pricing"))
+    with pytest.raises(RuntimeError):
+        with memory._writing():  # collection written, mirror never told
+            memory.collection.delete(ids=["ep0"])
+            memory.collection.add(ids=["ep2"], documents=["Conversation 2"], metadatas=[{"context_tags": "x"}])
+            raise RuntimeError("crash")
+    assert sorted(memory.mirror.ids()) == ["ep0", "ep1"]
+
+    reopened = open_memory()
+    assert sorted(reopened.mirror.ids()) == ["ep1", "ep2"]
+    assert [ep["id"] for ep in reopened.recall_by_tags(["x"])] == ["ep2"]
+
+
+def test_store_many_splits_adds_and_never_reuses_ids(open_memory, monkeypatch):
+    memory = open_memory()
+    memory.capacity = 0
+    memory._max_batch_size = 2
+    batches = []
+    add = memory.collection.add
+    monkeypatch.setattr(memory.collection, "add", lambda **kwargs: batches.append(len(kwargs["ids"])) or add(**kwargs))
+    monkeypatch.setattr("time.time", lambda: 1700000000.0)  # every id from the same millisecond
+
+    conversations = [f"User: question {i} about the QA-7 resonators\nAssistant: answer {i}" for i in range(5)]
+    stored = memory.store_many(conversations) + memory.store_many(conversations)
+    assert batches == [2, 2, 1, 2, 2, 1]
+    assert memory.collection.count() == stored == 10
+
+
+CONVERSATION = (
+    "User: What is the operating temperature of the QA-7 resonator?\n"
+    "Assistant: The QA-7 operates at exactly 22.4 degrees Celsius, per section 3.2 of the manual.\n"
+    "User: And how much drift is acceptable?\n"
+    "Assistant: Up to 0.3 degrees of thermal drift before recalibration."
+)
+
+
+def _reflection(what_worked: str, tags: list[str]) -> dict:
+    return {"summary": "User asked about QA-7 operating temperature and drift",
+            "what_worked": what_worked, "what_to_avoid": "N/A", "context_tags": tags}
+
+
+def test_store_folds_near_duplicates_at_the_dedup_threshold(open_memory, monkeypatch):
+    first = _reflection("Quoted the manual section", ["hardware"])
+    repeat = _reflection("Quoted the manual section; gave units", ["hardware", "thermal"])
+    memory = open_memory()
+    memory.capacity = 0
+    assert memory.store(CONVERSATION, reflection=first)
+
+    documents = [memory._episode(CONVERSATION, r, 0.0)[0] for r in (first, repeat)]
+    a, b = memory.embedding_function(documents)
+    similarity = float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+    assert config.EPISODIC_DEDUP_THRESHOLD == 0.95 <= similarity < 1
+
+    (kept,) = memory.collection.get()["ids"]
+    monkeypatch.setattr(config, "EPISODIC_DEDUP_THRESHOLD", similarity + 1e-4)
+    assert memory.store(CONVERSATION, reflection=repeat)  # just below the threshold: kept apart
+    assert memory.collection.count() == 2
+
+    memory.delete([i for i in memory.collection.get()["ids"] if i != kept])
+    monkeypatch.setattr(config, "EPISODIC_DEDUP_THRESHOLD", similarity - 1e-4)
+    assert not memory.store(CONVERSATION, reflection=repeat)  # folded into the first episode
+    (metadata,) = memory.collection.get()["metadatas"]
+    assert metadata["occurrences"] == 2
+    assert metadata["what_worked"] == "Quoted the manual section; gave units"
+    assert memory.recall_by_tags(["thermal"])  # the tag index follows the fold
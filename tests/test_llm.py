@@ -0,0 +1,107 @@
+"""LLMGateway model fallback and stream accounting."""
+
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import anthropic
+import httpx
+import pytest
+
+import config
+from memory.llm import LLMGateway, task_params
+from memory.tracing import tracer
+
+
+class RetiredModelClient:
+    """Raises an API error with the given status for the `failing` models."""
+
+    def __init__(self, status: int, failing: set):
+        self.status = status
+        self.failing = failing
+        self.models = []
+        self.messages = self
+
+    def create(self, **kwargs):
+        self.models.append(kwargs["model"])
+        if kwargs["model"] in self.failing:
+            response = httpx.Response(self.status, request=httpx.Request("POST", "https://api.anthropic.com"))
+            raise anthropic.APIStatusError("model unavailable", response=response, body=None)
+        return SimpleNamespace(content=[SimpleNamespace(text='["a rule"]')], usage=None)
+
+
+@pytest.mark.parametrize("status", [400, 404])
+def test_create_json_falls_back_when_the_auxiliary_model_fails(status):
+    params = task_params("rules")
+    client = RetiredModelClient(status, failing={params["model"]})
+    llm = LLMGateway(client=client)
+    assert params["model"] != config.MODEL_NAME
+
+    assert llm.create_json("rules", **params, messages=[{"role": "user", "content": "x"}]) == ["a rule"]
+    assert client.models == [params["model"], config.MODEL_NAME]
+    assert llm.fallbacks == 1
+
+
+def test_create_json_raises_errors_from_the_main_model(monkeypatch):
+    client = RetiredModelClient(400, failing={"claude-retired"})
+    monkeypatch.setattr(config, "MODEL_NAME", "claude-retired")
+    with pytest.raises(anthropic.APIStatusError):
+        LLMGateway(client=client).create_json("rules", **task_params("rules", model="claude-retired"),
+                                              messages=[{"role": "user", "content": "x"}])
+    assert client.models == ["claude-retired"]
+
+
+def test_create_falls_back_for_auxiliary_tasks():
+    params = task_params("conflict")
+    client = RetiredModelClient(404, failing={params["model"]})
+    llm = LLMGateway(client=client)
+    assert params["model"] != config.MODEL_NAME
+
+    response = llm.create("conflict", **params, messages=[{"role": "user", "content": "x"}])
+    assert response.content[0].text == '["a rule"]'
+    assert client.models == [params["model"], config.MODEL_NAME]
+    assert llm.fallbacks == 1
+
+
+class BrokenStreamClient:
+    """A streaming client whose connection drops after one text delta."""
+
+    def __init__(self):
+        self.messages = self
+
+    @contextmanager
+    def stream(self, **kwargs):
+        snapshot = SimpleNamespace(
+            usage=SimpleNamespace(input_tokens=50, output_tokens=1),
+            content=[SimpleNamespace(type="text", text="x" * 400)],
+        )
+
+        def text_stream():
+            yield "x" * 400
+            raise httpx.ReadError("connection reset")
+
+        yield SimpleNamespace(text_stream=text_stream(), current_message_snapshot=snapshot,
+                              get_final_message=lambda: pytest.fail("the stream did not finish"))
+
+
+@pytest.mark.parametrize("stop", ["closed", "error"])
+def test_unfinished_stream_settles_its_partial_usage(stop):
+    llm = LLMGateway(client=BrokenStreamClient())
+    before = tracer.snapshot()["tokens"].get("answer_stream_test", {"calls": 0, "output_tokens": 0})
+    level = llm._tokens.level
+
+    def reply():
+        with llm.stream("answer_stream_test", max_tokens=4000, messages=[{"role": "user", "content": "x"}]) as s:
+            yield from s.text_stream
+
+    chunks = reply()
+    next(chunks)
+    if stop == "closed":
+        chunks.close()  # the client went away
+    else:
+        with pytest.raises(httpx.ReadError):
+            next(chunks)
+
+    after = tracer.snapshot()["tokens"]["answer_stream_test"]
+    assert after["calls"] == before["calls"] + 1
+    assert after["output_tokens"] == before["output_tokens"] + 100
+    assert llm._tokens.level > level - 4000  # the unused part of max_tokens was refunded
@@ -0,0 +1,38 @@
+"""Procedural rule journal recovery."""
+
+import json
+
+from memory.procedural import ProceduralMemory
+
+
+def test_torn_journal_tail_is_dropped_before_the_next_commit(workdir):
+    store = ProceduralMemory(path=str(workdir / "rules.txt"))
+    store.add_rule("Cite the manual section")
+    with open(store.journal_path, "a") as f:
+        f.write('{"ops": [{"op": "add", "ru')  # crash mid-append
+
+    store = ProceduralMemory(path=store.path)
+    assert store.rules == ["Cite the manual section"]
+    store.add_rule("Answer in metric units")
+    assert ProceduralMemory(path=store.path).rules == ["Cite the manual section", "Answer in metric units"]
+
+
+def test_journal_entries_without_ops_are_skipped(workdir):
+    store = ProceduralMemory(path=str(workdir / "rules.txt"))
+    store.add_rule("Cite the manual section")
+    with open(store.journal_path, "a") as f:
+        f.write(json.dumps({"note": "written by a newer version"}) + "\n")
+    store.add_rule("Answer in metric units")
+    assert ProceduralMemory(path=store.path).rules == ["Cite the manual section", "Answer in metric units"]
+
+
+def test_reset_removes_snapshot_and_journal(workdir, monkeypatch):
+    monkeypatch.setattr("config.PROCEDURAL_SNAPSHOT_EVERY", 2)
+    store = ProceduralMemory(path=str(workdir / "rules.txt"))
+    for rule in ("Cite the manual section", "Answer in metric units", "Quote part numbers"):
+        store.add_rule(rule)  # leaves both a snapshot and a journal entry
+
+    store.reset()
+    assert store.rules == []
+    assert not any(p.name.startswith("rules.txt") for p in workdir.iterdir())
+    assert ProceduralMemory(path=store.path).rules == []
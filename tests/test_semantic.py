@@ -0,0 +1,70 @@
+"""SemanticMemory streaming ingestion."""
+
+import pytest
+
+import config
+import memory.semantic
+from memory.answer_cache import AnswerCache
+from memory.semantic import SemanticMemory
+
+
+@pytest.fixture
+def semantic(db, embed):
+    return SemanticMemory(client=db, embedding_function=embed, answers=AnswerCache(path="", size=10))
+
+
+def _pages(word: str, n: int, fail_at: int = None):
+    for page in range(1, n + 1):
+        if page == fail_at:
+            raise OSError("truncated PDF")
+        yield f"{word} page {page}. " * 60, page
+
+
+def test_replace_pdf_streams_batches_over_the_old_chunks(semantic, workdir, monkeypatch):
+    monkeypatch.setattr(config, "INGEST_BATCH_SIZE", 4)
+    pdf = workdir / "manual.pdf"
+    pdf.write_bytes(b"%PDF")
+    monkeypatch.setattr(memory.semantic, "_pdf_pages", lambda path: _pages("old", 12))
+    old = semantic.replace_pdf(str(pdf))
+
+    batches = []
+    add = semantic.collection.add
+    monkeypatch.setattr(semantic.collection, "add", lambda **kwargs: batches.append(len(kwargs["ids"])) or add(**kwargs))
+    monkeypatch.setattr(memory.semantic, "_pdf_pages", lambda path: _pages("new", 3))
+    new = semantic.replace_pdf(str(pdf))
+
+    assert new < old and max(batches) <= 4 and sum(batches) == new
+    stored = semantic.collection.get(where={"source": "manual.pdf"})
+    assert len(stored["ids"]) == new
+    assert all(text.startswith("new") for text in stored["documents"])
+
+
+def test_replace_pdf_removes_a_partial_document(semantic, workdir, monkeypatch):
+    monkeypatch.setattr(config, "INGEST_BATCH_SIZE", 4)
+    pdf = workdir / "manual.pdf"
+    pdf.write_bytes(b"%PDF")
+    monkeypatch.setattr(memory.semantic, "_pdf_pages", lambda path: _pages("new", 12, fail_at=10))
+    with pytest.raises(OSError):
+        semantic.replace_pdf(str(pdf))
+    assert semantic.stored_signature("manual.pdf") is None  # the watcher retries it after a restart
+
+
+def test_iter_chunks_overlap_runs_across_page_boundaries(semantic, monkeypatch):
+    monkeypatch.setattr(config, "INGEST_WINDOW_CHUNKS", 2)  # many windows over the document
+    # Short pages (scanned slides, say): chunks span several, the overlap carries whole pages
+    pages = [(f"Page {page}: the QA-7 resonator runs at 22.4 degrees.", page) for page in range(1, 61)]
+    joined = "\n\n".join(text for text, _ in pages)
+    starts = [joined.index(text) for text, _ in pages]
+
+    chunks = list(semantic.iter_chunks(pages))
+    expected = semantic.splitter.create_documents([joined])
+    assert [text for text, _ in chunks] == [doc.page_content for doc in expected]
+    for (_, page), doc in zip(chunks, expected):  # a chunk's page is the page it starts on
+        assert starts[page - 1] <= doc.metadata["start_index"]
+        assert page == len(pages) or doc.metadata["start_index"] < starts[page]
+
+    spanning = [i for i, (text, _) in enumerate(chunks[:-1]) if "\n\n" in text]
+    assert spanning
+    for i in spanning:  # the next chunk starts with the last page of this one
+        assert chunks[i][0].endswith(chunks[i + 1][0].split("\n\n")[0])
+        assert chunks[i + 1][1] > chunks[i][1]
@@ -0,0 +1,84 @@
+"""AgentServer request handling: clients going away, session queues, idle work."""
+
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import HashEmbeddingFunction, stub_gateway
+from server import AgentServer
+from sessions import SessionManager
+
+
+@pytest.fixture
+def sessions(db):
+    return SessionManager(mode="semantic_only", db=db, llm=stub_gateway(latency=0.2),
+                          embedding_function=HashEmbeddingFunction(), watch=False)
+
+
+def _gone_after(deltas: int):
+    sent = []
+
+    async def send(obj: dict):
+        if len(sent) >= deltas:
+            raise ConnectionResetError("client went away")
+        sent.append(obj)
+
+    return send, sent
+
+
+def test_stream_stops_when_the_client_disconnects(sessions):
+    server = AgentServer(sessions, llm_concurrency=1)
+    send, sent = _gone_after(deltas=1)
+    message = " ".join(f"word{i}" for i in range(20))
+    request = {"id": 1, "method": "chat_stream", "session": "alice", "params": {"message": message}}
+
+    asyncio.run(asyncio.wait_for(server._dispatch(request, send), timeout=5))
+
+    history = sessions.get("alice").working.messages
+    full_reply = sessions.get("bob").chat(message)
+    assert [m["role"] for m in history] == ["user", "assistant"]
+    assert len(history[1]["content"]) < len(full_reply)
+    assert server._llm_slots._value == 1 and server._pending == 0
+
+
+def test_failed_reply_to_a_gone_client_is_not_raised(sessions):
+    server = AgentServer(sessions)
+    send, sent = _gone_after(deltas=0)
+    request = {"id": 1, "method": "chat", "session": "alice", "params": {}}  # KeyError: message
+
+    asyncio.run(server._dispatch(request, send))
+    assert server._pending == 0 and not sent
+
+
+def test_idle_pass_takes_no_llm_slot_when_nothing_is_due(db, monkeypatch):
+    sessions = SessionManager(mode="full", db=db, llm=stub_gateway(latency=0.0),
+                              embedding_function=HashEmbeddingFunction(), watch=False)
+    server = AgentServer(sessions, llm_concurrency=1)
+    agent = sessions.get("alice")
+    agent.chat("Hi")  # one turn pending, no episodes: nothing due yet
+    monkeypatch.setattr(agent, "maybe_consolidate", lambda: pytest.fail("ran while nothing was due"))
+
+    async def idle_pass_with_slots_taken():
+        async with server._llm_slots:
+            await asyncio.wait_for(server._consolidate_idle(), timeout=5)
+
+    asyncio.run(idle_pass_with_slots_taken())
+
+
+def test_stats_do_not_queue_behind_a_chat(sessions):
+    server = AgentServer(sessions)
+    replies = []
+
+    async def send(obj: dict):
+        replies.append(obj["id"])
+
+    async def chat_then_stats():
+        chat = asyncio.create_task(server._dispatch(
+            {"id": "chat", "method": "chat", "params": {"message": "Hi"}}, send))
+        await asyncio.sleep(0.05)  # the chat holds the "default" session
+        await asyncio.wait_for(server._dispatch({"id": "stats", "method": "stats"}, send), timeout=0.1)
+        await chat
+
+    asyncio.run(chat_then_stats())
+    assert replies == ["stats", "chat"]
+    assert server._pending == 0 and not server._session_depth
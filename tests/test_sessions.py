@@ -0,0 +1,43 @@
+"""SessionManager LRU bound and startup ingestion."""
+
+import pytest
+
+from benchmarks.fakes import HashEmbeddingFunction, stub_gateway
+from memory.semantic import SemanticMemory
+from sessions import SessionManager
+
+
+@pytest.fixture
+def sessions(db):
+    return SessionManager(mode="semantic_only", max_active=1, db=db, llm=stub_gateway(latency=0.0),
+                          embedding_function=HashEmbeddingFunction(), watch=False)
+
+
+def test_lru_eviction_skips_sessions_in_use(sessions):
+    alice = sessions.get("alice")
+    alice.working.add_user_message("still answering this")
+    sessions.get("bob", exclude={"alice"})
+    assert [user for user, _ in sessions.active_agents()] == ["alice", "bob"]
+    assert sessions.get("alice") is alice
+
+    sessions.get("carol")
+    assert [user for user, _ in sessions.active_agents()] == ["carol"]
+    assert sessions.get("alice").working.messages == alice.working.messages
+
+
+def test_semantic_only_sessions_park_and_restore(sessions):
+    agent = sessions.get("alice")
+    assert agent.episodic is None
+    agent.working.add_user_message("remember me")
+    assert sessions.evict_idle(idle_seconds=0) == 1
+    assert sessions.get("alice").working.messages == [{"role": "user", "content": "remember me"}]
+
+
+def test_worker_sessions_leave_ingestion_to_the_parent(db, monkeypatch):
+    def ingest_all(self):
+        raise AssertionError("a worker must not ingest ./data")
+
+    monkeypatch.setattr(SemanticMemory, "ingest_all", ingest_all)
+    manager = SessionManager(mode="semantic_only", db=db, llm=stub_gateway(latency=0.0),
+                             embedding_function=HashEmbeddingFunction(), ingest=False)
+    assert manager.watcher is None
@@ -0,0 +1,34 @@
+"""Snapshot export and import."""
+
+import os
+
+import config
+from benchmarks.fakes import stub_gateway
+from benchmarks.workload import build_agent
+from memory.procedural import ProceduralMemory
+from memory.snapshot import export_snapshot, import_snapshot, reset_state
+
+
+def test_journal_only_rule_store_round_trips(db, workdir):
+    store = ProceduralMemory(path=os.path.join(config.PROCEDURAL_DIR, "alice.txt"))
+    store.add_rule("Answer in metric units")
+    assert not os.path.exists(store.path) and os.path.exists(store.journal_path)
+
+    manifest = export_snapshot(str(workdir / "memory.zip"), client=db)
+    assert "user:alice" in manifest["procedural"]
+
+    os.remove(store.journal_path)
+    import_snapshot(str(workdir / "memory.zip"), client=db)
+    assert ProceduralMemory(path=store.path).rules == ["Answer in metric units"]
+
+
+def test_reset_state_removes_every_store(workdir):
+    agent = build_agent(stub_gateway(latency=0.0), corpus_paragraphs=5)
+    agent.chat("What does the Zeltron manual say about calibration?")
+    agent.new_conversation()
+    agent.procedural.add_rule("Cite the manual section")
+    ProceduralMemory(path=os.path.join(config.PROCEDURAL_DIR, "alice.txt")).add_rule("Answer in metric units")
+    assert os.listdir(workdir)
+
+    reset_state()
+    assert os.listdir(workdir) == []
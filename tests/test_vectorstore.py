@@ -0,0 +1,181 @@
+"""FlatCollection parity with Chroma's Collection subset, and AutoCollection promotion."""
+
+import numpy as np
+import pytest
+
+from memory.vectorstore import AutoCollection, FlatCollection, StoreMoved
+
+METADATA = {"hnsw:space": "cosine"}
+DOCUMENTS = [
+    "QA-7 operating temperature and thermal drift",
+    "Zeltron competitors WaveLogic and NovaSonic",
+    "Uppsala data center budget of fifty thousand",
+    "NATO compliance for the deployment",
+    "Harmonic programming constructs crescendo and fermata",
+]
+METADATAS = [
+    {"kind": "a", "n": 0},
+    {"kind": "b", "n": 1},
+    {"kind": "a", "n": 2},
+    {"kind": "b", "n": 3},
+    {"kind": "a", "n": 4, "extra": "x"},
+]
+IDS = [f"id{i}" for i in range(len(DOCUMENTS))]
+
+
+@pytest.fixture(params=["flat", "chroma"])
+def store(request, db, embed):
+    if request.param == "flat":
+        collection = FlatCollection("parity", METADATA, embed)
+    else:
+        collection = db.create_collection("parity", metadata=METADATA, embedding_function=embed)
+    collection.add(ids=IDS, documents=DOCUMENTS, metadatas=METADATAS)
+    return collection
+
+
+@pytest.fixture
+def both(db, embed):
+    flat = FlatCollection("parity", METADATA, embed)
+    chroma = db.create_collection("parity", metadata=METADATA, embedding_function=embed)
+    for collection in (flat, chroma):
+        collection.add(ids=IDS, documents=DOCUMENTS, metadatas=METADATAS)
+    return flat, chroma
+
+
+def by_id(result: dict) -> dict:
+    return {i: (d, m) for i, d, m in zip(result["ids"], result["documents"], result["metadatas"])}
+
+
+def test_get_by_ids_and_where_match(both):
+    flat, chroma = both
+    for kwargs in (
+        {},
+        {"ids": ["id3", "id1", "missing"]},
+        {"where": {"kind": "a"}},
+        {"where": {"kind": {"$eq": "b"}}},
+        {"where": {"$and": [{"kind": "a"}, {"n": 2}]}},
+        {"ids": ["id0", "id1", "id2"], "where": {"kind": "a"}},
+    ):
+        assert by_id(flat.get(**kwargs)) == by_id(chroma.get(**kwargs)), kwargs
+
+
+def test_get_limit_offset_pages_cover_the_store(store):
+    pages = [store.get(limit=2, offset=offset)["ids"] for offset in (0, 2, 4)]
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sorted(sum(pages, [])) == sorted(IDS)
+
+
+def test_get_embeddings_round_trip(both, embed):
+    expected = embed([DOCUMENTS[2]])[0]
+    for collection in both:
+        result = collection.get(ids=["id2"], include=["embeddings"])
+        np.testing.assert_allclose(result["embeddings"][0], expected, atol=1e-6)
+
+
+def _ranked(result: dict) -> list:
+    """Query rows as (distance, id, document, metadata), ties in id order (Chroma breaks them arbitrarily)."""
+    return [
+        sorted((round(distance, 4), id, document, metadata)
+               for distance, id, document, metadata in zip(*rows))
+        for rows in zip(result["distances"], result["ids"], result["documents"], result["metadatas"])
+    ]
+
+
+def test_query_ranking_and_distances_match(both):
+    flat, chroma = both
+    for kwargs in (
+        {"query_texts": ["thermal drift of the QA-7"], "n_results": 3},
+        {"query_texts": ["NATO compliance", "Zeltron competitors"], "n_results": 1},
+        {"query_texts": ["budget"], "n_results": 5, "ids": ["id1", "id2", "id4"]},
+        {"query_texts": ["crescendo thermal"], "n_results": 2, "where": {"kind": "a"}},
+    ):
+        a, b = flat.query(**kwargs), chroma.query(**kwargs)
+        np.testing.assert_allclose(a["distances"], b["distances"], atol=1e-4)
+        assert _ranked(a) == _ranked(b), kwargs
+
+
+def test_add_skips_existing_ids(store):
+    store.add(ids=["id0", "new"], documents=["replaced?", "a new document"],
+              metadatas=[{"kind": "c"}, {"kind": "c"}])
+    assert store.count() == len(IDS) + 1
+    assert store.get(ids=["id0"])["documents"] == [DOCUMENTS[0]]
+
+
+def test_update_merges_metadata(both):
+    for collection in both:
+        collection.update(ids=["id4", "missing"], metadatas=[{"n": 40, "new": True}, {"n": 1}])
+        collection.update(ids=["id1"], documents=["WaveLogic only"])
+    flat, chroma = both
+    assert by_id(flat.get(ids=["id4", "id1"])) == by_id(chroma.get(ids=["id4", "id1"]))
+    assert flat.get(ids=["id4"])["metadatas"][0] == {"kind": "a", "n": 40, "extra": "x", "new": True}
+    assert flat.query(query_texts=["WaveLogic only"], n_results=1)["ids"] == [["id1"]]
+
+
+def test_delete(both):
+    for collection in both:
+        collection.delete(ids=["id0", "id3", "missing"])
+    flat, chroma = both
+    assert flat.count() == chroma.count() == 3
+    assert by_id(flat.get()) == by_id(chroma.get())
+
+
+def test_flat_store_reloads_another_handles_writes(embed):
+    first = FlatCollection("shared", METADATA, embed)
+    second = FlatCollection("shared", METADATA, embed)
+    first.add(ids=["x"], documents=["hello"])
+    assert second.count() == 1
+    second.update(ids=["x"], metadatas=[{"seen": True}])
+    assert first.get(ids=["x"])["metadatas"] == [{"seen": True}]
+
+
+def test_promotion_moves_records_to_chroma(db, embed):
+    store = AutoCollection(db, "episodic_memory_x", METADATA, embed, max_items=5)
+    store.add(ids=IDS, documents=DOCUMENTS, metadatas=METADATAS)
+    assert store.backend == "flat"
+    store.add(ids=["id5", "id6"], documents=["more", "records"])
+    assert store.backend == "chroma"
+    assert store.count() == 7
+    assert AutoCollection(db, "episodic_memory_x", METADATA, embed, max_items=5).count() == 7
+
+
+def test_promotion_is_measured_after_a_deferred_block(db, embed):
+    store = AutoCollection(db, "episodic_memory_x", METADATA, embed, max_items=5)
+    store.add(ids=IDS, documents=DOCUMENTS, metadatas=METADATAS)
+    with store.promotion_deferred():  # a merge: add the result, then delete its sources
+        store.add(ids=["merged"], documents=["QA-7 thermal drift and operating temperature"])
+        store.delete(ids=["id0", "id2"])
+    assert store.backend == "flat"
+    assert store.count() == 4
+
+    with store.promotion_deferred():
+        store.add(ids=["id5", "id6"], documents=["more", "records"])
+    assert store.backend == "chroma"
+
+
+def test_second_handle_follows_promotion(db, embed):
+    a = AutoCollection(db, "episodic_memory_x", METADATA, embed, max_items=5)
+    b = AutoCollection(db, "episodic_memory_x", METADATA, embed, max_items=5)
+    stale = FlatCollection("episodic_memory_x", METADATA, embed)
+    a.add(ids=[f"a{i}" for i in range(7)], documents=[f"document {i}" for i in range(7)])
+    assert a.backend == "chroma"
+
+    assert b.count() == 7
+    assert b.backend == "chroma"
+    b.add(ids=["b1"], documents=["written by the second handle"])
+    with pytest.raises(StoreMoved):
+        stale.add(ids=["orphan"], documents=["must not land in a new flat file"])
+
+    reopened = AutoCollection(db, "episodic_memory_x", METADATA, embed, max_items=5)
+    assert reopened.backend == "chroma"
+    assert reopened.count() == 8
+    assert reopened.get(ids=["b1"])["ids"] == ["b1"]
+
+
+def test_store_recreated_flat_after_marker(db, embed):
+    a = AutoCollection(db, "episodic_memory_x", METADATA, embed, max_items=2)
+    a.add(ids=["1", "2", "3"], documents=["one", "two", "three"])
+    db.delete_collection("episodic_memory_x")
+    fresh = AutoCollection(db, "episodic_memory_x", METADATA, embed, max_items=2)
+    assert fresh.backend == "flat"
+    fresh.add(ids=["4"], documents=["four"])
+    assert FlatCollection("episodic_memory_x", METADATA, embed).count() == 1
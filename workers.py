@@ -0,0 +1,239 @@
+"""Multi-process deployment - one memory-store process and N agent workers.
+
+Processes:
+- chroma: `chroma run` owns CHROMA_PERSIST_DIR; every other process talks to
+  it over HTTP (CHROMA_MODE = "http").
+- workers: server.py AgentServer instances on WORKER_BASE_PORT + i, each with
+  its own SessionManager and LLM gateway (the LLM_* rate budget is split
+  evenly between them).
+- router (this process): accepts clients on SERVER_PORT with the same
+  JSON-lines protocol and forwards each request to the worker that owns its
+  session (stable hash). A session's working memory and rule file therefore
+  only ever have one writer; rule journals and embedding mirrors are also
+  file-locked for anything that still crosses processes. stats and metrics
+  describe the worker that owns the given session. With
+  INGEST_WATCH_ENABLED this process also runs the ingestion watcher; its
+  commits are only atomic for readers in the same process, so workers may
+  briefly see a batch half-applied.
+
+Run:
+    python workers.py --workers 4                   # real Anthropic client
+    python workers.py --workers 4 --stub 0.2        # offline stub LLM
+    python workers.py --chroma-external             # use an already running Chroma server
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import time
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import chromadb
+
+import config
+
+
+def worker_for(session: str, n_workers: int) -> int:
+    """Index of the worker that owns a session."""
+    return int(hashlib.sha1(session.encode("utf-8")).hexdigest(), 16) % n_workers
+
+
+class Router:
+    """Forwards JSON-lines requests to per-session workers and relays the replies."""
+
+    def __init__(self, worker_ports: list[int], worker_host: str = config.SERVER_HOST):
+        self.worker_ports = worker_ports
+        self.worker_host = worker_host
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self, host: str = config.SERVER_HOST, port: int = config.SERVER_PORT):
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        print(f"Routing {host}:{port} -> {len(self.worker_ports)} workers")
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle_connection(self, reader, writer):
+        write_lock = asyncio.Lock()
+        upstreams: dict[int, asyncio.StreamWriter] = {}
+        pumps: list[asyncio.Task] = []
+        outstanding: dict[int, int] = {}  # replies still owed, per worker
+        idle = asyncio.Event()
+        idle.set()
+
+        async def send(line: bytes):
+            async with write_lock:
+                writer.write(line)
+                await writer.drain()
+
+        def settle(worker: int, replies: int):
+            outstanding[worker] -= replies
+            if not any(outstanding.values()):
+                idle.set()
+
+        async def pump(worker: int, upstream_reader):
+            while line := await upstream_reader.readline():
+                await send(line)
+                if "delta" not in json.loads(line):
+                    settle(worker, 1)
+            settle(worker, outstanding[worker])  # worker went away - nothing more is coming
+
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    error = {"id": None, "error": {"code": "bad_request", "message": "invalid JSON"}}
+                    await send((json.dumps(error) + "\n").encode("utf-8"))
+                    continue
+                worker = worker_for(str(request.get("session", "default")), len(self.worker_ports))
+                if worker not in upstreams:
+                    try:
+                        upstream_reader, upstreams[worker] = await asyncio.open_connection(
+                            self.worker_host, self.worker_ports[worker]
+                        )
+                    except OSError as e:
+                        error = {"id": request.get("id"), "error": {"code": "unavailable", "message": str(e)}}
+                        await send((json.dumps(error) + "\n").encode("utf-8"))
+                        continue
+                    outstanding[worker] = 0
+                    pumps.append(asyncio.create_task(pump(worker, upstream_reader)))
+                outstanding[worker] += 1
+                idle.clear()
+                upstreams[worker].write(line)
+                await upstreams[worker].drain()
+            # Client finished sending - wait for the replies it is still owed
+            await idle.wait()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for upstream in upstreams.values():
+                upstream.close()
+            for task in pumps:
+                task.cancel()
+            writer.close()
+
+
+def start_chroma(log_path: str = "chroma_server.log") -> subprocess.Popen:
+    """Launch the memory-store process and wait until it answers heartbeats."""
+    with open(log_path, "a") as log:
+        process = subprocess.Popen([
+            "chroma", "run",
+            "--path", config.CHROMA_PERSIST_DIR,
+            "--host", config.CHROMA_HOST,
+            "--port", str(config.CHROMA_PORT),
+        ], stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            chromadb.HttpClient(host=config.CHROMA_HOST, port=config.CHROMA_PORT).heartbeat()
+            return process
+        except Exception:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.terminate()
+                raise RuntimeError("Chroma server did not start")
+            time.sleep(0.5)
+
+
+def wait_for_port(host: str, port: int, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def run_worker(port: int, mode: str, n_workers: int, stub: float = None):
+    """Worker process entry point: an AgentServer backed by the shared Chroma server."""
+    config.CHROMA_MODE = "http"
+    config.LLM_REQUESTS_PER_MINUTE /= n_workers
+    config.LLM_TOKENS_PER_MINUTE /= n_workers
+
+    from server import serve
+
+    llm = None
+    if stub is not None:
+        from benchmarks.fakes import stub_gateway
+        llm = stub_gateway(latency=stub)
+    # The parent process ingests (or watches) ./data once for every worker
+    asyncio.run(serve(config.SERVER_HOST, port, mode, llm=llm, ingest=False))
+
+
+async def route(router: Router, host: str, port: int):
+    await router.start(host, port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    await router.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=config.WORKER_COUNT)
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--mode", default="full", choices=["full", "semantic_only"])
+    parser.add_argument("--stub", type=float, metavar="SECONDS", default=None,
+                        help="use the offline stub LLM with this mean latency")
+    parser.add_argument("--chroma-external", action="store_true",
+                        help="connect to a Chroma server at CHROMA_HOST:CHROMA_PORT instead of starting one")
+    args = parser.parse_args()
+
+    config.CHROMA_MODE = "http"
+    os.environ["CHROMA_MODE"] = "http"
+    chroma = None if args.chroma_external else start_chroma()
+
+    # Ingest shared documents once (or watch for them), so workers do not race on it
+    from memory.semantic import SemanticMemory
+    from memory.watcher import IngestWatcher
+    watcher = None
+    if config.INGEST_WATCH_ENABLED:
+        watcher = IngestWatcher(SemanticMemory()).start()
+    else:
+        SemanticMemory().ingest_all()
+
+    ports = [config.WORKER_BASE_PORT + i for i in range(args.workers)]
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=run_worker, args=(port, args.mode, args.workers, args.stub))
+        for port in ports
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        for port in ports:
+            wait_for_port(config.SERVER_HOST, port)
+        asyncio.run(route(Router(ports), args.host, args.port))
+    finally:
+        # Workers drain in-flight requests on SIGTERM (see server.serve)
+        for worker in workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGTERM)
+        if watcher is not None:
+            watcher.stop()
+        for worker in workers:
+            worker.join(config.DRAIN_TIMEOUT_SECONDS + 5)
+        if chroma is not None:
+            chroma.terminate()
+            chroma.wait()
+        print("All processes stopped.")
+
+
+if __name__ == "__main__":
+    main()